@@ -7,6 +7,9 @@ from routers.clip import router as clip_router
 from routers.cleanup import router as cleanup_router
 from routers.analyze import router as analyze_router
 from routers.full_flow import router as full_flow_router
+from routers.metrics import router as metrics_router
+from routers.jobs import router as jobs_router
+from services.stage_executor import stages
 
 import logging
 import coloredlogs
@@ -22,6 +25,20 @@ app.include_router(clip_router, prefix="/clip", tags=["clip"])
 app.include_router(cleanup_router, prefix="/cleanup", tags=["cleanup"])
 app.include_router(analyze_router, prefix="/analyze", tags=["analyze"])
 app.include_router(full_flow_router, prefix="/full_flow", tags=["full_flow"])
+app.include_router(metrics_router, prefix="/metrics", tags=["metrics"])
+app.include_router(jobs_router, prefix="/jobs", tags=["jobs"])
+
+
+@app.get("/health", tags=["health"])
+async def health():
+    # Stage work runs off the event loop, so this answers even while every stage is busy
+    return {"status": "ok"}
+
+
+@app.on_event("shutdown")
+def shutdown_stages():
+    for stage in stages.values():
+        stage.shutdown()
  
 # Mount central storage for media files (downloads, clips, transcripts, etc.)
 from fastapi.staticfiles import StaticFiles
@@ -0,0 +1,90 @@
+"""
+Benchmark the blurred-background 9:16 layout in frames per second.
+
+Compares the original graph from create_9_16_with_blur_ffmpeg (gblur on a
+full 1080x1920 frame) with the current one (blur a 1/8-size copy, scale it
+back up). Only the filter graph is timed (output to the null muxer), then
+both are timed again with the final libx264 encode.
+
+Usage (from clipped-backend/):
+    python -m benchmarks.bench_blur_layout [--source VIDEO] [--duration 10] [--threads 4]
+
+Without --source a synthetic 1080p source of --duration seconds is generated.
+Requires ffmpeg on PATH.
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.clip_service import _encode_args, layout_filter
+
+LEGACY_GRAPH = (
+    "split[bg][fg];"
+    "[bg]scale=1080:1920:force_original_aspect_ratio=increase,crop=1080:1920,gblur=sigma=20[bgb];"
+    "[fg]scale=1080:1920:force_original_aspect_ratio=decrease[fgs];"
+    "[bgb][fgs]overlay=(W-w)/2:(H-h)/2"
+)
+
+
+def make_source(path: Path, duration: float) -> None:
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size=1920x1080:rate=30:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", str(path)
+    ], check=True)
+
+
+def count_frames(source: Path) -> int:
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", str(source), "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"],
+        check=True, capture_output=True, text=True,
+    )
+    return sum(1 for line in result.stdout.splitlines() if line and not line.startswith("#"))
+
+
+def fps(source: Path, graph: str, threads: int, frames: int, output: list[str]) -> float:
+    cmd = [
+        "ffmpeg", "-v", "error", "-y",
+        "-filter_threads", str(threads), "-threads", str(threads),
+        "-i", str(source), "-an", "-vf", graph,
+    ] + output
+    started = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    return frames / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", type=Path)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source = args.source
+        if source is None:
+            source = tmp / "source.mp4"
+            print(f"Generating {args.duration:.0f}s synthetic 1080p source...")
+            make_source(source, args.duration)
+        frames = count_frames(source)
+
+        encode = [arg for arg in _encode_args(args.threads) if arg not in ("-c:a", "aac", "-b:a", "128k", "-ar", "44100")]
+        outputs = {
+            "filter only": ["-f", "null", "-"],
+            "with encode": encode + [str(tmp / "out.mp4")],
+        }
+        print(f"{'':>14}{'legacy fps':>12}{'current fps':>13}{'speedup':>10}")
+        for name, output in outputs.items():
+            legacy = fps(source, LEGACY_GRAPH, args.threads, frames, output)
+            current = fps(source, layout_filter("blur"), args.threads, frames, output)
+            print(f"{name:>14}{legacy:>12.1f}{current:>13.1f}{current / legacy:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark clip extraction time against the clip's position in the source.
+
+Compares the previous output-side seek (`-i SRC -ss START -to END`, which
+decodes everything before the cut) with the current input-side seek plus
+exact output trim. With input seeking, clip time should stay roughly flat
+wherever the clip sits.
+
+Usage (from clipped-backend/):
+    python -m benchmarks.bench_clip_seek [--source VIDEO] [--duration 600] [--clip-length 15]
+
+Without --source a synthetic 720p source of --duration seconds is generated.
+Requires ffmpeg on PATH.
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.clip_service import build_clip_command
+from services.probe_service import get_duration
+
+
+def make_source(path: Path, duration: float) -> None:
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=25:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "250",
+        "-c:a", "aac", "-shortest", str(path)
+    ], check=True)
+
+
+def legacy_command(source: Path, start: float, end: float, output: Path) -> list[str]:
+    cmd = build_clip_command(str(source), start, end, output)
+    # Same encode settings, old argument order: decode from 0, seek on the output side
+    encode_args = cmd[cmd.index("-vf"):]
+    return ["ffmpeg", "-y", "-threads", cmd[3], "-i", str(source), "-ss", str(start), "-to", str(end)] + encode_args
+
+
+def timed(cmd: list[str]) -> float:
+    started = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", type=Path)
+    parser.add_argument("--duration", type=float, default=600.0)
+    parser.add_argument("--clip-length", type=float, default=15.0)
+    parser.add_argument("--positions", default="0.05,0.25,0.5,0.9")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source = args.source
+        if source is None:
+            source = tmp / "source.mp4"
+            print(f"Generating {args.duration:.0f}s synthetic source...")
+            make_source(source, args.duration)
+        duration = get_duration(source) or args.duration
+
+        print(f"{'position':>10}{'start (s)':>12}{'output seek':>14}{'input seek':>13}{'speedup':>10}")
+        for fraction in (float(p) for p in args.positions.split(",")):
+            start = min(duration * fraction, duration - args.clip_length)
+            end = start + args.clip_length
+            legacy = timed(legacy_command(source, start, end, tmp / "legacy.mp4"))
+            current = timed(build_clip_command(str(source), start, end, tmp / "current.mp4"))
+            print(f"{fraction:>10.0%}{start:>12.1f}{legacy:>13.2f}s{current:>12.2f}s{legacy / current:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark the local LLM pre-filter: tokens saved versus moments recovered.
+
+Usage (from clipped-backend/):
+    python -m benchmarks.bench_prefilter [SAMPLES_DIR] [--ratios 1,0.5,0.25]
+
+SAMPLES_DIR holds `<name>_transcript.txt` files, each optionally paired with a
+`<name>_moments.json` analysis result ({"viral_moments": [...]}) from a full,
+unfiltered run that serves as ground truth. Without SAMPLES_DIR a synthetic
+three-hour transcript with planted moments is used.
+"""
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from config import settings
+from services.analyze_service import parse_transcript_text
+from services.timeutil import parse_time
+from services.prefilter_service import estimate_tokens, prefilter_transcript, select_regions
+from services.segment_index import SegmentIndex
+
+FILLER = ["so", "and then", "we went", "to the", "store", "okay", "right", "you know", "anyway"]
+PUNCH = ["no way!", "[laughter]", "hahaha", "get out of here!", "he actually did it!", "[crowd laughs]"]
+
+
+def synthetic_sample(duration: float = 3 * 3600, n_moments: int = 20, seed: int = 7) -> tuple[str, list[dict]]:
+    rng = random.Random(seed)
+    moments = []
+    for start in sorted(rng.sample(range(120, int(duration) - 120, 300), n_moments)):
+        moments.append({"time_start": str(start), "time_end": str(start + rng.randint(20, 60))})
+    hot = [(parse_time(m["time_start"]), parse_time(m["time_end"])) for m in moments]
+
+    lines = ["Video: synthetic.mp4\n", "URL: synthetic\n\n", "{\n"]
+    t = 0.0
+    while t < duration:
+        in_moment = any(s <= t <= e for s, e in hot)
+        if in_moment:
+            words = rng.sample(FILLER, 5) + rng.sample(PUNCH, 2)
+        elif rng.random() < 0.3:
+            words = ["[music]"]
+        else:
+            words = rng.sample(FILLER, 3)
+        lines.append(f'  "{t:.2f}": "{" ".join(words)}",\n')
+        t += rng.uniform(2.0, 5.0)
+    lines.append("}\n")
+    return "".join(lines), moments
+
+
+def load_samples(samples_dir: Path) -> list[tuple[str, str, SegmentIndex, list[dict]]]:
+    samples = []
+    for transcript in sorted(samples_dir.glob("*_transcript.txt")):
+        name = transcript.name[:-len("_transcript.txt")]
+        moments_file = samples_dir / f"{name}_moments.json"
+        moments = json.loads(moments_file.read_text())["viral_moments"] if moments_file.exists() else []
+        text = transcript.read_text(encoding="utf-8")
+        samples.append((name, text, SegmentIndex(parse_transcript_text(text)), moments))
+    return samples
+
+
+def recovered(moments: list[dict], regions: list[tuple[float, float]], min_overlap: float = 0.8) -> int:
+    """Count moments with at least min_overlap of their span inside kept regions."""
+    count = 0
+    for m in moments:
+        start, end = parse_time(m["time_start"]), parse_time(m["time_end"])
+        if end <= start:
+            continue
+        covered = sum(max(0.0, min(end, e) - max(start, s)) for s, e in regions)
+        count += covered / (end - start) >= min_overlap
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("samples_dir", nargs="?", type=Path)
+    parser.add_argument("--ratios", default="1,0.75,0.5,0.35,0.25")
+    args = parser.parse_args()
+
+    if args.samples_dir:
+        samples = load_samples(args.samples_dir)
+    else:
+        text, moments = synthetic_sample()
+        index = SegmentIndex(parse_transcript_text(text))
+        samples = [("synthetic", text, index, moments)]
+
+    # Benchmark every transcript regardless of its length
+    settings.prefilter_min_chars = 0
+    print(f"{'sample':<24}{'keep':>6}{'tokens':>10}{'sent':>10}{'saved':>8}{'recall':>10}")
+    for name, text, index, moments in samples:
+        full_tokens = estimate_tokens(text)
+        for ratio in (float(r) for r in args.ratios.split(",")):
+            reduced = prefilter_transcript(text, index, keep_ratio=ratio)
+            regions = [(0.0, index.duration)] if reduced is text else select_regions(
+                index, ratio, settings.prefilter_window_seconds, settings.prefilter_context_seconds
+            )
+            sent = estimate_tokens(reduced)
+            recall = f"{recovered(moments, regions)}/{len(moments)}" if moments else "n/a"
+            print(f"{name[:23]:<24}{ratio:>6.2f}{full_tokens:>10}{sent:>10}{1 - sent / full_tokens:>8.0%}{recall:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,69 @@ class Settings(BaseSettings):
 
     cerebras_api_key: str | None = None
 
+    # Local pre-filter ahead of the LLM: share of transcript windows sent
+    # (1.0 sends everything; lower trades moment recall for fewer tokens)
+    prefilter_keep_ratio: float = Field(0.5, env="PREFILTER_KEEP_RATIO")
+    prefilter_min_chars: int = Field(16000, env="PREFILTER_MIN_CHARS")
+    prefilter_window_seconds: float = Field(30.0, env="PREFILTER_WINDOW_SECONDS")
+    prefilter_context_seconds: float = Field(15.0, env="PREFILTER_CONTEXT_SECONDS")
+    prefilter_use_audio: bool = Field(True, env="PREFILTER_USE_AUDIO")
+
+    # Process-wide LLM token budget (provider tokens-per-minute quota)
+    llm_tokens_per_minute: int = Field(60000, env="LLM_TOKENS_PER_MINUTE")
+    llm_completion_token_estimate: int = Field(2000, env="LLM_COMPLETION_TOKEN_ESTIMATE")
+    llm_batch_max_wait_seconds: float = Field(120.0, env="LLM_BATCH_MAX_WAIT_SECONDS")
+    llm_max_retries: int = Field(3, env="LLM_MAX_RETRIES")
+
+    # Moment post-processing before clipping
+    moment_merge_iou: float = Field(0.5, env="MOMENT_MERGE_IOU")
+    moment_merge_gap_seconds: float = Field(1.0, env="MOMENT_MERGE_GAP_SECONDS")
+    moment_max_seconds: float = Field(150.0, env="MOMENT_MAX_SECONDS")
+    max_clips_per_video: int = Field(12, env="MAX_CLIPS_PER_VIDEO")
+    # Dead air (silence, untranscribed noise) trimmed from moment edges, see DeadAirTrimmer
+    trim_dead_air: bool = Field(True, env="TRIM_DEAD_AIR")
+    trim_max_seconds: float = Field(5.0, env="TRIM_MAX_SECONDS")
+    trim_min_seconds: float = Field(0.5, env="TRIM_MIN_SECONDS")
+    trim_pad_seconds: float = Field(0.25, env="TRIM_PAD_SECONDS")
+
+    # Process-wide ffmpeg encode budget (defaults: all cores, budget // 2 encodes)
+    encode_core_budget: int | None = Field(None, env="ENCODE_CORE_BUDGET")
+    encode_max_concurrent: int | None = Field(None, env="ENCODE_MAX_CONCURRENT")
+    encode_max_queued: int = Field(64, env="ENCODE_MAX_QUEUED")
+    # Encodes are killed past this wall time, or when their output stops advancing this long
+    encode_timeout_seconds: float | None = Field(1800.0, env="ENCODE_TIMEOUT_SECONDS")
+    encode_stall_seconds: float | None = Field(120.0, env="ENCODE_STALL_SECONDS")
+    # Worker threads per API stage; past stage_max_queued waiting calls a stage answers 429
+    stage_download_workers: int = Field(4, env="STAGE_DOWNLOAD_WORKERS")
+    stage_transcribe_workers: int = Field(1, env="STAGE_TRANSCRIBE_WORKERS")
+    stage_analyze_workers: int = Field(8, env="STAGE_ANALYZE_WORKERS")
+    stage_clip_workers: int = Field(4, env="STAGE_CLIP_WORKERS")
+    stage_render_workers: int = Field(8, env="STAGE_RENDER_WORKERS")
+    stage_media_workers: int = Field(2, env="STAGE_MEDIA_WORKERS")
+    stage_max_queued: int = Field(16, env="STAGE_MAX_QUEUED")
+    # Full-flow cleanups keep source downloads this long, so drafts can still be finalized
+    download_ttl_seconds: float = Field(6 * 3600.0, env="DOWNLOAD_TTL_SECONDS")
+    # A failed job's manifest can be resumed (same job_id) this long; completed jobs drop theirs at once
+    job_manifest_ttl_seconds: float = Field(24 * 3600.0, env="JOB_MANIFEST_TTL_SECONDS")
+    # Clips closer than this share one decode of the source (single-pass render)
+    single_pass_max_gap_seconds: float = Field(60.0, env="SINGLE_PASS_MAX_GAP_SECONDS")
+    # Stream-copy the GOP interior of source-layout clips, re-encoding only the edges
+    smart_render: bool = Field(True, env="SMART_RENDER")
+    smart_render_min_copy_seconds: float = Field(2.0, env="SMART_RENDER_MIN_COPY_SECONDS")
+    # Cover thumbnail and scrub sprite per clip, cut in one pass per source after clipping
+    clip_previews: bool = Field(True, env="CLIP_PREVIEWS")
+    # Rendered clips are cached by content; least recently used ones are evicted, with their
+    # render records, previews and probe sidecars, once all of them together pass this size
+    clip_cache_max_bytes: int = Field(20 * 1024 ** 3, env="CLIP_CACHE_MAX_BYTES")
+    # Clips get a single-pass gain towards this EBU R128 loudness, measured once per source
+    loudness_normalize: bool = Field(True, env="LOUDNESS_NORMALIZE")
+    loudness_target_lufs: float = Field(-14.0, env="LOUDNESS_TARGET_LUFS")
+    loudness_max_gain_db: float = Field(12.0, env="LOUDNESS_MAX_GAIN_DB")
+    loudness_peak_ceiling_db: float = Field(-1.0, env="LOUDNESS_PEAK_CEILING_DB")
+    # The "crop" layout pans a 9:16 window along a subject path from a low-res pass at this rate
+    crop_analysis_fps: float = Field(4.0, env="CROP_ANALYSIS_FPS")
+    crop_smoothing_seconds: float = Field(1.0, env="CROP_SMOOTHING_SECONDS")
+
     model_config = SettingsConfigDict(
         # Load variables from .env.local then .env
         env_file=[
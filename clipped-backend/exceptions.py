@@ -2,6 +2,8 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from schemas.error import ErrorResponse
+from services.encode_scheduler import EncodeQueueFull
+from services.stage_executor import StageBusy, stages
 
 
 def register_exception_handlers(app: FastAPI):
@@ -16,6 +18,17 @@ def register_exception_handlers(app: FastAPI):
         )
         return JSONResponse(status_code=exc.status_code, content=payload.dict())
 
+    @app.exception_handler(StageBusy)
+    async def stage_busy_handler(request: Request, exc: StageBusy):
+        payload = ErrorResponse(status_code=429, error=str(exc))
+        headers = {"Retry-After": str(stages[exc.stage].retry_after())}
+        return JSONResponse(status_code=429, content=payload.dict(), headers=headers)
+
+    @app.exception_handler(EncodeQueueFull)
+    async def encode_queue_full_handler(request: Request, exc: EncodeQueueFull):
+        payload = ErrorResponse(status_code=503, error=str(exc))
+        return JSONResponse(status_code=503, content=payload.dict())
+
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(request: Request, exc: RequestValidationError):
         # Combine all validation errors into a single detail string
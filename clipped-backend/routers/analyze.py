@@ -1,10 +1,11 @@
 from fastapi import APIRouter, HTTPException
 from schemas.analyze import AnalyzeRequest, AnalyzeResponse
 from services.analyze_service import analyze_transcript
+from services.stage_executor import stages
 
 router = APIRouter()
 
 @router.post("/", response_model=AnalyzeResponse)
 async def analyze_endpoint(req: AnalyzeRequest):
-    moments = analyze_transcript(req.transcript)
-    return AnalyzeResponse(moments=moments)
+    result = await stages["analyze"].run(analyze_transcript, req.transcript, priority=req.priority)
+    return AnalyzeResponse(moments=result['viral_moments'])
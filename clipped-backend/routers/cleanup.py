@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Query
 from schemas.cleanup import CleanupResponse
 from services.cleanup_service import cleanup
+from services.stage_executor import stages
 
 router = APIRouter()
 
 @router.post("/", response_model=CleanupResponse)
 async def cleanup_endpoint(remove_clips: bool = Query(True, description="Remove all clips after processing")):
-    cleanup(include_clips=remove_clips)
+    # On the cleanup stage, so it never runs alongside full_flow's background cleanups
+    await stages["cleanup"].enqueue(cleanup, include_clips=remove_clips)
     return CleanupResponse(message="Cleanup complete")
@@ -1,16 +1,84 @@
-from fastapi import APIRouter, HTTPException
-from schemas.clip import ClipRequest, ClipResponse
-from services.clip_service import clip_moments
+from fastapi import APIRouter, HTTPException, Request
+from schemas.clip import ClipRequest, ClipResponse, CompileRequest, CompileResponse, FinalizeRequest
+from services.encode_scheduler import EncodeQueueFull
+from services.clip_service import clip_moments, clip_renditions, compile_reel, finalize_clips, generate_previews
+from services.job_registry import JobCancelled
+from services.stage_executor import StageBusy, stages
+from routers.jobs import tracked_job
 from config import settings
 from pathlib import Path
 
+import uuid
+
 router = APIRouter()
 
+def _clip_with_previews(req: ClipRequest, job_id: str) -> ClipResponse:
+    """Render the clips, then their previews, within one clip-stage slot."""
+    # Generate clips based on provided moments
+    moments = [moment.dict() for moment in req.moments]
+    renditions = None
+    if req.layouts:
+        renditions = clip_renditions(req.video_path, moments, req.layouts, profile=req.profile, job_id=job_id)
+        clip_paths = [path for paths in renditions.values() for path in paths]
+    else:
+        clip_paths = clip_moments(req.video_path, moments, layout=req.layout, profile=req.profile, job_id=job_id)
+    previews = generate_previews(clip_paths, job_id=job_id)
+    return ClipResponse(clip_paths=clip_paths, renditions=renditions, previews=previews, job_id=job_id)
+
 @router.post("/", response_model=ClipResponse)
-async def clip_endpoint(req: ClipRequest):
+async def clip_endpoint(req: ClipRequest, request: Request):
+    job_id = req.job_id or uuid.uuid4().hex
+    try:
+        async with tracked_job(request, job_id):
+            # Encode on the clip stage so the event loop (and the disconnect watcher) keeps running
+            return await stages["clip"].run(_clip_with_previews, req, job_id)
+    except (HTTPException, StageBusy, EncodeQueueFull):
+        raise
+    except JobCancelled as e:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} cancelled: {e.reason}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _finalize_with_previews(req: FinalizeRequest, job_id: str) -> ClipResponse:
+    clip_paths = finalize_clips(req.clip_paths, profile=req.profile, priority=req.priority, job_id=job_id)
+    previews = generate_previews(clip_paths, priority=req.priority, job_id=job_id)
+    return ClipResponse(clip_paths=clip_paths, previews=previews, job_id=job_id)
+
+@router.post("/finalize", response_model=ClipResponse)
+async def finalize_endpoint(req: FinalizeRequest, request: Request):
+    """Re-render accepted clips (e.g. full_flow drafts) with a publishable profile."""
+    job_id = req.job_id or uuid.uuid4().hex
+    try:
+        async with tracked_job(request, job_id):
+            return await stages["clip"].run(_finalize_with_previews, req, job_id)
+    except (HTTPException, StageBusy, EncodeQueueFull):
+        raise
+    except JobCancelled as e:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} cancelled: {e.reason}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/compile", response_model=CompileResponse)
+async def compile_endpoint(req: CompileRequest, request: Request):
+    """Join clips into one reel by stream copy; only the optional transitions are encoded."""
+    job_id = req.job_id or uuid.uuid4().hex
     try:
-        # Generate clips based on provided moments
-        clip_paths = clip_moments(req.video_path, req.moments)
-        return ClipResponse(clip_paths=clip_paths)
+        async with tracked_job(request, job_id):
+            reel_path = await stages["clip"].run(
+                compile_reel, req.clip_paths, transition=req.transition, priority=req.priority, job_id=job_id
+            )
+            return CompileResponse(reel_path=reel_path, job_id=job_id)
+    except (HTTPException, StageBusy, EncodeQueueFull):
+        raise
+    except JobCancelled as e:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} cancelled: {e.reason}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from schemas.download import DownloadRequest, DownloadResponse
 from services.download_service import download as download_video
+from services.stage_executor import StageBusy, stages
 
 router = APIRouter()
 
@@ -8,11 +9,11 @@ router = APIRouter()
 async def download_endpoint(req: DownloadRequest):
     try:
         # Convert HttpUrl to string for the download service
-        video_path = download_video(str(req.url))
+        video_path, _ = await stages["download"].run(download_video, str(req.url))
         if not video_path:
             raise HTTPException(status_code=500, detail="Video download failed")
         return DownloadResponse(video_path=str(video_path))
-    except HTTPException:
+    except (HTTPException, StageBusy):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,132 +1,360 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from schemas.full_flow import FullFlowRequest, FullFlowResponse
 from services.download_service import download as download_video, get_transcript_path
-from services.transcribe_service import create_transcript
-from services.analyze_service import analyze_transcript
-from services.clip_service import clip_moments
+from services.transcribe_service import WHISPER_MODEL, create_transcript
+from services.analyze_service import analysis_fingerprint, iter_viral_moments
+from services.clip_service import clip_moment_stream, generate_previews, is_cached
+from services import clip_cache
+from services.clip_cache import render_settings
+from services.encode_scheduler import EncodeQueueFull
 from services.cleanup_service import cleanup
+from services.audio_service import get_energy_envelope, get_loudness
+from services.job_registry import Job, JobCancelled
+from services.manifest_service import JobManifest, content_hash
+from services.stage_executor import StageBusy, stages
+from routers.jobs import ensure_not_running, tracked_job
 from config import settings
 
 import asyncio
+import json
 import logging
-from concurrent.futures import ThreadPoolExecutor
-from functools import partial
+import queue
+import threading
+import uuid
 from pathlib import Path
 
 router = APIRouter()
 
-@router.post("/", response_model=FullFlowResponse)
-async def full_flow_endpoint(req: FullFlowRequest, clean: bool = Query(True, description="Remove temporary files after processing")):
+def _warm_up(analysis, video_path: str) -> None:
+    """Start a source analysis clipping will need; skipped when the media stage is full (clips compute it then)."""
+    try:
+        stages["media"].submit(analysis, video_path)
+    except StageBusy:
+        logging.info(f"Media stage busy, {analysis.__name__} of {video_path} left to the clips")
+
+class _MomentFeed:
+    """Moments handed from the analysis (on the analyze stage) to the clipping (on the clip stage)."""
+    _END = object()
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        # Set once the clipping takes no more moments, so the analysis can stop early
+        self.closed = threading.Event()
+
+    def put(self, moment: dict) -> None:
+        self._queue.put(moment)
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self._queue.put(self._END if error is None else error)
+
+    def close(self) -> None:
+        self.closed.set()
+
+    def __iter__(self):
+        while (item := self._queue.get()) is not self._END:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+def _timed_moments(job: Job, moments):
+    """Pass moments through, opening the clip stage at the first one."""
+    for moment in moments:
+        if "first_moment" not in job.milestones:
+            job.milestone("first_moment")
+            job.begin_stage("clip")
+        job.notify({"event": "moment", "time_start": moment.get("time_start"),
+                    "time_end": moment.get("time_end"), "description": moment.get("description")})
+        yield moment
+
+def _checkpointed_moments(manifest: JobManifest, inputs: dict, moments):
+    """Pass moments through; once the analysis has run to the end, checkpoint them all."""
+    analyzed = []
+    for moment in moments:
+        analyzed.append(moment)
+        yield moment
+    moments_path = manifest.write_json("analyze", inputs, analyzed)
+    manifest.record("analyze", inputs, {"moments": str(moments_path)}, [moments_path])
+
+def _analyze(feed: _MomentFeed, manifest: JobManifest, inputs: dict, transcript_path, video_path: str, job: Job,
+             priority: str) -> None:
+    """Stream the analysis's moments into the feed; it is checkpointed once it has run to the end."""
+    with job.stage("analyze"):
+        moments = iter_viral_moments(transcript_path, video_path, job.job_id, priority)
+        for moment in _checkpointed_moments(manifest, inputs, moments):
+            if feed.closed.is_set():
+                # The clipping has stopped; the rest of the analysis would go unused
+                return
+            feed.put(moment)
+    feed.finish()
+
+async def _feed_analysis(feed: _MomentFeed, manifest: JobManifest, inputs: dict, transcript_path, video_path: str,
+                         job: Job, priority: str) -> None:
+    """Run _analyze on the analyze stage; however it ends, the clipping waiting on the feed is released."""
+    try:
+        await stages["analyze"].enqueue(_analyze, feed, manifest, inputs, transcript_path, video_path, job, priority,
+                                        job=job)
+    except BaseException as e:
+        feed.finish(e)
+        raise
+
+def _download(manifest: JobManifest, job: Job, url: str) -> tuple[str | None, bool]:
+    """Download the source, or reuse the checkpointed one if it is still intact."""
+    inputs = {"url": url}
+    downloaded = manifest.completed("download", inputs)
+    if downloaded is not None:
+        job.reuse_stage("download")
+        return downloaded["video"], downloaded["transcript_available"]
+    with job.stage("download"):
+        video_path, transcript_available = download_video(url)
+    if video_path:
+        # Ensure video_path is absolute string path for FFmpeg compatibility
+        video_path = str(Path(video_path).resolve())
+        manifest.record("download", inputs, {"video": video_path, "transcript_available": transcript_available},
+                        [video_path])
+    return video_path, transcript_available
+
+def _reused_transcript(manifest: JobManifest, video_path: str) -> tuple[dict, dict | None]:
+    """The transcript's inputs, and its outputs when an earlier attempt already produced them."""
+    inputs = {"video": content_hash(video_path), "model": WHISPER_MODEL}
+    return inputs, manifest.completed("transcribe", inputs)
+
+def _record_transcript(manifest: JobManifest, inputs: dict, transcript_path) -> Path:
+    # Kept with the node, as cleanup empties the transcripts directory
+    kept = manifest.keep("transcribe", inputs, transcript_path)
+    manifest.record("transcribe", inputs, {"transcript": str(kept)}, [kept])
+    return kept
+
+def _reused_analysis(manifest: JobManifest, transcript_path, video_path: str) -> tuple[dict, list | None]:
+    """The analysis' inputs, and its moments when an earlier attempt already found them."""
+    inputs = {"transcript": content_hash(transcript_path), "video": content_hash(video_path),
+              "analysis": analysis_fingerprint()}
+    analyzed = manifest.completed("analyze", inputs)
+    return inputs, json.loads(Path(analyzed["moments"]).read_text()) if analyzed is not None else None
+
+def _counted_moments(req: FullFlowRequest, video_path: str, moments, reused_clips: list):
+    """Pass moments through, noting those whose clip is already cached (reused, not rendered)."""
+    for moment in moments:
+        if is_cached(video_path, moment, req.layout, req.profile):
+            reused_clips.append(moment)
+        yield moment
+
+def _clip_inputs(req: FullFlowRequest, video_hash: str, moments_path) -> dict:
+    return {"video": video_hash, "moments": content_hash(moments_path), "layout": req.layout,
+            "profile": req.profile, "render": render_settings()}
+
+def _clip_with_previews(req: FullFlowRequest, video_path: str, moments, analysis_inputs: dict, job: Job,
+                        manifest: JobManifest):
     """
-    Optimized async pipeline that runs processes concurrently when dependencies are ready.
-    
-    Pipeline stages:
-    1. Download video + transcript (parallel when possible)
-    2. Transcription (if needed) 
-    3. Analysis (starts immediately when transcript ready)
-    4. Clipping (starts immediately when analysis complete)
-    5. Cleanup (optional, runs concurrently)
+    Clip moments (a list, or a _MomentFeed the analysis is still filling), then
+    their previews, within one clip-stage slot. Each step reuses its stored output
+    when its inputs are unchanged; when only the prompt changed, the analysis
+    reruns but moments it finds again are cached clips.
     """
-    logging.info(f"Full flow job started for URL: {req.url}")
-    
-    # Create thread pool for CPU-bound tasks
-    with ThreadPoolExecutor(max_workers=4) as executor:
+    def on_clip(idx: int, clip_path: str):
+        job.milestone("first_clip")
+        job.notify({"event": "clip", "index": idx, "clip_path": clip_path})
+
+    video_hash = content_hash(video_path)
+    clipped = None
+    if isinstance(moments, list):
+        moments_path = manifest.artifact_path("analyze", analysis_inputs, ".json")
+        clipped = manifest.completed("clip", _clip_inputs(req, video_hash, moments_path))
+
+    reused_clips = []
+    if clipped is not None:
+        job.reuse_stage("clip")
+        clip_paths = clipped["clips"]
+        clip_cache.pin(clip_paths, job.job_id)
+        reused_clips = clip_paths
+    else:
         try:
-            # Step 1: Download video (blocking but necessary first step)
-            logging.info("Step 1: Downloading video and checking for transcript")
-            loop = asyncio.get_event_loop()
-            
-            # Run download in thread pool to avoid blocking
-            download_task = loop.run_in_executor(
-                executor, 
-                partial(download_video, str(req.url))
+            clip_paths = clip_moment_stream(
+                video_path,
+                _timed_moments(job, _counted_moments(req, video_path, moments, reused_clips)),
+                priority=req.priority,
+                layout=req.layout,
+                profile=req.profile,
+                job_id=job.job_id,
+                on_clip=on_clip,
             )
-            
-            video_path, transcript_available = await download_task
-            if not video_path:
-                raise HTTPException(status_code=500, detail="Video download failed")
-            
-            # Ensure video_path is absolute string path for FFmpeg compatibility
-            video_path = str(Path(video_path).resolve())
-            logging.info(f"Video downloaded to {video_path}")
-
-            # Step 2: Handle transcript - this can start immediately after download
-            transcript_task = None
-            
-            if transcript_available:
-                logging.info("Step 2: Using downloaded YouTube transcript")
-                # Try to get existing transcript first (fast operation)
-                transcript_path = get_transcript_path(str(req.url))
-                if transcript_path:
-                    logging.info(f"Found cached transcript at {transcript_path}")
-                    # Create a completed future for consistency
-                    transcript_future = asyncio.Future()
-                    transcript_future.set_result(transcript_path)
-                    transcript_task = transcript_future
-                else:
-                    # Fallback to transcription
-                    logging.warning("Cached transcript missing, falling back to transcription")
-                    transcript_task = loop.run_in_executor(
-                        executor,
-                        partial(create_transcript, str(video_path), str(req.url))
-                    )
+        finally:
+            job.end_stage("clip")
+        # The analysis node exists now that every moment has been taken
+        moments_path = manifest.artifact_path("analyze", analysis_inputs, ".json")
+        # Store only a complete set; a retry re-renders the missing clips (and finds the rest cached)
+        if len(clip_paths) == len(json.loads(moments_path.read_text())):
+            manifest.record("clip", _clip_inputs(req, video_hash, moments_path), {"clips": clip_paths}, clip_paths)
+        logging.info(f"Job {job.job_id}: {len(reused_clips)} of {len(clip_paths)} clips reused from the cache")
+    # Covers and scrub sprites for every clip from one more pass over the source
+    with job.stage("previews"):
+        previews = generate_previews(clip_paths, priority=req.priority, job_id=job.job_id)
+    return clip_paths, previews, len(reused_clips)
+
+async def _run_pipeline(req: FullFlowRequest, job: Job) -> FullFlowResponse:
+    job_id = job.job_id
+    try:
+        # Step 1: Download video. Admission happens here: a full download stage
+        # answers 429 at once, while later stages hold an admitted job back
+        # (enqueue) until they have room instead of dropping its progress
+        logging.info("Step 1: Downloading video and checking for transcript")
+        # Finished stages of an earlier attempt are skipped; only a caller-chosen
+        # job id can be retried, so only such a job keeps a manifest on disk
+        # Hashing sources and copying artifacts can take seconds, so manifest work runs off the event loop
+        manifest = await run_in_threadpool(JobManifest.open, job_id, str(req.url), resumable=req.job_id is not None)
+        video_path, transcript_available = await stages["download"].run(_download, manifest, job, str(req.url))
+        if not video_path:
+            raise HTTPException(status_code=500, detail="Video download failed")
+        logging.info(f"Video downloaded to {video_path}")
+        job.check()
+
+        # Measure the source's loudness while the transcript is prepared;
+        # every clip's normalizing gain comes from this one analysis
+        if settings.loudness_normalize:
+            _warm_up(get_loudness, video_path)
+        # Likewise the energy envelope that dead-air trimming needs for the first moment
+        if settings.trim_dead_air:
+            _warm_up(get_energy_envelope, video_path)
+
+        # Step 2: Handle transcript - this can start immediately after download
+        transcript_inputs, transcribed = await run_in_threadpool(_reused_transcript, manifest, video_path)
+        transcript_path = None
+        if transcribed is not None:
+            logging.info("Step 2: Reusing the transcript of an earlier attempt")
+            job.reuse_stage("transcribe")
+            transcript_path = transcribed["transcript"]
+        elif transcript_available:
+            logging.info("Step 2: Using downloaded YouTube transcript")
+            # Try to get existing transcript first (fast operation)
+            transcript_path = get_transcript_path(str(req.url))
+            if transcript_path:
+                logging.info(f"Found cached transcript at {transcript_path}")
             else:
-                logging.info("Step 2: No YouTube transcript available, transcribing video")
-                transcript_task = loop.run_in_executor(
-                    executor,
-                    partial(create_transcript, str(video_path), str(req.url))
-                )
-            
-            # Wait for transcript to be ready
-            transcript_path = await transcript_task
-            logging.info(f"Transcript ready at {transcript_path}")
-
-            # Step 3: Analysis can start immediately when transcript is ready
-            logging.info("Step 3: Analyzing transcript")
-            analysis_task = loop.run_in_executor(
-                executor,
-                partial(analyze_transcript, transcript_path)
-            )
-            
-            # Step 4: Wait for analysis, then start clipping
-            moments_data = await analysis_task
-            logging.info("Step 4: Clipping moments")
-            
-            # Clipping can run in parallel with cleanup preparation
-            clipping_task = loop.run_in_executor(
-                executor,
-                partial(clip_moments, str(video_path), moments_data.get('viral_moments', []))
+                # Fallback to transcription
+                logging.warning("Cached transcript missing, falling back to transcription")
+        else:
+            logging.info("Step 2: No YouTube transcript available, transcribing video")
+        if not transcript_path:
+            with job.stage("transcribe"):
+                transcript_path = await stages["transcribe"].enqueue(create_transcript, str(video_path), str(req.url))
+        if transcribed is None:
+            transcript_path = await run_in_threadpool(_record_transcript, manifest, transcript_inputs, transcript_path)
+        logging.info(f"Transcript ready at {transcript_path}")
+        job.check()
+
+        # Step 3+4: Analysis (on the analyze stage) streams each moment straight into
+        # the clip queue, so the first clip encodes while the model is still generating
+        logging.info("Step 3: Analyzing transcript and clipping moments as they stream in")
+        analysis_inputs, moments = await run_in_threadpool(_reused_analysis, manifest, transcript_path, video_path)
+        if moments is not None:
+            job.reuse_stage("analyze")
+            clip_paths, previews, reused_clips = await stages["clip"].enqueue(
+                _clip_with_previews, req, str(video_path), moments, analysis_inputs, job, manifest, job=job
             )
-            
-            # Wait for clipping to complete
-            clip_paths = await clipping_task
-            logging.info(f"Clipping completed, generated {len(clip_paths)} clips")
-            
-        except Exception as e:
-            logging.error(f"Full flow pipeline failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Pipeline failed: {str(e)}")
-    
-    # Step 5: Start cleanup in background after executor is closed
+        else:
+            feed = _MomentFeed()
+            try:
+                _, (clip_paths, previews, reused_clips) = await asyncio.gather(
+                    _feed_analysis(feed, manifest, analysis_inputs, transcript_path, str(video_path), job,
+                                   req.priority),
+                    stages["clip"].enqueue(
+                        _clip_with_previews, req, str(video_path), feed, analysis_inputs, job, manifest, job=job
+                    ),
+                )
+            finally:
+                # Clipping that failed takes no more moments; the analysis stops at the next one
+                feed.close()
+        logging.info(f"Clipping completed, generated {len(clip_paths)} clips")
+
+    except (HTTPException, StageBusy, EncodeQueueFull):
+        raise
+    except JobCancelled as e:
+        logging.info(f"Full flow job {job_id} cancelled: {e.reason}")
+        raise HTTPException(status_code=409, detail=f"Job {job_id} cancelled: {e.reason}")
+    except Exception as e:
+        logging.error(f"Full flow pipeline failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Pipeline failed: {str(e)}")
+
+    # Nothing left to resume; the stage outputs stay for any later job
+    await run_in_threadpool(manifest.discard)
+    timings = job.snapshot()
+    if "first_clip" in job.milestones:
+        logging.info(f"Full flow job {job_id}: first clip after {job.milestones['first_clip']:.1f}s, "
+                     f"all done after {timings['elapsed_seconds']:.1f}s")
+    return FullFlowResponse(clip_paths=clip_paths, previews=previews, job_id=job_id, stages=timings["stages"],
+                            milestones=timings["milestones"], reused=timings["reused"], reused_clips=reused_clips)
+
+def _start_cleanup(clean: bool) -> None:
+    # Step 5: Cleanup in the background on the cleanup stage; if one is already
+    # queued it will clean the same directories, so there is nothing to add
     if clean:
         logging.info("Step 5: Starting cleanup of temporary files in background")
-        # Start cleanup in background with a new executor - don't wait for it
-        async def cleanup_background():
-            try:
-                with ThreadPoolExecutor(max_workers=1) as cleanup_executor:
-                    loop = asyncio.get_event_loop()
-                    cleanup_future = loop.run_in_executor(
-                        cleanup_executor,
-                        partial(cleanup, include_clips=False)
-                    )
-                    await cleanup_future
-                    logging.info("Background cleanup completed")
-            except Exception as e:
-                logging.error(f"Background cleanup failed: {e}")
-        
-        # Start cleanup task in background
-        asyncio.create_task(cleanup_background())
-        logging.info("Cleanup started in background")
+        try:
+            # Sources go once they are old enough that no draft of any job still needs them
+            stages["cleanup"].submit(cleanup, include_clips=False, downloads_max_age=settings.download_ttl_seconds,
+                                     jobs_max_age=settings.job_manifest_ttl_seconds)
+            logging.info("Cleanup started in background")
+        except StageBusy:
+            logging.info("Cleanup already queued")
     else:
         logging.info("Skipping cleanup of temporary files")
 
-    return FullFlowResponse(clip_paths=clip_paths)
+async def _stream_pipeline(req: FullFlowRequest, request: Request, job_id: str, clean: bool):
+    """Run the pipeline, yielding its progress events as NDJSON lines and then the result (or error)."""
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def run():
+        async with tracked_job(request, job_id) as job:
+            job.listener = lambda event: loop.call_soon_threadsafe(events.put_nowait, event)
+            return await _run_pipeline(req, job)
+
+    task = asyncio.create_task(run())
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    while (event := await events.get()) is not None:
+        yield json.dumps(event) + "\n"
+    try:
+        result = {"event": "done", **task.result().dict()}
+        _start_cleanup(clean)
+    except HTTPException as e:
+        result = {"event": "error", "status_code": e.status_code, "detail": e.detail}
+    except StageBusy as e:
+        result = {"event": "error", "status_code": 429, "detail": str(e)}
+    except EncodeQueueFull as e:
+        result = {"event": "error", "status_code": 503, "detail": str(e)}
+    yield json.dumps(result) + "\n"
+
+@router.post("/", response_model=FullFlowResponse)
+async def full_flow_endpoint(req: FullFlowRequest, request: Request,
+                             clean: bool = Query(True, description="Remove temporary files after processing"),
+                             stream: bool = Query(False, description="Report progress as NDJSON lines: stage, "
+                                                  "moment and clip events as they happen, then the result")):
+    """
+    Optimized async pipeline that runs processes concurrently when dependencies are ready.
+
+    Pipeline stages:
+    1. Download video + transcript (parallel when possible)
+    2. Transcription (if needed)
+    3. Analysis (starts immediately when transcript ready)
+    4. Clipping (each moment is queued as soon as the LLM streams it)
+    5. Cleanup (optional, runs concurrently)
+
+    Each step runs on its process-wide stage executor, so concurrent requests
+    queue per stage instead of oversubscribing the machine (see /metrics).
+    Stage spans and the time to the first clip are in the response and under
+    /jobs/{job_id}; with stream=true each clip is reported as soon as it is done.
+    """
+    job_id = req.job_id or uuid.uuid4().hex
+    logging.info(f"Full flow job {job_id} started for URL: {req.url}")
+
+    if stream:
+        # Refuse a duplicate id with a real 409 before the 200 stream starts
+        ensure_not_running(job_id)
+        return StreamingResponse(_stream_pipeline(req, request, job_id, clean), media_type="application/x-ndjson")
+
+    # Registered so /jobs/{job_id} shows encode progress; cancelled on client disconnect
+    async with tracked_job(request, job_id) as job:
+        response = await _run_pipeline(req, job)
+    _start_cleanup(clean)
+    return response
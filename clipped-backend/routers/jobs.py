@@ -0,0 +1,66 @@
+from fastapi import APIRouter, HTTPException, Request
+from schemas.jobs import JobStatus
+from services import clip_cache
+from services.job_registry import job_registry
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List
+
+router = APIRouter()
+
+
+async def cancel_on_disconnect(request: Request, job_id: str, poll_seconds: float = 1.0):
+    """Cancel a job once its client has gone away; run as a task alongside the job's work."""
+    while not await request.is_disconnected():
+        await asyncio.sleep(poll_seconds)
+    job_registry.cancel(job_id, "client disconnected")
+
+
+def ensure_not_running(job_id: str) -> None:
+    """Raise 409 when a job with this id is already running."""
+    running = job_registry.get(job_id)
+    if running is not None and running.state == "running":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is already running")
+
+
+@asynccontextmanager
+async def tracked_job(request: Request, job_id: str):
+    """
+    Register a job for the duration of a request, cancelling it if the client
+    disconnects. Raises 409 when a job with this id is already running.
+    """
+    ensure_not_running(job_id)
+    with job_registry.track(job_id) as job:
+        watcher = asyncio.create_task(cancel_on_disconnect(request, job_id))
+        try:
+            yield job
+        finally:
+            watcher.cancel()
+            # The response has been built; its clips may be evicted again
+            clip_cache.unpin(job_id)
+
+
+@router.get("/", response_model=List[JobStatus])
+async def list_jobs():
+    return [job.snapshot() for job in job_registry.list()]
+
+
+@router.get("/{job_id}", response_model=JobStatus)
+async def job_status(job_id: str):
+    """Live per-encode progress (frame, fps, speed, ETA) of a job."""
+    job = job_registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.snapshot()
+
+
+@router.post("/{job_id}/cancel", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    """Stop a job: its running encodes are killed and queued ones never start."""
+    job = job_registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if not job_registry.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} already {job.state}")
+    return job.snapshot()
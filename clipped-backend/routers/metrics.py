@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from schemas.metrics import MetricsResponse
+from services.llm_scheduler import llm_scheduler
+from services.encode_scheduler import encode_scheduler
+from services.stage_executor import stages
+
+router = APIRouter()
+
+@router.get("/", response_model=MetricsResponse)
+async def metrics_endpoint():
+    return MetricsResponse(
+        llm=llm_scheduler.metrics(),
+        encode=encode_scheduler.metrics(),
+        stages={name: stage.metrics() for name, stage in stages.items()},
+    )
@@ -1,15 +1,17 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional
 
 
 class Moment(BaseModel):
     time_start: str
     time_end: str
     description: str
+    score: Optional[float] = None
 
 
 class AnalyzeRequest(BaseModel):
     transcript: str
+    priority: Literal["interactive", "batch"] = "interactive"
 
 
 class AnalyzeResponse(BaseModel):
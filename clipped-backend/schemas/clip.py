@@ -1,14 +1,57 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
+
+# Output framings: 9:16 letterboxed, over a blurred background or cropped around the subject, 1:1, 16:9, or the source frame
+Layout = Literal["vertical", "blur", "crop", "square", "landscape", "source"]
 
 class Moment(BaseModel):
     time_start: str
     time_end: str
     description: Optional[str] = None
+    score: Optional[float] = None
 
 class ClipRequest(BaseModel):
     video_path: str
     moments: List[Moment]
+    # "source" keeps the original frame and is smart-rendered (mostly stream-copied)
+    layout: Layout = "vertical"
+    # Several renditions of each moment from one decode; overrides `layout`
+    layouts: Optional[List[Layout]] = None
+    profile: Literal["draft", "final", "archive"] = "final"
+    # Id to follow the encodes under /jobs/{job_id} (and cancel them); generated when omitted
+    job_id: Optional[str] = Field(None, min_length=1, max_length=64)
+
+class ClipPreview(BaseModel):
+    thumbnail: str
+    # Scrub sprite: a columns x rows grid, tile k shows the clip around k * interval seconds
+    sprite: str
+    columns: int
+    rows: int
+    interval: float
 
 class ClipResponse(BaseModel):
     clip_paths: List[str]
+    # Clip paths per layout when several layouts were requested
+    renditions: Optional[Dict[str, List[str]]] = None
+    # Cover thumbnail and scrub sprite per clip path
+    previews: Dict[str, ClipPreview] = {}
+    job_id: Optional[str] = None
+
+class CompileRequest(BaseModel):
+    # Clip paths returned by an earlier clip or full_flow call, in reel order, from one profile and layout
+    clip_paths: List[str] = Field(..., min_length=1)
+    # Seconds of dip to black encoded at each join; 0 joins the clips with hard cuts
+    transition: float = Field(0.0, ge=0.0, le=2.0)
+    priority: Literal["interactive", "batch"] = "interactive"
+    job_id: Optional[str] = Field(None, min_length=1, max_length=64)
+
+class CompileResponse(BaseModel):
+    reel_path: str
+    job_id: Optional[str] = None
+
+class FinalizeRequest(BaseModel):
+    # Clip paths returned by an earlier clip or full_flow call
+    clip_paths: List[str]
+    profile: Literal["final", "archive"] = "final"
+    priority: Literal["interactive", "batch"] = "interactive"
+    job_id: Optional[str] = Field(None, min_length=1, max_length=64)
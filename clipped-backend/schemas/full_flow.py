@@ -1,8 +1,27 @@
-from pydantic import BaseModel, HttpUrl
-from typing import List
+from pydantic import BaseModel, Field, HttpUrl
+from typing import Dict, List, Literal, Optional
+from schemas.clip import ClipPreview, Layout
+from schemas.jobs import StageTiming
 
 class FullFlowRequest(BaseModel):
     url: HttpUrl
+    priority: Literal["interactive", "batch"] = "interactive"
+    layout: Layout = "vertical"
+    # Drafts render fast; accepted ones are re-rendered through /clip/finalize
+    profile: Literal["draft", "final", "archive"] = "draft"
+    # Id to follow the encodes under /jobs/{job_id} (and cancel them); generated when omitted.
+    # Retrying with the same id resumes the job from its last checkpoint
+    job_id: Optional[str] = Field(None, min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_-]+$")
 
 class FullFlowResponse(BaseModel):
     clip_paths: List[str]
+    # Cover thumbnail and scrub sprite per clip path
+    previews: Dict[str, ClipPreview] = {}
+    job_id: str
+    # Per-stage spans and milestones (time to first clip), as under /jobs/{job_id}
+    stages: List[StageTiming] = []
+    milestones: Dict[str, float] = {}
+    # Stages skipped because their stored output was computed from the same inputs
+    reused: List[str] = []
+    # Clips found in the clip cache rather than rendered
+    reused_clips: int = 0
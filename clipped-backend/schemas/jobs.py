@@ -0,0 +1,37 @@
+from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional
+
+
+class EncodeProgress(BaseModel):
+    label: str
+    state: Literal["queued", "running", "done", "failed", "cancelled"]
+    frame: int
+    fps: float
+    # Media seconds encoded per wall second
+    speed: Optional[float] = None
+    out_seconds: float
+    duration: Optional[float] = None
+    percent: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    elapsed_seconds: float
+
+
+class StageTiming(BaseModel):
+    name: str
+    # Seconds since the job started
+    started_seconds: float
+    finished_seconds: Optional[float] = None
+    seconds: Optional[float] = None
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    state: Literal["running", "done", "failed", "cancelled"]
+    cancel_reason: Optional[str] = None
+    elapsed_seconds: float
+    encodes: List[EncodeProgress]
+    stages: List[StageTiming] = []
+    # e.g. first_moment, first_clip: seconds since the job started
+    milestones: Dict[str, float] = {}
+    # Stages skipped because their checkpointed output was still valid
+    reused: List[str] = []
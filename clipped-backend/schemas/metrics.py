@@ -0,0 +1,55 @@
+from pydantic import BaseModel
+from typing import Dict
+
+
+class LLMLaneMetrics(BaseModel):
+    queue_depth: int
+    queued_jobs: int
+    granted: int
+    tokens_granted: int
+    wait_avg_seconds: float
+    wait_recent_avg_seconds: float
+    wait_max_seconds: float
+
+
+class LLMSchedulerMetrics(BaseModel):
+    tokens_per_minute: int
+    tokens_available: int
+    rate_limited: int
+    lanes: Dict[str, LLMLaneMetrics]
+
+
+class EncodeSchedulerMetrics(BaseModel):
+    core_budget: int
+    max_concurrent: int
+    running: int
+    threads_in_use: int
+    queued: Dict[str, int]
+    completed: int
+    failed: int
+    cancelled: int
+    rejected: int
+    recent_wall_avg_seconds: float
+    recent_cpu_avg_seconds: float
+    recent_queue_avg_seconds: float
+
+
+class StageMetrics(BaseModel):
+    workers: int
+    max_queued: int
+    running: int
+    queued: int
+    # Admitted jobs held back until the stage has room
+    waiting: int
+    utilization: float
+    completed: int
+    failed: int
+    rejected: int
+    recent_queue_avg_seconds: float
+    recent_run_avg_seconds: float
+
+
+class MetricsResponse(BaseModel):
+    llm: LLMSchedulerMetrics
+    encode: EncodeSchedulerMetrics
+    stages: Dict[str, StageMetrics]
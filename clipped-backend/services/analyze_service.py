@@ -1,10 +1,20 @@
 import os
 import json
+import hashlib
 from pathlib import Path
+from typing import Iterator
 from dotenv import load_dotenv
-from cerebras.cloud.sdk import Cerebras
+from cerebras.cloud.sdk import Cerebras, RateLimitError
 
 from config import settings
+from services.audio_service import get_energy_envelope
+from services.llm_scheduler import llm_scheduler
+from services.moment_parser import MomentStreamParser, parse_moments_json
+from services.moment_service import DeadAirTrimmer, MomentGate, resolve_moments
+from services.prefilter_service import estimate_tokens, prefilter_transcript
+from services.probe_service import get_duration
+from services.segment_index import SegmentIndex
+from services.timeutil import parse_time
 # Environment loaded via config; discard manual load
 
 # Load system prompt from external file
@@ -14,35 +24,55 @@ def load_system_prompt() -> str:
     return prompt_path.read_text(encoding='utf-8')
 
 SYSTEM_PROMPT = load_system_prompt()
+# Model the moments are generated with
+LLM_MODEL = "qwen-3-32b"
+# Settings that change which moments an analysis yields
+_ANALYSIS_SETTINGS = (
+    "prefilter_keep_ratio", "prefilter_min_chars", "prefilter_window_seconds", "prefilter_context_seconds",
+    "prefilter_use_audio", "moment_merge_iou", "moment_merge_gap_seconds", "moment_max_seconds",
+    "max_clips_per_video", "trim_dead_air", "trim_max_seconds", "trim_min_seconds", "trim_pad_seconds",
+)
 
-def parse_time(ts: str) -> float:
-    ts_str = ts.strip()
-    # If format is plain seconds (e.g., '333.00'), parse directly
-    if ':' not in ts_str:
-        try:
-            return float(ts_str)
-        except ValueError:
-            raise ValueError(f"Invalid time format: {ts}")
-    parts = ts_str.split(':')
-    if len(parts) == 2:
-        return int(parts[0]) * 60 + float(parts[1])
-    elif len(parts) == 3:
-        return int(parts[0]) * 3600 + int(parts[1]) * 60 + float(parts[2])
-    else:
-        raise ValueError(f"Invalid time format: {ts}")
+
+def analysis_fingerprint() -> str:
+    """
+    Hash of everything besides the transcript and the source that decides an
+    analysis' moments: the model, the system prompt and the moment settings.
+    """
+    params = {
+        "model": LLM_MODEL,
+        "prompt": hashlib.sha256(SYSTEM_PROMPT.encode()).hexdigest(),
+        "settings": {name: getattr(settings, name) for name in _ANALYSIS_SETTINGS},
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
 
 def parse_transcript_lines(path: Path) -> list[tuple[float, str]]:
     """Read transcript txt and return list of (time_seconds, text)"""
-    lines = path.read_text(encoding='utf-8').splitlines()
+    return parse_transcript_text(path.read_text(encoding='utf-8'))
+
+
+def parse_transcript_text(content: str) -> list[tuple[float, str]]:
+    """
+    Parse transcript text into a list of (time_seconds, text).
+    Accepts both `[m:ss] text` lines and the `"12.00": "text",` lines
+    written by the transcribe and download services.
+    """
+    lines = content.splitlines()
     entries = []
     for line in lines:
+        line = line.strip()
         if line.startswith('[') and ']' in line:
             time_str, text = line[1:].split(']', 1)
-            try:
-                t = parse_time(time_str)
-                entries.append((t, text.strip()))
-            except ValueError:
-                continue
+        elif line.startswith('"') and '":' in line:
+            time_str, text = line[1:].split('":', 1)
+            text = text.strip().rstrip(',').strip().strip('"')
+        else:
+            continue
+        try:
+            t = parse_time(time_str)
+            entries.append((t, text.strip()))
+        except ValueError:
+            continue
     return entries
 
 
@@ -50,72 +80,133 @@ def chunk_script(text, max_chars=8000):
     return [text[i:i+max_chars] for i in range(0, len(text), max_chars)]
 
 
-def filter_moments_within_bounds(moments: list[dict], video_duration: float) -> list[dict]:
-    """
-    Ensure all viral moments are within the bounds of the video duration.
-    Delete any moment not within bounds in place.
-    """
-    # Iterate backwards to remove invalid moments
-    for i in range(len(moments) - 1, -1, -1):
-        moment = moments[i]
+def enrich_with_subtitles(moments: list[dict], index: SegmentIndex) -> list[dict]:
+    """Attach the transcript lines inside each moment's window as `subtitles`."""
+    ranges = []
+    for moment in moments:
         try:
-            start = parse_time(moment.get('time_start', '0:00'))
-            end = parse_time(moment.get('time_end', '0:00'))
+            ranges.append((parse_time(moment.get('time_start', '0:00')), parse_time(moment.get('time_end', '0:00'))))
         except ValueError:
-            del moments[i]
-            continue
-        if not (0 <= start < end <= video_duration):
-            del moments[i]
+            # Unparseable bounds get an empty window
+            ranges.append((0.0, -1.0))
+    for moment, subs in zip(moments, index.subtitles_for(ranges)):
+        moment['subtitles'] = subs
     return moments
 
 
-def analyze_transcript(transcript_path):
-    """Analyze a transcript file and output a JSON of viral moments."""
-    transcript_path = Path(transcript_path)
+def _open_completion_stream(client, chunk: str, job_id: str, priority: str):
+    """Reserve LLM quota for one chunk and open its completion stream, retrying on 429s."""
+    cost = estimate_tokens(SYSTEM_PROMPT + chunk) + settings.llm_completion_token_estimate
+    # Reserved once: a rate-limited attempt is retried under the same reservation
+    reservation = llm_scheduler.acquire(cost, job_id, priority)
+    for attempt in range(settings.llm_max_retries + 1):
+        try:
+            stream = client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": "script: " + chunk}
+                ],
+                model=LLM_MODEL,
+                stream=True,
+            )
+            return reservation, stream
+        except RateLimitError:
+            llm_scheduler.report_rate_limited()
+            if attempt == settings.llm_max_retries:
+                raise
+            llm_scheduler.retry(reservation)
+
+
+def _prepare_transcript(transcript_path: Path, video_path: str | None) -> tuple[list[str], SegmentIndex, float | None]:
+    """Read and index a transcript, then pre-filter and chunk it for the LLM."""
     text = transcript_path.read_text(encoding='utf-8')
-    
-    client = Cerebras(api_key=settings.cerebras_api_key)
-    # parse full transcript for subtitles lookup
-    raw_transcript = Path(transcript_path)
-    transcript_lines = parse_transcript_lines(raw_transcript)
-    all_moments = []
-    chunks = chunk_script(text)
-    for idx, chunk in enumerate(chunks, start=1):
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": "script: " + chunk}
-            ],
-            model="qwen-3-32b",
-        )
-        content = response.choices[0].message.content
-        json_str = content.strip()
-        if json_str.startswith("```json"):
-            parts = json_str.split('```')
-            if len(parts) >= 2:
-                json_str = parts[1]
-        start_idx = json_str.find('{')
-        end_idx = json_str.rfind('}')
-        if start_idx != -1 and end_idx != -1:
-            json_str = json_str[start_idx:end_idx+1]
+    # Index the full transcript once for subtitle lookups
+    video_duration = get_duration(video_path) if video_path else None
+    index = SegmentIndex(parse_transcript_text(text), video_duration)
+    # Only send the locally top-ranked regions of long transcripts to the LLM
+    energy = None
+    if video_path and settings.prefilter_use_audio and len(text) >= settings.prefilter_min_chars:
+        energy = get_energy_envelope(video_path)
+    text = prefilter_transcript(text, index, energy)
+    return chunk_script(text), index, video_duration
+
+
+def _dead_air_trimmer(video_path: str | None, index: SegmentIndex):
+    """Trimmer for the source's moments, or None when disabled or the audio can't be analyzed."""
+    if not video_path or not settings.trim_dead_air:
+        return None
+    energy = get_energy_envelope(video_path)
+    if energy is None or not energy.size:
+        return None
+    return DeadAirTrimmer(energy, index)
+
+
+def _stream_raw_moments(chunks: list[str], job_id: str, priority: str) -> Iterator[dict]:
+    """Yield moments exactly as the LLM streams them, chunk after chunk."""
+    # Retries on 429 are left to the scheduler, which backs off for every job at once
+    client = Cerebras(api_key=settings.cerebras_api_key, max_retries=0)
+    for chunk in chunks:
+        reservation, stream = _open_completion_stream(client, chunk, job_id, priority)
+        parser = MomentStreamParser()
+        content_parts = []
         try:
-            result = json.loads(json_str)
-            all_moments.extend(result.get('viral_moments', []))
-        except Exception:
-            # Skip invalid chunks
-            continue
+            for part in stream:
+                usage = getattr(part, 'usage', None)
+                if usage and getattr(usage, 'total_tokens', None):
+                    reservation.settle(usage.total_tokens)
+                delta = part.choices[0].delta.content if part.choices else None
+                if not delta:
+                    continue
+                content_parts.append(delta)
+                yield from parser.feed(delta)
+        finally:
+            llm_scheduler.release(reservation)
+        if not parser.emitted:
+            # Reply didn't match the streaming shape; fall back to a full parse
+            yield from parse_moments_json("".join(content_parts))
 
-    # Enrich moments with subtitles
-    for moment in all_moments:
-        start = parse_time(moment.get('time_start', '0:00'))
-        end = parse_time(moment.get('time_end',   '0:00'))
-        subs = []
-        for t, text in transcript_lines:
-            if start <= t <= end:
-                subs.append({'time': t, 'text': text})
-        moment['subtitles'] = subs
-    # Filter moments within the actual video duration
-    video_duration = sum([parse_time(t[1]) - parse_time(t[0]) for t in zip(transcript_lines[:-1], transcript_lines[1:])])
-    #all_moments = filter_moments_within_bounds(all_moments, video_duration)
+
+def iter_viral_moments(transcript_path, video_path: str | None = None,
+                       job_id: str | None = None, priority: str = "interactive") -> Iterator[dict]:
+    """
+    Stream viral moments out of a transcript, yielding each one (with subtitles)
+    as soon as the LLM has finished generating it.
+    When video_path is given, moments are bounded by its (cached) probed duration.
+    Duplicates of already-yielded moments and moments past the per-video cap
+    are dropped on the fly (see MomentGate), and dead air is trimmed from the
+    edges of the rest (see DeadAirTrimmer).
+    LLM calls are admitted by the process-wide token-budget scheduler under
+    job_id (default: the transcript name) in the given priority lane.
+    """
+    transcript_path = Path(transcript_path)
+    chunks, index, video_duration = _prepare_transcript(transcript_path, video_path)
+    gate = MomentGate(video_duration)
+    trimmer, trimmer_ready = None, False
+    for moment in _stream_raw_moments(chunks, job_id or transcript_path.stem, priority):
+        moment = gate.admit(moment)
+        if moment is not None:
+            if not trimmer_ready:
+                # Built on the first moment so the LLM request isn't held up by audio decoding
+                trimmer, trimmer_ready = _dead_air_trimmer(video_path, index), True
+            if trimmer is not None:
+                moment = trimmer.trim(moment)
+            yield enrich_with_subtitles([moment], index)[0]
+
+
+def analyze_transcript(transcript_path, video_path: str | None = None,
+                       job_id: str | None = None, priority: str = "interactive"):
+    """
+    Analyze a transcript file and output a JSON of viral moments.
+    Moments from all chunks are bounds-checked, merged and capped, then
+    trimmed of dead air, before enrichment.
+    """
+    transcript_path = Path(transcript_path)
+    chunks, index, video_duration = _prepare_transcript(transcript_path, video_path)
+    raw_moments = list(_stream_raw_moments(chunks, job_id or transcript_path.stem, priority))
+    moments = resolve_moments(raw_moments, video_duration)
+    trimmer = _dead_air_trimmer(video_path, index) if moments else None
+    if trimmer is not None:
+        moments = [trimmer.trim(moment) for moment in moments]
+    all_moments = enrich_with_subtitles(moments, index)
     # Return moments data as dict
     return {'viral_moments': all_moments}
@@ -0,0 +1,277 @@
+import json
+import math
+import subprocess
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from config import settings
+from services import clip_cache
+from services.probe_service import probe
+
+SAMPLE_RATE = 16000
+# Frames of PCM read from ffmpeg per block (one minute at the default hop)
+_BLOCK_FRAMES = 600
+
+# ebur128 reports loudness every 100 ms; momentary values cover the 400 ms ending there
+LOUDNESS_HOP = 0.1
+_MOMENTARY_BLOCKS = 4
+# Bump when the loudness sidecar's contents change
+LOUDNESS_VERSION = 1
+# BS.1770 gates: blocks below -70 LUFS are ignored, then those 10 LU under the mean
+_ABSOLUTE_GATE = -70.0
+_RELATIVE_GATE = -10.0
+# Gains smaller than this aren't worth an audio filter
+_MIN_GAIN_DB = 0.5
+
+
+def _envelope_path(media_path: Path, hop: float) -> Path:
+    return media_path.with_name(f"{media_path.name}.energy-{int(round(hop * 1000))}ms.npy")
+
+
+def _compute_envelope(media_path: Path, hop: float) -> np.ndarray:
+    """Decode mono PCM with ffmpeg and return per-hop RMS energy, block by block."""
+    hop_samples = max(1, int(round(hop * SAMPLE_RATE)))
+    cmd = [
+        "ffmpeg", "-v", "quiet", "-i", str(media_path),
+        "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"
+    ]
+    block_bytes = hop_samples * _BLOCK_FRAMES * 2
+    rms_blocks = []
+    tail = np.empty(0, dtype=np.float32)
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            samples = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+            if tail.size:
+                samples = np.concatenate([tail, samples])
+            n_frames = samples.size // hop_samples
+            frames = samples[:n_frames * hop_samples].reshape(n_frames, hop_samples)
+            rms_blocks.append(np.sqrt(np.mean(frames * frames, axis=1)))
+            tail = samples[n_frames * hop_samples:]
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode audio from {media_path}")
+    if tail.size:
+        rms_blocks.append(np.sqrt(np.mean(tail * tail, keepdims=True)))
+    if not rms_blocks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(rms_blocks).astype(np.float32)
+
+
+# (lock, callers holding or waiting for it) per analysis in progress; dropped with its last caller
+_path_locks: dict[str, tuple[threading.Lock, int]] = {}
+_path_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _analysis_lock(kind: str, media_path: Path):
+    """One lock per (analysis, source): concurrent callers wait for one computation instead of repeating it."""
+    key = f"{kind}:{media_path.resolve()}"
+    with _path_locks_guard:
+        lock, users = _path_locks.get(key, (None, 0))
+        lock = lock or threading.Lock()
+        _path_locks[key] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _path_locks_guard:
+            lock, users = _path_locks[key]
+            if users == 1:
+                del _path_locks[key]
+            else:
+                _path_locks[key] = (lock, users - 1)
+
+
+def get_energy_envelope(media_path: str | Path, hop: float = 0.1) -> np.ndarray | None:
+    """
+    Return the RMS energy envelope of a media file's audio, one value per `hop` seconds.
+    The envelope is cached as a .npy sidecar next to the media and reused while
+    the sidecar is newer than the media file.
+    """
+    media_path = Path(media_path)
+    if not media_path.exists():
+        return None
+    with _analysis_lock(f"energy-{hop}", media_path):
+        return _get_energy_envelope(media_path, hop)
+
+
+def _get_energy_envelope(media_path: Path, hop: float) -> np.ndarray | None:
+    sidecar = _envelope_path(media_path, hop)
+    if sidecar.exists() and sidecar.stat().st_mtime >= media_path.stat().st_mtime:
+        try:
+            return np.load(sidecar)
+        except Exception:
+            logging.warning(f"Discarding unreadable energy envelope {sidecar}")
+
+    try:
+        envelope = _compute_envelope(media_path, hop)
+    except Exception as e:
+        logging.warning(f"Energy envelope unavailable for {media_path}: {e}")
+        return None
+
+    try:
+        with clip_cache.write_atomically(sidecar) as tmp, open(tmp, 'wb') as f:
+            np.save(f, envelope)
+    except OSError as e:
+        logging.warning(f"Could not cache energy envelope {sidecar}: {e}")
+    return envelope
+
+
+@dataclass(frozen=True)
+class LoudnessProfile:
+    """
+    EBU R128 loudness of a whole source, one value per LOUDNESS_HOP seconds.
+    Value k covers the audio up to (k + 1) * LOUDNESS_HOP.
+    """
+    momentary: np.ndarray   # LUFS over the last 400 ms
+    short_term: np.ndarray  # LUFS over the last 3 s
+    peak: np.ndarray        # sample peak in dBFS within the hop
+
+    def integrated(self, start: float, end: float) -> float | None:
+        """
+        Gated integrated loudness (LUFS) of [start, end]: the momentary values
+        are exactly BS.1770's overlapping 400 ms blocks, so only those inside
+        the window are gated and averaged. None for silence or tiny windows.
+        """
+        first = int(math.ceil(start / LOUDNESS_HOP - 1e-6)) + _MOMENTARY_BLOCKS - 1
+        last = int(math.floor(end / LOUDNESS_HOP + 1e-6)) - 1
+        blocks = self.momentary[max(0, first):max(0, last + 1)].astype(np.float64)
+        blocks = blocks[blocks > _ABSOLUTE_GATE]
+        if blocks.size == 0:
+            return None
+        energy = 10 ** ((blocks + 0.691) / 10)
+        relative_gate = -0.691 + 10 * np.log10(energy.mean()) + _RELATIVE_GATE
+        gated = energy[blocks > relative_gate]
+        return float(-0.691 + 10 * np.log10(gated.mean()))
+
+    def peak_db(self, start: float, end: float) -> float | None:
+        first = int(math.floor(start / LOUDNESS_HOP))
+        last = int(math.ceil(end / LOUDNESS_HOP))
+        window = self.peak[max(0, first):max(0, last)]
+        return float(window.max()) if window.size else None
+
+
+def _loudness_path(media_path: Path) -> Path:
+    return media_path.with_name(f"{media_path.name}.loudness.npz")
+
+
+def _compute_loudness(media_path: Path) -> LoudnessProfile:
+    """One decode of the audio through ebur128 and a per-hop astats peak meter."""
+    cmd = [
+        "ffmpeg", "-nostats", "-v", "error", "-i", str(media_path), "-vn",
+        # ebur128 cuts the audio into 100 ms frames; astats resets on each one
+        "-af", "ebur128=metadata=1,"
+               "astats=metadata=1:reset=1:measure_perchannel=none:measure_overall=Peak_level,"
+               "ametadata=mode=print:file=-",
+        "-f", "null", "-"
+    ]
+    keys = {"lavfi.r128.M": 0, "lavfi.r128.S": 1, "lavfi.astats.Overall.Peak_level": 2}
+    rows: list[list[float]] = []
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as proc:
+        for line in proc.stdout:
+            if line.startswith("frame:"):
+                rows.append([-np.inf, -np.inf, -np.inf])
+                continue
+            key, _, value = line.strip().partition("=")
+            if rows and key in keys:
+                rows[-1][keys[key]] = float(value)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to measure loudness of {media_path}")
+    values = np.array(rows, dtype=np.float32).reshape(-1, 3)
+    return LoudnessProfile(momentary=values[:, 0], short_term=values[:, 1], peak=values[:, 2])
+
+
+# Profiles of the sources being clipped right now (about 1.3 MB per 3-hour source);
+# the others are reread from their sidecars
+_loudness_cache: OrderedDict[tuple[str, int, int], LoudnessProfile] = OrderedDict()
+_LOUDNESS_CACHE_ENTRIES = 4
+_loudness_cache_lock = threading.Lock()
+
+
+def get_loudness(media_path: str | Path) -> LoudnessProfile | None:
+    """
+    Return the loudness profile of a media file's audio, or None without audio.
+    It is measured once per source and cached in memory and in a .loudness.npz
+    sidecar next to the media, so every clip of the source reuses it.
+    """
+    media_path = Path(media_path)
+    try:
+        stat = media_path.stat()
+    except OSError:
+        return None
+    key = (str(media_path.resolve()), stat.st_size, stat.st_mtime_ns)
+    # Clips of one source are encoded in parallel; only one of them measures
+    with _analysis_lock("loudness", media_path):
+        with _loudness_cache_lock:
+            if key in _loudness_cache:
+                _loudness_cache.move_to_end(key)
+                return _loudness_cache[key]
+        profile = _load_loudness(media_path, stat.st_mtime)
+        if profile is None:
+            media = probe(media_path)
+            if media is not None and not media.has_audio:
+                return None
+            try:
+                profile = _compute_loudness(media_path)
+            except Exception as e:
+                logging.warning(f"Loudness unavailable for {media_path}: {e}")
+                return None
+            _save_loudness(_loudness_path(media_path), profile)
+        with _loudness_cache_lock:
+            _loudness_cache[key] = profile
+            while len(_loudness_cache) > _LOUDNESS_CACHE_ENTRIES:
+                _loudness_cache.popitem(last=False)
+        return profile
+
+
+def _load_loudness(media_path: Path, media_mtime: float) -> LoudnessProfile | None:
+    sidecar = _loudness_path(media_path)
+    if not sidecar.exists() or sidecar.stat().st_mtime < media_mtime:
+        return None
+    try:
+        with np.load(sidecar, allow_pickle=False) as data:
+            if json.loads(str(data["meta"])).get("version") != LOUDNESS_VERSION:
+                return None
+            return LoudnessProfile(momentary=data["momentary"], short_term=data["short_term"], peak=data["peak"])
+    except Exception:
+        logging.warning(f"Discarding unreadable loudness sidecar {sidecar}")
+        return None
+
+
+def _save_loudness(sidecar: Path, profile: LoudnessProfile) -> None:
+    try:
+        with clip_cache.write_atomically(sidecar) as tmp, open(tmp, 'wb') as f:
+            np.savez(f, momentary=profile.momentary, short_term=profile.short_term, peak=profile.peak,
+                     meta=np.array(json.dumps({"version": LOUDNESS_VERSION, "hop": LOUDNESS_HOP})))
+    except OSError as e:
+        logging.warning(f"Could not cache loudness of {sidecar}: {e}")
+
+
+def clip_gain_db(media_path: str | Path, start: float, end: float) -> float | None:
+    """
+    Linear gain (dB) that brings [start, end] of a source to LOUDNESS_TARGET_LUFS,
+    capped at LOUDNESS_MAX_GAIN_DB and so the sample peak stays under
+    LOUDNESS_PEAK_CEILING_DB. None when disabled, unmeasurable or negligible.
+    """
+    if not settings.loudness_normalize:
+        return None
+    profile = get_loudness(media_path)
+    if profile is None:
+        return None
+    loudness = profile.integrated(start, end)
+    if loudness is None:
+        return None
+    gain = min(settings.loudness_target_lufs - loudness, settings.loudness_max_gain_db)
+    peak = profile.peak_db(start, end)
+    if peak is not None and np.isfinite(peak):
+        gain = min(gain, settings.loudness_peak_ceiling_db - peak)
+    gain = round(gain, 1)
+    return gain if abs(gain) >= _MIN_GAIN_DB else None
@@ -1,17 +1,43 @@
 from config import settings
+from services.manifest_service import prune_jobs
 import shutil
+import time
+from pathlib import Path
 
-def cleanup(include_clips: bool = False):
+def _prune(target_dir: Path, max_age: float) -> None:
+    """Remove the files under target_dir that arrived more than max_age seconds ago."""
+    cutoff = time.time() - max_age
+    for path in target_dir.rglob('*'):
+        try:
+            stat = path.stat()
+            # ctime too: downloads keep the upload's Last-Modified as their mtime
+            if path.is_file() and max(stat.st_mtime, stat.st_ctime) < cutoff:
+                path.unlink()
+        except OSError as e:
+            print(f"Failed to remove {path}: {e}")
+
+def cleanup(include_clips: bool = False, include_downloads: bool = True, downloads_max_age: float | None = None,
+            jobs_max_age: float | None = None):
     """
     Remove files in the storage directory.
     If include_clips is False, cleans 'audio', 'downloads', and 'transcripts' subdirectories.
-    If include_clips is True, also cleans 'clips' directory.
+    If include_clips is True, also cleans 'clips' directory, the job manifests in 'jobs'
+    and the cached stage outputs in 'artifacts'.
+    If include_downloads is False, source videos are kept; with downloads_max_age only
+    those older than that many seconds are removed (e.g. so recent drafts can be finalized).
+    With jobs_max_age, job manifests not updated for that many seconds are removed too.
     """
     storage_dir = settings.storage_dir
     # Define subdirectories to clean
-    subdirs = ["audio", "downloads", "transcripts"]
+    subdirs = ["audio", "transcripts"]
+    if include_downloads and downloads_max_age is None:
+        subdirs.insert(1, "downloads")
+    elif include_downloads:
+        _prune(storage_dir / "downloads", downloads_max_age)
     if include_clips:
-        subdirs.append("clips")
+        subdirs.extend(["clips", "jobs", "artifacts"])
+    elif jobs_max_age is not None:
+        prune_jobs(jobs_max_age)
     for subdir in subdirs:
         target_dir = storage_dir / subdir
         if target_dir.exists() and target_dir.is_dir():
@@ -20,4 +46,4 @@ def cleanup(include_clips: bool = False):
                 shutil.rmtree(target_dir)
                 target_dir.mkdir(parents=True, exist_ok=True)
             except Exception as e:
-                print(f"Failed to clean {target_dir}: {e}")
\ No newline at end of file
+                print(f"Failed to clean {target_dir}: {e}")
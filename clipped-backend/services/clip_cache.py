@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from filelock import FileLock
+
+try:
+    import fcntl
+    from filelock import UnixFileLock
+except ImportError:  # Windows: its FileLock removes the lock file itself
+    fcntl = None
+
+from config import settings
+
+# Bump when renders of the same inputs change (filters, encode settings)
+CACHE_VERSION = 2
+# Bytes hashed from each end of a source to identify it without reading all of it
+_SAMPLE_BYTES = 1 << 20
+# Temp files older than this are leftovers of a crashed render
+_STALE_TEMP_SECONDS = 3600
+
+# Source ids keyed by (resolved path, size, mtime) so a replaced file is re-hashed
+_source_ids: dict[tuple[str, int, int], str] = {}
+_ids_lock = threading.Lock()
+_evict_lock = threading.Lock()
+# Clips handed out to running jobs, by job id; eviction leaves them alone until the job ends
+_pins: dict[str, set[str]] = {}
+_pins_lock = threading.Lock()
+
+
+def cache_dir() -> Path:
+    return settings.storage_dir / 'clips'
+
+
+def source_id(video_path: str | Path) -> str:
+    """
+    Identity of a source's content: a hash of its size and its first and last MiB.
+    Two downloads of the same video share an id; different videos don't, even
+    when they end up at the same path.
+    """
+    path = Path(video_path)
+    try:
+        stat = path.stat()
+    except OSError:
+        # Unreadable sources can't be rendered; fall back to the path so keys stay stable
+        return hashlib.sha256(f"path:{path.resolve()}".encode()).hexdigest()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    with _ids_lock:
+        if key in _source_ids:
+            return _source_ids[key]
+
+    digest = hashlib.sha256(str(stat.st_size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(_SAMPLE_BYTES))
+        if stat.st_size > 2 * _SAMPLE_BYTES:
+            f.seek(-_SAMPLE_BYTES, os.SEEK_END)
+            digest.update(f.read())
+    identity = digest.hexdigest()
+    with _ids_lock:
+        _source_ids[key] = identity
+    return identity
+
+
+def render_settings() -> dict:
+    """Settings besides the cut, profile and layout that change a render: cache version and loudness."""
+    loudness = None
+    if settings.loudness_normalize:
+        loudness = [settings.loudness_target_lufs, settings.loudness_max_gain_db, settings.loudness_peak_ceiling_db]
+    return {"version": CACHE_VERSION, "loudness": loudness}
+
+
+def clip_key(video_path: str | Path, start: float, end: float, profile: str, layout: str) -> str:
+    """Cache key of one rendition: source content, exact cut, profile, layout and render settings."""
+    params = {
+        "source": source_id(video_path),
+        "start": round(start, 3),
+        "end": round(end, 3),
+        "profile": profile,
+        "layout": layout,
+        **render_settings(),
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def reel_key(clip_paths: list[str | Path], transition: float) -> str:
+    """Cache key of a compilation: its clips (named by their own keys), in order, and the transition."""
+    params = {"version": CACHE_VERSION, "clips": [Path(p).name for p in clip_paths], "transition": round(transition, 3)}
+    return "reel-" + hashlib.sha256(json.dumps(params).encode()).hexdigest()[:32]
+
+
+def clip_path(key: str, root: Path | None = None) -> Path:
+    return (root or cache_dir()) / f"{key}.mp4"
+
+
+def preview_paths(clip: Path) -> tuple[Path, Path]:
+    """(cover thumbnail, scrub sprite) cached next to a rendered clip."""
+    return clip.with_name(f"{clip.stem}.thumb.jpg"), clip.with_name(f"{clip.stem}.sprite.jpg")
+
+
+def lookup(path: Path) -> bool:
+    """True on a cache hit; the hit refreshes the entry for eviction."""
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def temp_path(path: Path) -> Path:
+    """Unique hidden sibling of `path` that ffmpeg can write (keeps the extension)."""
+    return path.with_name(f".{path.stem}.{uuid.uuid4().hex[:8]}{path.suffix}")
+
+
+@contextmanager
+def write_atomically(path: Path):
+    """Yield a temp path to render into; it replaces `path` only if the block succeeds."""
+    tmp = temp_path(path)
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+if fcntl is not None:
+    class _RenderLock(UnixFileLock):
+        """
+        flock lock that removes its file on release. The file is unlinked while
+        still held, so a waiter that then wins the lock on the removed file
+        notices (its inode is no longer the path's) and tries again on the new one.
+        """
+
+        def _acquire(self) -> None:
+            fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if os.fstat(fd).st_ino == os.stat(self.lock_file).st_ino:
+                    self._context.lock_file_fd = fd
+                    return
+            except OSError:
+                # Held by someone else, or removed by its last holder meanwhile
+                pass
+            os.close(fd)
+
+        def _release(self) -> None:
+            fd = self._context.lock_file_fd
+            self._context.lock_file_fd = None
+            Path(self.lock_file).unlink(missing_ok=True)
+            os.close(fd)
+else:
+    _RenderLock = FileLock
+
+
+@contextmanager
+def locked(paths: list[Path]):
+    """
+    Hold the cross-process render locks of `paths`, so concurrent jobs don't
+    render the same clip twice. Locks are taken in sorted order to avoid deadlocks,
+    and their files are removed again on release.
+    """
+    with ExitStack() as stack:
+        for path in sorted(set(paths)):
+            lock_dir = path.parent / '.locks'
+            lock_dir.mkdir(parents=True, exist_ok=True)
+            stack.enter_context(_RenderLock(str(lock_dir / f"{path.name}.lock")))
+        yield
+
+
+def pin(paths: list[str | Path], job_id: str | None) -> None:
+    """Keep clips a job is about to return out of eviction until unpin(job_id)."""
+    if job_id is None:
+        return
+    with _pins_lock:
+        _pins.setdefault(job_id, set()).update(Path(path).name for path in paths)
+
+
+def unpin(job_id: str) -> None:
+    with _pins_lock:
+        _pins.pop(job_id, None)
+
+
+def _pinned() -> set[str]:
+    with _pins_lock:
+        return set().union(*_pins.values())
+
+
+def evict(max_bytes: int | None = None, root: Path | None = None) -> int:
+    """
+    Delete least recently used clips until the cache fits in max_bytes. A clip's
+    render record, previews and probe sidecars count toward the bound and go with
+    it; they all share its key, the file name up to the first dot. Returns the
+    number of bytes freed.
+    """
+    max_bytes = settings.clip_cache_max_bytes if max_bytes is None else max_bytes
+    root = root or cache_dir()
+    if not root.exists() or not _evict_lock.acquire(blocking=False):
+        # Another thread is already evicting
+        return 0
+    try:
+        now = time.time()
+        # key -> [clip mtime, newest mtime, bytes, files]
+        groups: dict[str, list] = {}
+        total = 0
+        for entry in os.scandir(root):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.startswith('.'):
+                if now - stat.st_mtime > _STALE_TEMP_SECONDS:
+                    Path(entry.path).unlink(missing_ok=True)
+                continue
+            key = entry.name.split('.', 1)[0]
+            group = groups.setdefault(key, [None, 0.0, 0, []])
+            if entry.name == f"{key}.mp4":
+                group[0] = stat.st_mtime
+            group[1] = max(group[1], stat.st_mtime)
+            group[2] += stat.st_size
+            group[3].append(Path(entry.path))
+            total += stat.st_size
+
+        def last_use(group: list) -> float:
+            # The clip's mtime is refreshed by lookup(); files left without a clip age like the newest of them
+            return group[0] if group[0] is not None else group[1]
+
+        freed = 0
+        pinned = _pinned()
+        for key, (*_, size, paths) in sorted(groups.items(), key=lambda item: last_use(item[1])):
+            if total - freed <= max_bytes:
+                break
+            if f"{key}.mp4" in pinned:
+                continue
+            for path in paths:
+                path.unlink(missing_ok=True)
+            freed += size
+        if freed:
+            logging.info(f"Evicted {freed / 1e6:.1f} MB from the clip cache")
+        return freed
+    finally:
+        _evict_lock.release()
@@ -1,183 +1,1186 @@
 import json
 from pathlib import Path
+from typing import Callable, Iterable, Sequence
+import bisect
 import math
+import re
 import subprocess
+import tempfile
 import concurrent.futures
+from functools import lru_cache, partial
 import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from config import settings
+from services import clip_cache
+from services.audio_service import clip_gain_db
+from services.encode_scheduler import EncodeQueueFull, encode_scheduler, run_process
+from services.job_registry import JobCancelled, job_registry
+from services.probe_service import StreamInfo, get_keyframes, probe
+from services.saliency_service import CropPath, get_crop_path
+from services.stage_executor import stages
+from services.timeutil import parse_time
 import logging
 
+# Seconds decoded ahead of a cut when the source's keyframe positions are unknown
+SEEK_PREROLL = 10.0
 
-def create_9_16_with_blur_ffmpeg(input_path: str, output_path: str) -> None:
+# Output frame (width, height) per layout at full scale; None keeps the source frame
+LAYOUT_FRAMES = {
+    "vertical": (1080, 1920),     # 9:16 letterboxed, Shorts / TikTok
+    "blur": (1080, 1920),         # 9:16 over a blurred copy of the frame
+    "crop": (1080, 1920),         # 9:16 window panning with the subject, see saliency_service
+    "square": (1080, 1080),       # 1:1 letterboxed, feeds
+    "landscape": (1920, 1080),    # 16:9 letterboxed, YouTube
+    "source": None,
+}
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """Encode settings for one quality tier; `scale` is relative to the full-size frame."""
+    scale: float
+    preset: str
+    crf: int
+    audio_bitrate: str
+    maxrate: str | None = None
+    bufsize: str | None = None
+
+
+RENDER_PROFILES = {
+    # Small, fast previews for picking which moments to publish
+    "draft": RenderProfile(scale=0.5, preset="ultrafast", crf=30, audio_bitrate="64k", maxrate="1M", bufsize="2M"),
+    # Publishable clips
+    "final": RenderProfile(scale=1.0, preset="veryfast", crf=23, audio_bitrate="128k"),
+    # Slow preset, near-transparent quality
+    "archive": RenderProfile(scale=1.0, preset="slow", crf=18, audio_bitrate="192k"),
+}
+
+# The blurred background is built at 1/BLUR_DOWNSCALE of the frame size: a blur
+# of a small frame scaled back up looks the same at a fraction of the cost
+BLUR_DOWNSCALE = 8
+BLUR_SIGMA = 20
+
+# Cover thumbnails and scrub sprites are cut at this profile's frame size; a sprite
+# tiles SPRITE_COLUMNS x SPRITE_ROWS frames sampled evenly over its clip
+PREVIEW_PROFILE = "draft"
+SPRITE_COLUMNS = 5
+SPRITE_ROWS = 5
+
+# Source codecs whose GOPs can be stream-copied, with the encoder for the re-encoded edges
+SMART_RENDER_ENCODERS = {"h264": "libx264"}
+# x264 profiles for the source profiles edges can be encoded in (8-bit 4:2:0)
+SMART_RENDER_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+# Edge encodes aim for source quality rather than the usual clip quality
+SMART_RENDER_EDGE_CRF = "18"
+# Edges shorter than this (under two frames at 30 fps) are snapped to the keyframe
+SMART_RENDER_SNAP = 0.05
+# Sources whose parameter sets the edges were found not to reproduce are remembered
+# (up to this many), so their later clips are re-encoded without trying again
+SMART_RENDER_UNMATCHED_MEMO = 64
+
+
+def create_9_16_with_blur_ffmpeg(input_path: str, output_path: str, priority: str = "interactive",
+                                 profile: str = "final", job_id: str | None = None) -> None:
     """Create a 9:16 aspect ratio video with blurred background using pure FFmpeg."""
-    cpu_threads = os.cpu_count() or 4
-    
-    cmd = [
-        "ffmpeg", "-y",
-        "-threads", str(cpu_threads),
-        "-i", input_path,
-        
-        # Complex filter: create blurred background + centered main video
-        "-filter_complex", 
-        "[0:v]scale=1080:1920:force_original_aspect_ratio=increase,crop=1080:1920,gblur=sigma=20[bg];"
-        "[0:v]scale=1080:1920:force_original_aspect_ratio=decrease[fg];"
-        "[bg][fg]overlay=(W-w)/2:(H-h)/2",
-        
-        # Optimized encoding
-        "-c:v", "libx264",
-        "-preset", "veryfast",
-        "-crf", "23",
-        "-c:a", "aac",
-        "-b:a", "128k",
-        "-movflags", "+faststart",
-        
-        output_path
-    ]
-    
-    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    encode_scheduler.run(
+        lambda threads: [
+            "ffmpeg", "-y",
+            "-filter_threads", str(threads),
+            "-threads", str(threads),
+            "-i", str(input_path),
+            "-vf", layout_filter("blur", profile),
+            *_encode_args(threads, profile),
+            str(output_path)
+        ],
+        priority=priority,
+        label=Path(output_path).name,
+        job_id=job_id,
+    )
+
+
+def clip_moments(video_path: str, moments: list[dict], priority: str = "interactive",
+                 render_mode: str = "auto", layout: str = "vertical", profile: str = "final",
+                 job_id: str | None = None) -> list[str]:
+    """
+    Create video subclips based on moments list using parallel FFmpeg processing.
+    See clip_renditions; this renders a single layout.
+    """
+    return clip_renditions(video_path, moments, [layout], priority, render_mode, profile, job_id)[layout]
+
+
+def clip_renditions(video_path: str, moments: list[dict], layouts: Sequence[str],
+                    priority: str = "interactive", render_mode: str = "auto",
+                    profile: str = "final", job_id: str | None = None) -> dict[str, list[str]]:
+    """
+    Render every moment in each of `layouts` and return the clip paths per layout.
+    All layouts of a clip come out of one decode of the source: the decoded
+    frames are split into one filter branch per layout.
 
+    render_mode:
+      - "per_clip": one ffmpeg process per moment.
+      - "single_pass": one ffmpeg process decodes the source once and writes every clip.
+      - "auto": moments within SINGLE_PASS_MAX_GAP_SECONDS of each other share a
+        single-pass render; isolated ones are cut on their own (input seeking
+        makes those cheap, while a shared decode would have to cross the gap).
 
-def clip_moments(video_path: str, moments: list[dict]) -> list[str]:
+    layouts are keys of LAYOUT_FRAMES and profile one of RENDER_PROFILES.
+    Full-size "source" clips are smart-rendered one by one (see smart_render),
+    which beats any shared decode.
+    Encodes report progress to, and are cancelled with, the registered job `job_id`;
+    a cancelled job raises JobCancelled.
+    """
     logging.info(f"Starting optimized clip process for video {video_path} with {len(moments)} moments")
-    """Create video subclips based on moments list using parallel FFmpeg processing."""
+    layouts = list(dict.fromkeys(layouts))
+    renditions: dict[str, list[str]] = {layout: [] for layout in layouts}
     # Return early if no moments
     if not moments:
         logging.info("No moments provided; skipping clipping")
-        return []
+        return renditions
+
+    for layout in layouts:
+        if layout not in LAYOUT_FRAMES:
+            raise ValueError(f"Unknown layout: {layout}")
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile: {profile}")
+
+    decoded = [layout for layout in layouts if not _smart_render_applies(layout, profile)]
+    for layout in layouts:
+        if layout not in decoded:
+            renditions[layout] = clip_moment_stream(video_path, moments, priority, layout, profile, job_id)
+    if len(decoded) == 1 and (render_mode == "per_clip" or len(moments) < 2):
+        renditions[decoded[0]] = clip_moment_stream(video_path, moments, priority, decoded[0], profile, job_id)
+        return renditions
+    if not decoded:
+        return renditions
 
-    # Prepare output directory
     clips_dir = settings.storage_dir / 'clips'
     clips_dir.mkdir(parents=True, exist_ok=True)
 
-    # Determine optimal number of workers (CPU cores available)
-    max_workers = min(len(moments), os.cpu_count() or 4)
-    logging.info(f"Using {max_workers} workers for parallel clipping")
-
-    # Process clips in parallel
-    clip_paths: list[str] = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all clipping tasks
-        future_to_moment = {}
-        for idx, moment in enumerate(moments, start=1):
-            future = executor.submit(_process_single_clip, video_path, moment, idx, clips_dir)
-            future_to_moment[future] = (idx, moment)
-        
-        # Collect results as they complete
-        for future in concurrent.futures.as_completed(future_to_moment):
-            idx, moment = future_to_moment[future]
+    # Cuts are (idx, start, end, {layout: output path}) and are rendered when any rendition is missing
+    cuts = []
+    descriptions = {}
+    # (moment index, path) per layout: paths are content hashes, so order comes from the index
+    indexed: dict[str, list[tuple[int, str]]] = {layout: [] for layout in decoded}
+    for idx, moment in enumerate(moments, start=1):
+        planned = [_plan_cut(video_path, moment, idx, clips_dir, layout, profile) for layout in decoded]
+        if planned[0] is None:
+            continue
+        _, start, end, _ = planned[0]
+        paths = {layout: cut[3] for layout, cut in zip(decoded, planned)}
+        clip_cache.pin(list(paths.values()), job_id)
+        descriptions[idx] = moment.get('description') or ''
+        if all(clip_cache.lookup(path) for path in paths.values()):
+            logging.info(f"Clip {idx} is cached in every layout, skipping")
+            for layout, path in paths.items():
+                indexed[layout].append((idx, str(path)))
+        else:
+            cuts.append((idx, start, end, paths))
+
+    if render_mode == "per_clip":
+        groups = [[cut] for cut in cuts]
+    else:
+        max_gap = math.inf if render_mode == "single_pass" else settings.single_pass_max_gap_seconds
+        groups = _single_pass_groups(cuts, max_gap)
+    logging.info(f"Rendering {len(cuts)} clips x {len(decoded)} layouts in {len(groups)} ffmpeg passes")
+    if groups:
+        produced: list[tuple[str, Path]] = []
+        job = job_registry.get(job_id)
+        # On the shared render stage, so concurrent requests don't each bring their own threads
+        futures = [
+            stages["render"].submit_waiting(_render_group, video_path, group, decoded, priority, profile, job_id,
+                                            job=job)
+            for group in groups
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            produced.extend(future.result())
+        cut_by_path = {path: cut for cut in cuts for path in cut[3].values()}
+        done = {path for _, path in produced}
+        for layout, path in produced:
+            idx, start, end, paths = cut_by_path[path]
+            _write_render_record(path, video_path, idx, start, end, descriptions[idx], layout, profile)
+            # A cut missing any layout is left out of all of them, or the lists would go out of step
+            if all(p in done for p in paths.values()):
+                indexed[layout].append((idx, str(path)))
+            else:
+                logging.warning(f"Clip {idx} failed in some layouts, dropping it from every layout")
+
+    clip_cache.evict()
+    # In moment order, so renditions[a][i] and renditions[b][i] are the same moment
+    for layout, paths in indexed.items():
+        renditions[layout] = [path for _, path in sorted(paths)]
+    logging.info(f"Completed all clipping tasks: {sum(len(p) for p in renditions.values())} clips generated")
+    return renditions
+
+
+def _single_pass_groups(cuts: list[tuple], max_gap: float) -> list[list[tuple]]:
+    """Group (idx, start, end, path) cuts whose gaps are at most max_gap seconds."""
+    groups: list[list[tuple]] = []
+    group_end = -math.inf
+    for cut in sorted(cuts, key=lambda c: c[1]):
+        if groups and cut[1] - group_end <= max_gap:
+            groups[-1].append(cut)
+            group_end = max(group_end, cut[2])
+        else:
+            groups.append([cut])
+            group_end = cut[2]
+    return groups
+
+
+def _render_group(video_path: str, group: list[tuple], layouts: list[str], priority: str,
+                  profile: str = "final", job_id: str | None = None) -> list[tuple[str, Path]]:
+    """
+    Render every layout of a group of cuts in one ffmpeg pass, falling back to
+    per-clip encodes. Returns the (layout, path) renditions produced.
+    """
+    with clip_cache.locked([path for *_, paths in group for path in paths.values()]):
+        # Another job may have rendered some of these while we waited for the locks
+        pending = [cut for cut in group if not all(clip_cache.lookup(path) for path in cut[3].values())]
+        cached = [(layout, path) for cut in group if cut not in pending for layout, path in cut[3].items()]
+        return cached + _render_pending(video_path, pending, layouts, priority, profile, job_id)
+
+
+def _render_pending(video_path: str, group: list[tuple], layouts: list[str], priority: str,
+                    profile: str, job_id: str | None = None) -> list[tuple[str, Path]]:
+    if not group:
+        return []
+    if len(group) > 1 or len(layouts) > 1:
+        # Render into temp files so readers never see a partial clip
+        temps = {path: clip_cache.temp_path(path) for *_, paths in group for path in paths.values()}
+        try:
+            media = probe(video_path)
+            # Assume audio when the source can't be probed; a wrong guess falls back per clip
+            has_audio = media.has_audio if media else True
+            gains = [clip_gain_db(video_path, start, end) for _, start, end, _ in group] if has_audio else None
+            crop_paths = None
+            if "crop" in layouts:
+                crop_paths = [get_crop_path(video_path, start, end, priority, job_id) for _, start, end, _ in group]
+            encode_scheduler.run(
+                lambda threads: build_rendition_command(
+                    video_path,
+                    [(start, end, [temps[paths[layout]] for layout in layouts]) for _, start, end, paths in group],
+                    layouts, threads=threads, has_audio=has_audio, profile=profile, gains=gains,
+                    crop_paths=crop_paths,
+                ),
+                priority=priority,
+                label=f"{len(group)} clips x {len(layouts)} layouts of {Path(video_path).name}",
+                job_id=job_id,
+                # Outputs are encoded side by side, so the longest one sets the pace
+                duration=max(end - start for _, start, end, _ in group),
+            )
+            for path, tmp in temps.items():
+                os.replace(tmp, path)
+            logging.info(f"Saved clips {[idx for idx, *_ in group]} in a single pass")
+            return [(layout, paths[layout]) for *_, paths in group for layout in layouts]
+        except (JobCancelled, EncodeQueueFull):
+            raise
+        except Exception as e:
+            logging.warning(f"Single-pass render failed ({e}); falling back to per-clip encodes")
+        finally:
+            for tmp in temps.values():
+                tmp.unlink(missing_ok=True)
+
+    produced = []
+    for idx, start, end, paths in group:
+        for layout in layouts:
             try:
-                clip_path = future.result()
-                if clip_path:
-                    clip_paths.append(clip_path)
-                    logging.info(f"Successfully processed clip {idx}")
-                else:
-                    logging.warning(f"Clip {idx} was skipped or failed")
+                with clip_cache.write_atomically(paths[layout]) as tmp:
+                    clip_with_ffmpeg_optimized(video_path, start, end, tmp, priority=priority, layout=layout,
+                                               profile=profile, job_id=job_id)
+                logging.info(f"Saved clip {idx} to {paths[layout]}")
+                produced.append((layout, paths[layout]))
+            except (JobCancelled, EncodeQueueFull):
+                raise
             except Exception as e:
-                logging.error(f"Failed to create clip {idx}: {e}")
-                continue
-            
-    # Sort clip paths to maintain order (since parallel processing may complete out of order)
+                # The cut is dropped from every layout, so its other layouts aren't worth encoding
+                logging.error(f"Error processing clip {idx} as {layout}: {e}")
+                break
+    return produced
+
+
+def clip_moment_stream(video_path: str, moments: Iterable[dict],
+                       priority: str = "interactive", layout: str = "vertical",
+                       profile: str = "final", job_id: str | None = None,
+                       on_clip: Callable[[int, str], None] | None = None) -> list[str]:
+    """
+    Create video subclips from an iterable of moments, queueing each moment for
+    encoding as soon as it is produced (e.g. while the LLM is still streaming).
+    Clips render on the shared "render" stage; when it is full, taking the next
+    moment waits for a place.
+    on_clip(idx, clip_path) is called (from a worker thread) as each clip
+    finishes, before the remaining moments have even arrived.
+    When the job is cancelled no more moments are taken, running encodes are
+    killed and JobCancelled is raised.
+    """
+    job = job_registry.get(job_id)
+    # Prepare output directory
+    clips_dir = settings.storage_dir / 'clips'
+    clips_dir.mkdir(parents=True, exist_ok=True)
+
+    # Process clips in parallel; (moment index, path) pairs
+    clip_paths: list[tuple[int, str]] = []
+    # Submit each clipping task as its moment arrives
+    future_to_moment = {}
+    for idx, moment in enumerate(moments, start=1):
+        if job is not None and job.cancelled.is_set():
+            break
+        future = stages["render"].submit_waiting(
+            _process_single_clip, video_path, moment, idx, clips_dir, priority, layout, profile, job_id, job=job
+        )
+        future_to_moment[future] = (idx, moment)
+        if on_clip is not None:
+            future.add_done_callback(partial(_report_clip, on_clip, idx))
+        logging.info(f"Queued clip {idx} for encoding")
+
+    # Collect results as they complete
+    for future in concurrent.futures.as_completed(future_to_moment):
+        idx, moment = future_to_moment[future]
+        try:
+            clip_path = future.result()
+            if clip_path:
+                clip_paths.append((idx, clip_path))
+                logging.info(f"Successfully processed clip {idx}")
+            else:
+                logging.warning(f"Clip {idx} was skipped or failed")
+        except EncodeQueueFull:
+            # Overloaded: refuse the whole request rather than return a partial set
+            for pending in future_to_moment:
+                pending.cancel()
+            raise
+        except Exception as e:
+            logging.error(f"Failed to create clip {idx}: {e}")
+            continue
+
+    if job is not None:
+        job.check()
+    # Back in moment order (parallel processing completes out of order; names are content hashes)
     clip_paths.sort()
     logging.info(f"Completed all clipping tasks: {len(clip_paths)} clips generated")
-    return clip_paths
+    return [path for _, path in clip_paths]
 
 
-def _process_single_clip(video_path: str, moment: dict, idx: int, clips_dir: Path) -> str | None:
-    """Process a single clip - designed for parallel execution."""
+def _report_clip(on_clip: Callable[[int, str], None], idx: int, future: concurrent.futures.Future) -> None:
+    if future.cancelled() or future.exception() is not None or not future.result():
+        return
+    try:
+        on_clip(idx, future.result())
+    except Exception as e:
+        logging.warning(f"Reporting clip {idx} failed: {e}")
+
+
+def _plan_cut(video_path: str, moment: dict, idx: int, clips_dir: Path, layout: str = "vertical",
+              profile: str = "final") -> tuple[int, float, float, Path] | None:
+    """
+    (idx, start, end, output path) for a moment, or None if its times don't parse.
+    The path is the clip's content-addressed cache entry, see clip_cache.clip_key.
+    """
     try:
         start = parse_time(moment['time_start'])
         end = parse_time(moment['time_end'])
-        desc = moment.get('description', '')
-        logging.info(f"Processing clip {idx}: start={start}, end={end}, description='{desc}'")
-        
-        safe_desc = "".join(c for c in desc if c.isalnum() or c in (' ', '_')).rstrip().replace(' ', '_')[:50]
-        clip_name = f"clip_{idx}_{int(start)}_{int(end)}_{safe_desc}.mp4"
-        clip_path = clips_dir / clip_name
+    except (KeyError, ValueError) as e:
+        logging.error(f"Skipping clip {idx} with invalid times: {e}")
+        return None
+    key = clip_cache.clip_key(video_path, start, end, profile, layout)
+    return idx, start, end, clip_cache.clip_path(key, clips_dir)
+
+
+def is_cached(video_path: str, moment: dict, layout: str = "vertical", profile: str = "final") -> bool:
+    """True if the moment's clip is already cached, i.e. clipping it reuses rather than renders."""
+    cut = _plan_cut(video_path, moment, 0, clip_cache.cache_dir(), layout, profile)
+    return cut is not None and cut[3].exists()
+
+
+def _process_single_clip(video_path: str, moment: dict, idx: int, clips_dir: Path,
+                         priority: str = "interactive", layout: str = "vertical",
+                         profile: str = "final", job_id: str | None = None) -> str | None:
+    """Process a single clip - designed for parallel execution."""
+    try:
+        cut = _plan_cut(video_path, moment, idx, clips_dir, layout, profile)
+        if cut is None:
+            return None
+        _, start, end, clip_path = cut
+        logging.info(f"Processing clip {idx}: start={start}, end={end}, description='{moment.get('description') or ''}'")
+        # Pinned before it exists, so no other job's eviction removes it before we return it
+        clip_cache.pin([clip_path], job_id)
 
-        # Check if clip already exists
-        if clip_path.exists():
-            logging.info(f"Clip {idx} already exists at {clip_path}, skipping")
-            return str(clip_path)
+        with clip_cache.locked([clip_path]):
+            # Check if clip is already cached
+            if clip_cache.lookup(clip_path):
+                logging.info(f"Clip {idx} is cached at {clip_path}, skipping")
+                return str(clip_path)
 
-        # Create clip with optimized FFmpeg
-        clip_with_ffmpeg_optimized(video_path, start, end, clip_path)
+            # Create clip with optimized FFmpeg, published only once complete
+            with clip_cache.write_atomically(clip_path) as tmp_path:
+                clip_with_ffmpeg_optimized(video_path, start, end, tmp_path, priority=priority, layout=layout,
+                                           profile=profile, job_id=job_id)
+            _write_render_record(clip_path, video_path, idx, start, end, moment.get('description') or '', layout, profile)
         logging.info(f"Saved clip {idx} to {clip_path}")
+        clip_cache.evict()
         return str(clip_path)
-        
+
+    except JobCancelled as e:
+        logging.info(f"Clip {idx} abandoned: {e.reason}")
+        return None
+    except EncodeQueueFull:
+        raise
     except Exception as e:
         logging.error(f"Error processing clip {idx}: {e}")
         return None
 
 
-def clip_with_ffmpeg_optimized(video_path: str, start: float, end: float, output_path: Path) -> None:
-    """Optimized FFmpeg clipping with CPU-focused performance improvements."""
-    # Get number of CPU threads for FFmpeg
-    cpu_threads = os.cpu_count() or 4
-    
-    cmd = [
-        "ffmpeg", "-y",
-        "-threads", str(cpu_threads),  # Use all CPU cores
-        "-i", str(video_path),
-        "-ss", str(start), 
-        "-to", str(end),
-        
-        # Optimized video processing
-        "-vf", "scale=1080:1920:force_original_aspect_ratio=decrease,pad=1080:1920:(ow-iw)/2:(oh-ih)/2:black",
+def _seek_points(start: float, keyframes: Sequence[float] | None = None) -> tuple[float, float]:
+    """
+    Split a cut at `start` into (input_seek, output_offset): a fast input-side
+    seek to the last keyframe at or before the start (or SEEK_PREROLL seconds
+    ahead of it when keyframes are unknown), plus an exact output-side trim
+    of the remainder.
+    """
+    if keyframes:
+        pos = bisect.bisect_right(keyframes, start) - 1
+        input_seek = keyframes[pos] if pos >= 0 else 0.0
+    else:
+        input_seek = max(0.0, start - SEEK_PREROLL)
+    return input_seek, start - input_seek
+
+
+def layout_filter(layout: str, profile: str = "final", crop_center: str | None = None, tag: str = "") -> str | None:
+    """
+    Video filtergraph that fits the source into a layout's frame at a profile's scale.
+    `crop_center` is the "crop" layout's ffmpeg expression of the window centre
+    (fraction of the width) over time; without it the window stays centred.
+    `tag` suffixes the graph's link labels so several copies can share a filtergraph.
+    """
+    if layout not in LAYOUT_FRAMES:
+        raise ValueError(f"Unknown layout: {layout}")
+    scale = RENDER_PROFILES[profile].scale
+    frame = LAYOUT_FRAMES[layout]
+    if frame is None:
+        return None if scale == 1.0 else f"scale=trunc(iw*{scale}/2)*2:-2"
+    # libx264 needs even dimensions
+    w, h = (int(d * scale) // 2 * 2 for d in frame)
+    if layout == "blur":
+        # One decoded frame feeds both branches; only the small copy is blurred
+        bw, bh = (max(2, d // BLUR_DOWNSCALE // 2 * 2) for d in (w, h))
+        return (
+            f"split[bg{tag}][fg{tag}];"
+            f"[bg{tag}]scale={bw}:{bh}:force_original_aspect_ratio=increase:flags=fast_bilinear,crop={bw}:{bh},"
+            f"gblur=sigma={BLUR_SIGMA / BLUR_DOWNSCALE:g},scale={w}:{h}:flags=bilinear[bgb{tag}];"
+            f"[fg{tag}]scale={w}:{h}:force_original_aspect_ratio=decrease[fgs{tag}];"
+            f"[bgb{tag}][fgs{tag}]overlay=(W-w)/2:(H-h)/2,setsar=1"
+        )
+    if layout == "crop":
+        fw, fh = frame
+        # The largest window of the frame's aspect ratio, kept inside the source
+        return (
+            f"crop=w='trunc(min(iw,ih*{fw}/{fh})/2)*2':h='trunc(min(ih,iw*{fh}/{fw})/2)*2'"
+            f":x='clip(iw*({crop_center or 0.5})-ow/2,0,iw-ow)':y='(ih-oh)/2',scale={w}:{h},setsar=1"
+        )
+    return f"scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2:black,setsar=1"
+
+
+def _audio_filter_args(gain_db: float | None) -> list[str]:
+    """Loudness normalization as a plain volume change, see audio_service.clip_gain_db."""
+    return ["-af", f"volume={gain_db:g}dB"] if gain_db else []
+
+
+def _encode_args(threads: int, profile: str = "final") -> list[str]:
+    """Output-side encode settings shared by every clip render."""
+    render = RENDER_PROFILES[profile]
+    rate_control = ["-maxrate", render.maxrate, "-bufsize", render.bufsize] if render.maxrate else []
+    return [
         "-c:v", "libx264",
-        "-preset", "veryfast",  # Much faster encoding at cost of file size
-        "-crf", "23",          # Good quality-to-speed balance
+        "-preset", render.preset,
+        "-crf", str(render.crf),
+        *rate_control,
+        "-threads", str(threads),  # Encoder threads
         
         # Smart audio handling - copy if compatible, otherwise fast encode
         "-c:a", "aac",         # Use AAC for compatibility
-        "-b:a", "128k",        # Reasonable audio bitrate
+        "-b:a", render.audio_bitrate,
         "-ar", "44100",        # Standard sample rate
         
         # Additional CPU optimizations
         "-movflags", "+faststart",  # Enable fast start for better streaming
         "-tune", "fastdecode",      # Optimize for fast decoding
+    ]
+
+
+def build_clip_command(video_path: str, start: float, end: float, output_path: Path,
+                       keyframes: Sequence[float] | None = None, threads: int | None = None,
+                       layout: str = "vertical", profile: str = "final",
+                       gain_db: float | None = None, crop_path: CropPath | None = None) -> list[str]:
+    """
+    FFmpeg command that cuts [start, end] out of video_path into output_path.
+    `threads` caps decoder, filter and encoder threads (default: all cores);
+    `gain_db` is applied to the audio and `crop_path` steers the "crop" layout.
+    """
+    cpu_threads = threads or os.cpu_count() or 4
+    input_seek, output_offset = _seek_points(start, keyframes)
+    # Filter timestamps restart at 0 at the input seek point, so the clip starts at output_offset
+    crop_center = crop_path.expression(output_offset) if crop_path is not None else None
+    video_filter = layout_filter(layout, profile, crop_center)
+
+    return [
+        "ffmpeg", "-y",
+        "-filter_threads", str(cpu_threads),
+        "-threads", str(cpu_threads),  # Decoder threads
+        # Input-side seek: jump straight to the cut instead of decoding from 0
+        "-ss", f"{input_seek:.3f}",
+        "-i", str(video_path),
+        # Output-side trim: frame-exact start and duration
+        "-ss", f"{output_offset:.3f}",
+        "-t", f"{end - start:.3f}",
+        
+        # Optimized video processing
+        *(["-vf", video_filter] if video_filter else []),
+        *_audio_filter_args(gain_db),
+        *_encode_args(cpu_threads, profile),
         
         str(output_path)
     ]
-    
-    # Run with minimal output for speed
-    result = subprocess.run(
-        cmd, 
-        check=True, 
-        stdout=subprocess.DEVNULL, 
-        stderr=subprocess.PIPE,
-        text=True
+
+
+def build_multi_clip_command(video_path: str, cuts: list[tuple[float, float, Path]],
+                             keyframes: Sequence[float] | None = None, threads: int | None = None,
+                             has_audio: bool = True, layout: str = "vertical",
+                             profile: str = "final") -> list[str]:
+    """
+    One FFmpeg command that decodes video_path once, over the span covering
+    every (start, end, output_path) cut, and writes each cut to its own file.
+    """
+    return build_rendition_command(
+        video_path, [(start, end, [path]) for start, end, path in cuts], [layout],
+        keyframes, threads, has_audio, profile,
     )
-    
-    # Only log stderr if there's an actual error
-    if result.stderr and "error" in result.stderr.lower():
-        logging.warning(f"FFmpeg warning for {output_path.name}: {result.stderr}")
 
 
-def clip_with_ffmpeg(video_path: str, start: float, end: float, output_path: Path) -> None:
-    """Legacy FFmpeg function - kept for compatibility but uses optimized version."""
-    clip_with_ffmpeg_optimized(video_path, start, end, output_path)
+def build_rendition_command(video_path: str, cuts: list[tuple[float, float, Sequence[Path]]],
+                            layouts: Sequence[str], keyframes: Sequence[float] | None = None,
+                            threads: int | None = None, has_audio: bool = True,
+                            profile: str = "final", gains: Sequence[float | None] | None = None,
+                            crop_paths: Sequence[CropPath | None] | None = None) -> list[str]:
+    """
+    One FFmpeg command that decodes video_path once and writes every cut in
+    every layout; each cut is (start, end, output paths in `layouts` order)
+    and gets the audio gain (dB) and crop path at the same position in
+    `gains` and `crop_paths`.
+    Frames outside all cuts are dropped first, the rest are split into one
+    branch per layout, scaled once per layout, then split again into one
+    trim branch per clip. The "crop" layout follows each clip's own path, so
+    it is cropped and scaled after the trim instead.
+    """
+    cpu_threads = threads or os.cpu_count() or 4
+    first = min(start for start, _, _ in cuts)
+    last = max(end for _, end, _ in cuts)
+    input_seek, _ = _seek_points(first, keyframes)
+    # Filter timestamps restart at 0 at the input seek point
+    spans = [(start - input_seek, end - input_seek) for start, end, _ in cuts]
+    n, n_layouts = len(cuts), len(layouts)
+
+    keep = "+".join(f"between(t,{s:.3f},{e:.3f})" for s, e in spans)
+    if n_layouts == 1:
+        graph = [f"[0:v]select='{keep}'[l0]"]
+    else:
+        graph = [f"[0:v]select='{keep}',split={n_layouts}" + "".join(f"[l{j}]" for j in range(n_layouts))]
+    for j, layout in enumerate(layouts):
+        per_clip = [""] * n
+        if layout == "crop":
+            chain = "null"
+            # Trimmed branches restart at t=0, so each path applies as is
+            per_clip = [
+                "," + layout_filter(layout, profile, path.expression() if path is not None else None)
+                for path in (crop_paths or [None] * n)
+            ]
+        else:
+            chain = layout_filter(layout, profile) or "null"
+        graph.append(f"[l{j}]{chain},split={n}" + "".join(f"[v{j}_{i}]" for i in range(n)))
+        graph += [
+            f"[v{j}_{i}]trim=start={s:.3f}:end={e:.3f},setpts=PTS-STARTPTS{per_clip[i]}[vo{j}_{i}]"
+            for i, (s, e) in enumerate(spans)
+        ]
+    if has_audio:
+        # Audio is trimmed once per clip, then shared by that clip's layouts
+        fan_out = f",asplit={n_layouts}" if n_layouts > 1 else ""
+        volumes = [f",volume={gain:g}dB" if gain else "" for gain in (gains or [None] * n)]
+        graph.append(f"[0:a]asplit={n}" + "".join(f"[a{i}]" for i in range(n)))
+        graph += [
+            f"[a{i}]atrim=start={s:.3f}:end={e:.3f},asetpts=PTS-STARTPTS{volumes[i]}{fan_out}"
+            + "".join(f"[ao{j}_{i}]" for j in range(n_layouts))
+            for i, (s, e) in enumerate(spans)
+        ]
+
+    # The outputs share the thread budget instead of each encoder claiming all of it
+    encoder_threads = max(1, cpu_threads // (n * n_layouts))
+    cmd = [
+        "ffmpeg", "-y",
+        "-filter_threads", str(cpu_threads),
+        "-filter_complex_threads", str(cpu_threads),
+        "-threads", str(cpu_threads),
+        # Decode only from the first cut's keyframe to the end of the last cut
+        "-ss", f"{input_seek:.3f}",
+        "-t", f"{last - input_seek:.3f}",
+        "-i", str(video_path),
+        "-filter_complex", ";".join(graph),
+    ]
+    for j in range(n_layouts):
+        for i, (_, _, output_paths) in enumerate(cuts):
+            cmd += ["-map", f"[vo{j}_{i}]"]
+            if has_audio:
+                cmd += ["-map", f"[ao{j}_{i}]"]
+            cmd += _encode_args(encoder_threads, profile) + [str(output_paths[j])]
+    return cmd
+
+
+def _smart_render_applies(layout: str, profile: str) -> bool:
+    """Smart rendering keeps the source frame and quality, so only full-size source clips qualify."""
+    return settings.smart_render and layout == "source" and RENDER_PROFILES[profile].scale == 1.0
+
 
-def parse_time(ts):
+def smart_render_span(start: float, end: float, keyframes: Sequence[float]) -> tuple[float, float] | None:
     """
-    Parse a timestamp string into seconds.
-    Supports formats:
-      - SS[.fff]
-      - MM:SS[.fff]
-      - HH:MM:SS[.fff]
+    (first, last) keyframes bounding the stream-copyable interior of [start, end],
+    or None when less than SMART_RENDER_MIN_COPY_SECONDS of it could be copied.
+    """
+    lo = bisect.bisect_left(keyframes, start - SMART_RENDER_SNAP)
+    hi = bisect.bisect_right(keyframes, end + SMART_RENDER_SNAP) - 1
+    if lo >= len(keyframes) or hi <= lo:
+        return None
+    first, last = keyframes[lo], keyframes[hi]
+    if last - first < settings.smart_render_min_copy_seconds:
+        return None
+    return first, last
+
+
+def _smart_part_args(stream: StreamInfo) -> list[str]:
+    """Stream selection, audio and timescale settings every part must share to concat cleanly."""
+    args = ["-map", "0:v:0", "-map", "0:a:0?", "-c:a", "aac", "-b:a", "128k", "-ar", "44100"]
+    _, _, timescale = (stream.time_base or "").partition("/")
+    if timescale.isdigit():
+        args += ["-video_track_timescale", timescale]
+    return args
+
+
+def _edge_stream_args(stream: StreamInfo) -> list[str] | None:
     """
-    s = ts.strip()
-    parts = s.split(':')
-    if len(parts) == 1:
-        # seconds only
+    Encoder settings that reproduce the source's profile, level, pix_fmt and
+    reference frames, or None when the source can't be matched. This only makes
+    a match possible: whether the edges' parameter sets really agree with the
+    copied GOPs' is checked on the encoded edges.
+    """
+    profile = SMART_RENDER_PROFILES.get(stream.profile)
+    if profile is None or stream.pix_fmt not in ("yuv420p", "yuvj420p") or not stream.level or not stream.refs:
+        return None
+    # Edges can't have B-frames: their negative start dts would collide with the copied GOPs
+    if stream.has_b_frames != 0:
+        return None
+    return [
+        "-profile:v", profile,
+        "-level:v", f"{stream.level / 10:.1f}",
+        "-refs", str(stream.refs),
+        "-bf", "0",
+        "-pix_fmt", stream.pix_fmt,
+    ]
+
+
+def build_edge_command(video_path: str, start: float, end: float, output_path: Path, stream: StreamInfo,
+                       keyframes: Sequence[float] | None = None, threads: int | None = None,
+                       gain_db: float | None = None) -> list[str]:
+    """Re-encode a partial GOP of a smart render with the source's codec, frame size and coding parameters."""
+    cpu_threads = threads or os.cpu_count() or 4
+    input_seek, output_offset = _seek_points(start, keyframes)
+    return [
+        "ffmpeg", "-y",
+        "-threads", str(cpu_threads),
+        "-ss", f"{input_seek:.3f}",
+        "-i", str(video_path),
+        "-ss", f"{output_offset:.3f}",
+        "-t", f"{end - start:.3f}",
+        "-c:v", SMART_RENDER_ENCODERS[stream.codec_name],
+        "-preset", "veryfast",
+        "-crf", SMART_RENDER_EDGE_CRF,
+        *_edge_stream_args(stream),
+        "-threads", str(cpu_threads),
+        *_audio_filter_args(gain_db),
+        *_smart_part_args(stream),
+        str(output_path)
+    ]
+
+
+def build_copy_command(video_path: str, first: float, last: float, output_path: Path,
+                       stream: StreamInfo, gain_db: float | None = None) -> list[str]:
+    """Stream-copy the whole GOPs from keyframe `first` up to keyframe `last` (audio is re-encoded)."""
+    return [
+        "ffmpeg", "-y",
+        # Full precision so the seek lands on `first` itself, not the keyframe before it
+        "-ss", f"{first:.6f}",
+        "-i", str(video_path),
+        "-t", f"{last - first:.6f}",
+        "-c:v", "copy",
+        *_audio_filter_args(gain_db),
+        *_smart_part_args(stream),
+        str(output_path)
+    ]
+
+
+def parse_parameter_sets(annexb: bytes) -> tuple[bytes, ...]:
+    """The SPS and PPS NAL units in an Annex B H.264 stream, in order."""
+    # A four-byte start code leaves a zero on the NAL before it; NALs never end in one
+    nals = (nal.rstrip(b"\x00") for nal in re.split(b"\x00\x00\x01", annexb))
+    return tuple(nal for nal in nals if nal and nal[0] & 0x1f in (7, 8))
+
+
+def _parameter_sets(path: Path | str) -> tuple[bytes, ...]:
+    """The parameter sets the first video frame of `path` decodes with, including the container's."""
+    cmd = [
+        "ffmpeg", "-v", "error", "-i", str(path), "-map", "0:v:0", "-c:v", "copy", "-frames:v", "1",
+        "-bsf:v", "h264_mp4toannexb", "-f", "h264", "pipe:1"
+    ]
+    return parse_parameter_sets(subprocess.run(cmd, capture_output=True, check=True).stdout)
+
+
+@lru_cache(maxsize=SMART_RENDER_UNMATCHED_MEMO)
+def _source_parameter_sets(video_path: str, mtime_ns: int) -> tuple[bytes, ...]:
+    return _parameter_sets(video_path)
+
+
+_unmatched_sources: OrderedDict[tuple[str, int], None] = OrderedDict()
+_unmatched_lock = threading.Lock()
+
+
+def _remember_unmatched(source: tuple[str, int]) -> None:
+    with _unmatched_lock:
+        _unmatched_sources[source] = None
+        _unmatched_sources.move_to_end(source)
+        while len(_unmatched_sources) > SMART_RENDER_UNMATCHED_MEMO:
+            _unmatched_sources.popitem(last=False)
+
+
+def _run_ffmpeg(cmd: list[str], job_id: str | None = None) -> None:
+    returncode, stderr, _ = run_process(cmd, job=job_registry.get(job_id))
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+
+
+def smart_render(video_path: str, start: float, end: float, output_path: Path, stream: StreamInfo,
+                 keyframes: Sequence[float], priority: str = "interactive", job_id: str | None = None,
+                 gain_db: float | None = None) -> bool:
+    """
+    Cut [start, end] keeping the source's codec and frame: only the partial GOPs
+    at the start and end are re-encoded, the GOPs in between are stream-copied,
+    and the parts are joined with the concat demuxer.
+    An mp4 keeps one set of SPS/PPS for the whole track, so the encoded edges'
+    must be byte-identical to the source's; when they aren't (or the source
+    can't be matched at all, e.g. one with B-frames) False is returned without
+    writing anything, and the clip is re-encoded whole instead. Such sources
+    are remembered so their later clips skip the attempt.
+    """
+    if stream.codec_name not in SMART_RENDER_ENCODERS:
+        return False
+    if _edge_stream_args(stream) is None:
+        logging.info(f"Edges can't match the {stream.profile} stream of {Path(video_path).name}; re-encoding the clip")
+        return False
+    source = (str(video_path), os.stat(video_path).st_mtime_ns)
+    if source in _unmatched_sources:
+        return False
+    span = smart_render_span(start, end, keyframes)
+    if span is None:
+        return False
+    first, last = span
+
+    with tempfile.TemporaryDirectory(dir=output_path.parent, prefix=f".{output_path.stem}.") as tmp:
+        parts_dir = Path(tmp)
+        edges = []
+        if first - start > SMART_RENDER_SNAP:
+            edges.append(("head", start, first))
+        if end - last > SMART_RENDER_SNAP:
+            edges.append(("tail", last, end))
+        # The edges go first: a mismatch makes the copy pointless
+        encoded: dict[str, Path] = {}
+        for name, edge_start, edge_end in edges:
+            edge = parts_dir / f"{name}.mp4"
+            encode_scheduler.run(
+                partial(build_edge_command, video_path, edge_start, edge_end, edge, stream, keyframes,
+                        gain_db=gain_db),
+                priority=priority,
+                label=f"{output_path.name} ({name})",
+                job_id=job_id,
+                duration=edge_end - edge_start,
+            )
+            if _parameter_sets(edge) != _source_parameter_sets(*source):
+                _remember_unmatched(source)
+                logging.info(f"Edge parameter sets differ from those of {Path(video_path).name}; "
+                             f"re-encoding its clips whole")
+                return False
+            encoded[name] = edge
+
+        # Copying is I/O-bound, so it doesn't take an encode slot
+        middle = parts_dir / "middle.mp4"
+        _run_ffmpeg(build_copy_command(video_path, first, last, middle, stream, gain_db), job_id)
+        parts: list[tuple[Path, float]] = []
+        if "head" in encoded:
+            parts.append((encoded["head"], first - start))
+        parts.append((middle, last - first))
+        if "tail" in encoded:
+            parts.append((encoded["tail"], end - last))
+
+        # Explicit durations: the demuxer would otherwise offset each part by its
+        # longest stream, and AAC padding makes the audio run a little long
+        list_path = parts_dir / "parts.txt"
+        list_path.write_text("".join(f"file '{path.name}'\nduration {duration:.6f}\n" for path, duration in parts))
+        _run_ffmpeg([
+            "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(list_path),
+            "-c", "copy", "-movflags", "+faststart", str(output_path)
+        ], job_id)
+
+    logging.info(f"Smart-rendered {output_path.name}: copied {last - first:.1f}s of {end - start:.1f}s")
+    return True
+
+
+def clip_with_ffmpeg_optimized(video_path: str, start: float, end: float, output_path: Path,
+                               keyframes: Sequence[float] | None = None, priority: str = "interactive",
+                               layout: str = "vertical", profile: str = "final", job_id: str | None = None) -> None:
+    """
+    Optimized FFmpeg clipping with CPU-focused performance improvements.
+    The encode waits for a slot in the process-wide encode scheduler, which
+    also decides how many threads it gets. Full-size clips in the "source"
+    layout are smart-rendered when the source allows it. The audio gets the
+    clip's loudness-normalizing gain, from the source's one-time analysis,
+    and "crop" clips pan along the subject path of the moment's saliency pass.
+    """
+    gain_db = clip_gain_db(video_path, start, end)
+    crop_path = get_crop_path(video_path, start, end, priority, job_id) if layout == "crop" else None
+    if _smart_render_applies(layout, profile):
+        media = probe(video_path)
+        if keyframes is None and media is not None and media.video:
+            found = get_keyframes(video_path)
+            keyframes = found.tolist() if found is not None else None
+        if media is not None and media.video and keyframes:
+            try:
+                if smart_render(video_path, start, end, output_path, media.video, keyframes, priority, job_id,
+                                gain_db):
+                    return
+            except (OSError, subprocess.CalledProcessError) as e:
+                logging.warning(f"Smart render of {output_path.name} failed ({e}); re-encoding the whole clip")
+                output_path.unlink(missing_ok=True)
+
+    encode_scheduler.run(
+        lambda threads: build_clip_command(video_path, start, end, output_path, keyframes, threads, layout, profile,
+                                           gain_db, crop_path),
+        priority=priority,
+        label=output_path.name,
+        job_id=job_id,
+        duration=end - start,
+    )
+
+
+def _render_record_path(clip_path: Path) -> Path:
+    return clip_path.with_name(f"{clip_path.name}.json")
+
+
+def _write_render_record(clip_path: Path, video_path: str, idx: int, start: float, end: float,
+                         description: str, layout: str, profile: str) -> None:
+    """Remember how a clip was made so it can be re-rendered with another profile."""
+    record = {
+        "source": str(video_path), "index": idx, "start": start, "end": end,
+        "description": description, "layout": layout, "profile": profile,
+    }
+    try:
+        _render_record_path(clip_path).write_text(json.dumps(record), encoding='utf-8')
+    except OSError as e:
+        logging.warning(f"Could not write render record for {clip_path}: {e}")
+
+
+def finalize_clips(clip_paths: list[str], profile: str = "final", priority: str = "interactive",
+                   job_id: str | None = None) -> list[str]:
+    """
+    Re-render clips made earlier (typically drafts) with another profile, from
+    the same source, times and layout. Renders are cached per profile, so
+    finalizing a clip twice returns the existing file.
+    Raises ValueError for paths that aren't generated clips and
+    FileNotFoundError when a clip's source is gone.
+    """
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile: {profile}")
+    clips_dir = (settings.storage_dir / 'clips').resolve()
+    records = []
+    for clip_path in clip_paths:
+        path = Path(clip_path).resolve()
+        record_path = _render_record_path(path)
+        if path.parent != clips_dir or not record_path.exists():
+            raise ValueError(f"Not a generated clip: {clip_path}")
+        record = json.loads(record_path.read_text(encoding='utf-8'))
+        if not Path(record["source"]).exists():
+            raise FileNotFoundError(f"Source video for {path.name} is no longer available")
+        records.append(record)
+    if not records:
+        return []
+
+    job = job_registry.get(job_id)
+    futures = [
+        stages["render"].submit_waiting(
+            _process_single_clip,
+            record["source"],
+            {"time_start": str(record["start"]), "time_end": str(record["end"]), "description": record["description"]},
+            record["index"], clips_dir, priority, record["layout"], profile, job_id,
+            job=job,
+        )
+        for record in records
+    ]
+    results = [future.result() for future in futures]
+    if job is not None:
+        job.check()
+    return [path for path in results if path]
+
+
+def build_preview_command(video_path: str, items: list[tuple[float, float, str, CropPath | None, Path, Path]],
+                          keyframes: Sequence[float] | None = None, threads: int | None = None) -> list[str]:
+    """
+    One FFmpeg command that writes a cover thumbnail and a scrub sprite for
+    every (start, end, layout, crop path, thumbnail path, sprite path) item.
+    Nearby items share one input-seeked decode, as in the single-pass render;
+    each clip is sampled down to its sprite's frames before its layout is
+    applied, so the filters only ever see a few dozen frames per clip.
+    """
+    cpu_threads = threads or os.cpu_count() or 4
+    tiles = SPRITE_COLUMNS * SPRITE_ROWS
+    groups = _single_pass_groups(
+        [(i, item[0], item[1], item) for i, item in enumerate(items)], settings.single_pass_max_gap_seconds
+    )
+    cmd = ["ffmpeg", "-y", "-filter_complex_threads", str(cpu_threads), "-threads", str(cpu_threads)]
+    graph = []
+    for g, group in enumerate(groups):
+        input_seek, _ = _seek_points(group[0][1], keyframes)
+        last = max(end for _, _, end, _ in group)
+        cmd += ["-ss", f"{input_seek:.3f}", "-t", f"{last - input_seek:.3f}", "-i", str(video_path)]
+        # Filter timestamps restart at 0 at each input's seek point
+        spans = {i: (start - input_seek, end - input_seek) for i, start, end, _ in group}
+        keep = "+".join(f"between(t,{s:.3f},{e:.3f})" for s, e in spans.values())
+        graph.append(f"[{g}:v]select='{keep}',split={len(group)}" + "".join(f"[p{i}]" for i in spans))
+        for i, (s, e) in spans.items():
+            _, _, layout, crop_path, _, _ = items[i]
+            # Sampled branches restart at t=0, so crop paths apply as is
+            center = crop_path.expression() if crop_path is not None else None
+            chain = layout_filter(layout, PREVIEW_PROFILE, center, tag=str(i)) or "null"
+            graph += [
+                f"[p{i}]trim=start={s:.3f}:end={e:.3f},setpts=PTS-STARTPTS,fps={tiles / max(e - s, 1e-3):.6f},"
+                f"{chain},split=2[c{i}][s{i}]",
+                # The most representative of the sampled frames
+                f"[c{i}]thumbnail={tiles}[th{i}]",
+                f"[s{i}]scale=trunc(iw/{SPRITE_COLUMNS}/2)*2:-2,tile={SPRITE_COLUMNS}x{SPRITE_ROWS}[sp{i}]",
+            ]
+    cmd += ["-filter_complex", ";".join(graph)]
+    for i, (*_, thumbnail_path, sprite_path) in enumerate(items):
+        cmd += ["-map", f"[th{i}]", "-frames:v", "1", "-q:v", "3", str(thumbnail_path)]
+        cmd += ["-map", f"[sp{i}]", "-frames:v", "1", "-q:v", "5", str(sprite_path)]
+    return cmd
+
+
+def _preview_info(clip_path: Path, start: float, end: float) -> dict:
+    thumbnail_path, sprite_path = clip_cache.preview_paths(clip_path)
+    return {
+        "thumbnail": str(thumbnail_path),
+        "sprite": str(sprite_path),
+        "columns": SPRITE_COLUMNS,
+        "rows": SPRITE_ROWS,
+        # Tile k shows the clip around k * interval seconds
+        "interval": round((end - start) / (SPRITE_COLUMNS * SPRITE_ROWS), 3),
+    }
+
+
+def generate_previews(clip_paths: Iterable[str], priority: str = "interactive",
+                      job_id: str | None = None) -> dict[str, dict]:
+    """
+    Cover thumbnail and scrub sprite of each generated clip, keyed by clip path.
+    They are cut from the clips' sources (read from the render records) in one
+    ffmpeg pass per source rather than by decoding every clip again, and cached
+    next to the clips. Clips whose previews can't be made are left out.
+    """
+    if not settings.clip_previews:
+        return {}
+    previews: dict[str, dict] = {}
+    pending: dict[str, list[tuple[Path, dict]]] = {}
+    for clip_path in clip_paths:
+        path = Path(clip_path)
         try:
-            return float(s)
-        except ValueError:
-            raise ValueError(f"Invalid time format: {ts}")
-    elif len(parts) == 2:
-        # MM:SS
-        return int(parts[0]) * 60 + float(parts[1])
-    elif len(parts) == 3:
-        # HH:MM:SS
-        return int(parts[0]) * 3600 + int(parts[1]) * 60 + float(parts[2])
-    else:
-        raise ValueError(f"Invalid time format: {ts}")
\ No newline at end of file
+            record = json.loads(_render_record_path(path).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            logging.warning(f"No render record for {path.name}; skipping its previews")
+            continue
+        if all(clip_cache.lookup(preview) for preview in clip_cache.preview_paths(path)):
+            previews[clip_path] = _preview_info(path, record["start"], record["end"])
+        else:
+            pending.setdefault(record["source"], []).append((path, record))
+
+    for source, clips in pending.items():
+        found = get_keyframes(source)
+        keyframes = found.tolist() if found is not None else None
+        items = []
+        temps: list[tuple[Path, Path]] = []
+        for path, record in clips:
+            crop_path = None
+            if record["layout"] == "crop":
+                crop_path = get_crop_path(source, record["start"], record["end"], priority, job_id)
+            thumbnail_path, sprite_path = clip_cache.preview_paths(path)
+            thumbnail_tmp, sprite_tmp = clip_cache.temp_path(thumbnail_path), clip_cache.temp_path(sprite_path)
+            temps += [(thumbnail_tmp, thumbnail_path), (sprite_tmp, sprite_path)]
+            items.append((record["start"], record["end"], record["layout"], crop_path, thumbnail_tmp, sprite_tmp))
+        try:
+            encode_scheduler.run(
+                lambda threads: build_preview_command(source, items, keyframes, threads),
+                priority=priority,
+                label=f"previews of {len(items)} clips of {Path(source).name}",
+                job_id=job_id,
+            )
+            for tmp, path in temps:
+                os.replace(tmp, path)
+            for path, record in clips:
+                previews[str(path)] = _preview_info(path, record["start"], record["end"])
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logging.warning(f"Previews of {Path(source).name} failed: {e}")
+        finally:
+            for tmp, _ in temps:
+                tmp.unlink(missing_ok=True)
+    return previews
+
+
+def _concat_params(media) -> tuple:
+    """Stream parameters that must match for clips to be joined by stream copy."""
+    video, audio = media.video, media.audio
+    return (
+        (video.codec_name, video.profile, video.pix_fmt, video.width, video.height, video.time_base)
+        if video else None,
+        (audio.codec_name, audio.sample_rate, audio.channels) if audio else None,
+    )
+
+
+def build_transition_command(previous_clip: Path, next_clip: Path, output_path: Path, duration: float,
+                             threads: int | None = None, profile: str = "final", has_audio: bool = True,
+                             stream: StreamInfo | None = None) -> list[str]:
+    """
+    Encode a `duration`-second dip to black between two clips: the last frame of
+    `previous_clip` fades out, the first frame of `next_clip` fades in, over
+    silence. It is encoded like the clips themselves so it concats with them.
+    """
+    cpu_threads = threads or os.cpu_count() or 4
+    half = duration / 2
+    graph = [
+        # tpad has to see the frame's original timing to clone it, so timestamps are reset after
+        f"[0:v]reverse,trim=end_frame=1,tpad=stop_mode=clone:stop_duration={half:.3f},"
+        f"setpts=PTS-STARTPTS,fade=t=out:d={half:.3f}[out]",
+        f"[1:v]trim=end_frame=1,tpad=stop_mode=clone:stop_duration={half:.3f},"
+        f"setpts=PTS-STARTPTS,fade=t=in:d={half:.3f}[in]",
+        "[out][in]concat=n=2:v=1:a=0[v]",
+    ]
+    maps = ["-map", "[v]"]
+    if has_audio:
+        # The previous clip's audio, muted, keeps the clips' channel layout and rate
+        graph.append(f"[0:a]volume=0,apad,atrim=duration={duration:.3f},asetpts=PTS-STARTPTS[a]")
+        maps += ["-map", "[a]"]
+    timescale = []
+    if stream is not None:
+        _, _, scale = (stream.time_base or "").partition("/")
+        if scale.isdigit():
+            timescale = ["-video_track_timescale", scale]
+    return [
+        "ffmpeg", "-y",
+        "-threads", str(cpu_threads),
+        # Only the end of the previous clip is decoded for its last frame
+        "-sseof", "-0.25", "-i", str(previous_clip),
+        "-t", "0.25", "-i", str(next_clip),
+        "-filter_complex", ";".join(graph),
+        *maps,
+        "-t", f"{duration:.3f}",
+        *_encode_args(cpu_threads, profile),
+        *timescale,
+        str(output_path)
+    ]
+
+
+def compile_reel(clip_paths: list[str], transition: float = 0.0, priority: str = "interactive",
+                 job_id: str | None = None) -> str:
+    """
+    Join generated clips, in order, into one reel without re-encoding them: the
+    concat demuxer stream-copies every clip, and only the optional `transition`
+    (seconds of dip to black at each join) is encoded. Reels are cached like clips.
+    Raises ValueError for paths that aren't generated clips, clips whose
+    codec parameters differ (e.g. different profiles or layouts) and
+    transitions between smart-rendered clips, whose parameters are the
+    sources' rather than the profile's, and FileNotFoundError for clips that are gone.
+    """
+    clips_dir = (settings.storage_dir / 'clips').resolve()
+    clips: list[tuple[Path, dict]] = []
+    for clip_path in clip_paths:
+        path = Path(clip_path).resolve()
+        record_path = _render_record_path(path)
+        if path.parent != clips_dir or not record_path.exists():
+            raise ValueError(f"Not a generated clip: {clip_path}")
+        if not path.exists():
+            raise FileNotFoundError(f"Clip {path.name} is no longer available")
+        clips.append((path, json.loads(record_path.read_text(encoding='utf-8'))))
+    if not clips:
+        raise ValueError("No clips to compile")
+
+    # Same profile and layout means the same encode settings and frame; probing
+    # also catches what those don't pin down, like the sources' audio channels
+    first_path, first_record = clips[0]
+    media = [probe(path) for path, _ in clips]
+    for (path, record), info in zip(clips[1:], media[1:]):
+        if (record["profile"], record["layout"]) != (first_record["profile"], first_record["layout"]):
+            raise ValueError(f"{path.name} and {first_path.name} have different profiles or layouts")
+        if info is not None and media[0] is not None and _concat_params(info) != _concat_params(media[0]):
+            raise ValueError(f"{path.name} and {first_path.name} have different codec parameters")
+    if transition > 0 and _smart_render_applies(first_record["layout"], first_record["profile"]):
+        raise ValueError("Transitions can't be joined to smart-rendered source clips; use transition=0")
+
+    reel_path = clip_cache.clip_path(clip_cache.reel_key([path for path, _ in clips], transition), clips_dir)
+    # The reel and the clips it is copied from stay put while it is compiled and returned
+    clip_cache.pin([reel_path] + [path for path, _ in clips], job_id)
+    with clip_cache.locked([reel_path]):
+        if clip_cache.lookup(reel_path):
+            logging.info(f"Reel {reel_path.name} is cached")
+            return str(reel_path)
+        with tempfile.TemporaryDirectory(dir=clips_dir, prefix=f".{reel_path.stem}.") as tmp:
+            parts_dir = Path(tmp)
+            parts = [first_path]
+            has_audio = media[0].has_audio if media[0] is not None else True
+            stream = media[0].video if media[0] is not None else None
+            for i, (path, _) in enumerate(clips[1:], start=1):
+                if transition > 0:
+                    joint = parts_dir / f"transition{i}.mp4"
+                    encode_scheduler.run(
+                        lambda threads: build_transition_command(clips[i - 1][0], path, joint, transition, threads,
+                                                                 first_record["profile"], has_audio, stream),
+                        priority=priority,
+                        label=f"{reel_path.name} (transition {i})",
+                        job_id=job_id,
+                        duration=transition,
+                    )
+                    # Held to the same check as the clips, so a mismatch fails here and not in the player
+                    joint_media = probe(joint)
+                    if joint_media is not None and media[0] is not None and (
+                            _concat_params(joint_media) != _concat_params(media[0])):
+                        raise ValueError(f"Transition {i} doesn't match the codec parameters of {first_path.name}")
+                    parts.append(joint)
+                parts.append(path)
+
+            # Encoded clips end on a whole frame past their cut, so each part keeps its
+            # own duration: a few ms of AAC padding at a join beats colliding timestamps
+            list_path = parts_dir / "parts.txt"
+            list_path.write_text("".join(f"file '{path}'\n" for path in parts))
+            with clip_cache.write_atomically(reel_path) as tmp_reel:
+                # Copying is I/O-bound, so it doesn't take an encode slot
+                _run_ffmpeg([
+                    "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(list_path),
+                    "-c", "copy", "-movflags", "+faststart", str(tmp_reel)
+                ], job_id)
+    logging.info(f"Compiled {len(clips)} clips into {reel_path.name}")
+    clip_cache.evict()
+    return str(reel_path)
+
+
+def clip_with_ffmpeg(video_path: str, start: float, end: float, output_path: Path) -> None:
+    """Legacy FFmpeg function - kept for compatibility but uses optimized version."""
+    clip_with_ffmpeg_optimized(video_path, start, end, output_path)
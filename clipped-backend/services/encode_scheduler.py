@@ -0,0 +1,298 @@
+import os
+import time
+import signal
+import heapq
+import itertools
+import threading
+import subprocess
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+from config import settings
+from services.job_registry import EncodeProgress, Job, JobCancelled, job_registry
+
+PRIORITIES = ("interactive", "batch")
+
+
+class EncodeQueueFull(Exception):
+    """Raised when an encode is refused because the scheduler's queue is full."""
+
+
+class EncodeTimeout(Exception):
+    """Raised when an encode was killed for running too long or no longer making progress."""
+
+
+@dataclass
+class EncodeStats:
+    label: str
+    priority: str
+    threads: int
+    queued_seconds: float
+    wall_seconds: float
+    cpu_seconds: float | None
+
+
+def _is_ffmpeg(cmd: list[str]) -> bool:
+    return bool(cmd) and os.path.basename(cmd[0]).startswith("ffmpeg")
+
+
+def _read_progress(stream, progress: EncodeProgress) -> None:
+    # -progress writes key=value lines in blocks, each closed by progress=continue|end
+    fields: dict[str, str] = {}
+    for line in stream:
+        key, _, value = line.strip().partition("=")
+        fields[key] = value
+        if key == "progress":
+            progress.update(fields)
+            fields = {}
+
+
+def _reap(proc: subprocess.Popen) -> tuple[int | None, float | None]:
+    """Non-blocking wait: (exit code, or None while running; child CPU seconds when measurable)."""
+    if hasattr(os, "wait4"):
+        # wait4 reports the rusage of exactly this child, unlike RUSAGE_CHILDREN
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        if pid == 0:
+            return None, None
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return proc.returncode, rusage.ru_utime + rusage.ru_stime
+    return proc.poll(), None
+
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    try:
+        if hasattr(os, "killpg"):
+            # ffmpeg runs in its own session, so this takes any helpers it spawned too
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_process(cmd: list[str], progress: EncodeProgress | None = None, job: Job | None = None,
+                timeout: float | None = None, stall_timeout: float | None = None) -> tuple[int, str, float | None]:
+    """
+    Run a command in its own process group and return (returncode, stderr,
+    child CPU seconds when measurable). With `progress`, ffmpeg's -progress
+    output keeps it up to date. The whole group is killed when the job is
+    cancelled (raising JobCancelled), or when the command runs past `timeout`
+    seconds or its progress stalls for `stall_timeout` seconds (raising EncodeTimeout).
+    """
+    # Only ffmpeg reports progress; other commands are just watched for cancellation
+    watch = progress is not None and _is_ffmpeg(cmd)
+    if watch:
+        cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE if watch else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+    )
+    # Both pipes are drained on their own threads so neither can fill up and block ffmpeg
+    stderr_chunks: list[str] = []
+    readers = [threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)]
+    if progress is not None:
+        progress.start()
+    if watch:
+        readers.append(threading.Thread(target=_read_progress, args=(proc.stdout, progress), daemon=True))
+    for reader in readers:
+        reader.start()
+
+    started = time.monotonic()
+    reason = None
+    cancelled = False
+    interval = 0.005
+    while True:
+        returncode, cpu = _reap(proc)
+        if returncode is not None:
+            break
+        now = time.monotonic()
+        if reason is None:
+            if job is not None and job.cancelled.is_set():
+                reason, cancelled = job.cancel_reason or "cancelled", True
+            elif timeout is not None and now - started > timeout:
+                reason = f"timed out after {timeout:.0f}s"
+            elif stall_timeout is not None and watch and now - progress.advanced > stall_timeout:
+                reason = f"stalled for {stall_timeout:.0f}s"
+            if reason is not None:
+                _kill_group(proc)
+        # Poll quickly at first so short commands return promptly, then back off;
+        # a cancellation wakes the wait early
+        if job is not None and reason is None:
+            job.cancelled.wait(interval)
+        else:
+            time.sleep(interval)
+        interval = min(interval * 2, 0.1)
+
+    for reader in readers:
+        reader.join()
+    for stream in (proc.stdout, proc.stderr):
+        if stream is not None:
+            stream.close()
+    if cancelled:
+        raise JobCancelled(reason)
+    if reason is not None:
+        raise EncodeTimeout(reason)
+    return returncode, "".join(stderr_chunks), cpu
+
+
+class EncodeScheduler:
+    """
+    Process-wide admission control for ffmpeg encodes.
+
+    At most `max_concurrent` encodes run at once across all jobs; the rest
+    wait in a priority queue (interactive ahead of batch, FIFO within a lane)
+    and are refused outright once `max_queued` are waiting. Each encode is
+    started with its share of the core budget among the encodes running at
+    that moment, capped at the threads the others have left, so concurrent
+    jobs share the CPU instead of each assuming it has every core.
+
+    Encodes run on behalf of a job get live progress in the job registry and
+    are killed when the job is cancelled. Any encode is killed after
+    `timeout` seconds, or once its output stops advancing for `stall_timeout`.
+    """
+
+    def __init__(self, core_budget: int, max_concurrent: int, max_queued: int,
+                 timeout: float | None = None, stall_timeout: float | None = None):
+        self.core_budget = max(1, core_budget)
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self._cond = threading.Condition()
+        self._queue: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._threads_in_use = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._rejected = 0
+        self._recent: deque[EncodeStats] = deque(maxlen=100)
+
+    def threads_for(self, running: int, in_use: int = 0) -> int:
+        """
+        Threads for one encode when `running` encodes (including it) share the
+        budget and `in_use` threads are already held by the others: its even
+        share, but never more than is left (and always at least one).
+        """
+        share = self.core_budget // max(1, running)
+        return max(1, min(share, self.core_budget - in_use))
+
+    def _admit(self, priority: str, job: Job | None = None) -> tuple[int, float]:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        enqueued = time.monotonic()
+        with self._cond:
+            if len(self._queue) >= self.max_queued:
+                self._rejected += 1
+                raise EncodeQueueFull(f"Encode queue full ({len(self._queue)} waiting)")
+            ticket = (PRIORITIES.index(priority), next(self._seq))
+            heapq.heappush(self._queue, ticket)
+            while self._queue[0] != ticket or self._running >= self.max_concurrent:
+                if job is not None and job.cancelled.is_set():
+                    # Give up the place in the queue; the encodes behind may now be admissible
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._cancelled += 1
+                    self._cond.notify_all()
+                    job.check()
+                # Cancellation doesn't notify the condition, so waiters with a job poll for it
+                self._cond.wait(0.25 if job is not None else None)
+            heapq.heappop(self._queue)
+            self._running += 1
+            # Encodes admitted earlier keep the larger shares they started with
+            threads = self.threads_for(self._running, self._threads_in_use)
+            self._threads_in_use += threads
+            # The next queued encode may be admissible too
+            self._cond.notify_all()
+        return threads, time.monotonic() - enqueued
+
+    def _finish(self, threads: int, stats: EncodeStats | None, cancelled: bool = False) -> None:
+        with self._cond:
+            self._running -= 1
+            self._threads_in_use -= threads
+            if cancelled:
+                self._cancelled += 1
+            elif stats is None:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._recent.append(stats)
+            self._cond.notify_all()
+
+    def run(self, build_cmd: Callable[[int], list[str]], priority: str = "interactive",
+            label: str = "", job_id: str | None = None, duration: float | None = None) -> EncodeStats:
+        """
+        Wait for an encode slot, then run build_cmd(threads) and measure it.
+        `duration` (seconds of media the encode outputs) lets the job's progress report an ETA.
+        Raises EncodeQueueFull when refused, CalledProcessError when the command fails,
+        JobCancelled when the job is cancelled and EncodeTimeout when the encode was killed
+        for running too long.
+        """
+        job = job_registry.get(job_id)
+        progress = EncodeProgress(label, duration)
+        if job is not None:
+            job.check()
+            job.encodes.append(progress)
+        try:
+            threads, queued = self._admit(priority, job)
+        except Exception:
+            progress.finish("cancelled" if job is not None and job.cancelled.is_set() else "failed")
+            raise
+        stats = None
+        cancelled = False
+        try:
+            cmd = build_cmd(threads)
+            started = time.monotonic()
+            try:
+                returncode, stderr, cpu = run_process(cmd, progress, job, self.timeout, self.stall_timeout)
+            except (JobCancelled, EncodeTimeout) as e:
+                cancelled = isinstance(e, JobCancelled)
+                logging.warning(f"Killed encode {label}: {e}")
+                raise
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+            if stderr and "error" in stderr.lower():
+                logging.warning(f"FFmpeg warning for {label}: {stderr}")
+            stats = EncodeStats(label, priority, threads, queued, time.monotonic() - started, cpu)
+            cpu_note = f", cpu {cpu:.1f}s" if cpu is not None else ""
+            logging.info(f"Encoded {label} with {threads} threads in {stats.wall_seconds:.1f}s{cpu_note} (queued {queued:.1f}s)")
+            return stats
+        finally:
+            progress.finish("done" if stats is not None else "cancelled" if cancelled else "failed")
+            self._finish(threads, stats, cancelled)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            recent = list(self._recent)
+            queued = {p: sum(1 for rank, _ in self._queue if rank == i) for i, p in enumerate(PRIORITIES)}
+            cpu_samples = [s.cpu_seconds for s in recent if s.cpu_seconds is not None]
+            return {
+                "core_budget": self.core_budget,
+                "max_concurrent": self.max_concurrent,
+                "running": self._running,
+                "threads_in_use": self._threads_in_use,
+                "queued": queued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "rejected": self._rejected,
+                "recent_wall_avg_seconds": sum(s.wall_seconds for s in recent) / len(recent) if recent else 0.0,
+                "recent_cpu_avg_seconds": sum(cpu_samples) / len(cpu_samples) if cpu_samples else 0.0,
+                "recent_queue_avg_seconds": sum(s.queued_seconds for s in recent) / len(recent) if recent else 0.0,
+            }
+
+
+_core_budget = settings.encode_core_budget or os.cpu_count() or 4
+encode_scheduler = EncodeScheduler(
+    core_budget=_core_budget,
+    max_concurrent=settings.encode_max_concurrent or max(1, _core_budget // 2),
+    max_queued=settings.encode_max_queued,
+    timeout=settings.encode_timeout_seconds,
+    stall_timeout=settings.encode_stall_seconds,
+)
@@ -0,0 +1,273 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable
+
+ENCODE_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work once the job is cancelled (by a client, a timeout or a disconnect)."""
+
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+@dataclass
+class EncodeProgress:
+    """Live progress of one ffmpeg encode, fed by its `-progress` output."""
+    label: str
+    # Media seconds the encode will output, for the percentage and ETA
+    duration: float | None = None
+    state: str = "queued"
+    frame: int = 0
+    fps: float = 0.0
+    speed: float | None = None
+    out_seconds: float = 0.0
+    started: float | None = None
+    # Last time the output actually advanced (monotonic), for stall detection
+    advanced: float | None = None
+    finished: float | None = None
+
+    def start(self) -> None:
+        self.state = "running"
+        self.started = self.advanced = time.monotonic()
+
+    def finish(self, state: str) -> None:
+        self.state = state
+        self.finished = time.monotonic()
+
+    def update(self, fields: dict[str, str]) -> None:
+        """Apply one block of ffmpeg -progress key=value pairs."""
+        frame = _to_int(fields.get("frame"))
+        # out_time_us is microseconds; out_time_ms is too, despite its name
+        out_us = _to_int(fields.get("out_time_us", fields.get("out_time_ms")))
+        out_seconds = out_us / 1e6 if out_us is not None and out_us >= 0 else None
+        if (frame is not None and frame > self.frame) or (out_seconds is not None and out_seconds > self.out_seconds):
+            self.advanced = time.monotonic()
+        if frame is not None:
+            self.frame = frame
+        if out_seconds is not None:
+            self.out_seconds = out_seconds
+        self.fps = _to_float(fields.get("fps")) or self.fps
+        self.speed = _to_float(fields.get("speed", "").rstrip("x")) or self.speed
+
+    @property
+    def elapsed_seconds(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def percent(self) -> float | None:
+        if self.state == "done":
+            return 100.0
+        if not self.duration:
+            return None
+        return min(100.0, 100.0 * self.out_seconds / self.duration)
+
+    @property
+    def eta_seconds(self) -> float | None:
+        """Remaining wall time at the encode's speed so far; None until it is known."""
+        if self.state != "running" or not self.duration or self.out_seconds <= 0:
+            return None
+        rate = self.speed or self.out_seconds / max(self.elapsed_seconds, 1e-6)
+        return max(0.0, self.duration - self.out_seconds) / rate
+
+    def snapshot(self) -> dict:
+        return {
+            "label": self.label,
+            "state": self.state,
+            "frame": self.frame,
+            "fps": self.fps,
+            "speed": self.speed,
+            "out_seconds": self.out_seconds,
+            "duration": self.duration,
+            "percent": self.percent,
+            "eta_seconds": self.eta_seconds,
+            "elapsed_seconds": self.elapsed_seconds,
+        }
+
+
+@dataclass
+class StageTiming:
+    """When one pipeline stage of a job ran, in seconds since the job started."""
+    name: str
+    started: float
+    finished: float | None = None
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "started_seconds": self.started,
+            "finished_seconds": self.finished,
+            "seconds": None if self.finished is None else self.finished - self.started,
+        }
+
+
+@dataclass
+class Job:
+    job_id: str
+    state: str = "running"
+    cancel_reason: str | None = None
+    created: float = field(default_factory=time.monotonic)
+    finished: float | None = None
+    encodes: list[EncodeProgress] = field(default_factory=list)
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    # Stage spans, so overlapping stages (analysis streaming into clipping) show as such
+    stages: list[StageTiming] = field(default_factory=list)
+    # First occurrences of notable events (first moment, first clip), seconds since the job started
+    milestones: dict[str, float] = field(default_factory=dict)
+    # Stages skipped because a checkpoint of their output was still valid
+    reused: list[str] = field(default_factory=list)
+    # Receives every progress event, e.g. to stream them to the client; called from any thread
+    listener: Callable[[dict], None] | None = None
+
+    def _now(self) -> float:
+        return time.monotonic() - self.created
+
+    def notify(self, event: dict) -> None:
+        """Pass a progress event to the listener, stamped with the job's elapsed time."""
+        if self.listener is None:
+            return
+        try:
+            self.listener({**event, "at_seconds": round(self._now(), 3)})
+        except Exception as e:
+            logging.warning(f"Job {self.job_id} listener failed: {e}")
+
+    def begin_stage(self, name: str) -> None:
+        self.stages.append(StageTiming(name, self._now()))
+        self.notify({"event": "stage", "stage": name, "state": "started"})
+
+    def end_stage(self, name: str) -> None:
+        for timing in reversed(self.stages):
+            if timing.name == name and timing.finished is None:
+                timing.finished = self._now()
+                self.notify({"event": "stage", "stage": name, "state": "finished"})
+                return
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the block as stage `name` (recorded even when it fails)."""
+        self.begin_stage(name)
+        try:
+            yield
+        finally:
+            self.end_stage(name)
+
+    def reuse_stage(self, name: str) -> None:
+        self.reused.append(name)
+        self.notify({"event": "stage", "stage": name, "state": "reused"})
+
+    def milestone(self, name: str) -> None:
+        """Record the first time `name` happens; later occurrences are ignored."""
+        self.milestones.setdefault(name, self._now())
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self.cancelled.is_set():
+            self.cancel_reason = reason
+            self.cancelled.set()
+
+    def check(self) -> None:
+        """Raise JobCancelled if the job has been cancelled."""
+        if self.cancelled.is_set():
+            raise JobCancelled(self.cancel_reason or "cancelled")
+
+    def snapshot(self) -> dict:
+        encodes = list(self.encodes)
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "cancel_reason": self.cancel_reason,
+            "elapsed_seconds": (self.finished or time.monotonic()) - self.created,
+            "encodes": [encode.snapshot() for encode in encodes],
+            "stages": [timing.snapshot() for timing in list(self.stages)],
+            "milestones": dict(self.milestones),
+            "reused": list(self.reused),
+        }
+
+
+class JobRegistry:
+    """
+    Jobs in flight, so their encodes can be watched and cancelled from other
+    requests. Finished jobs are kept (up to `max_finished`) so clients can
+    read the outcome after the fact.
+    """
+
+    def __init__(self, max_finished: int = 100):
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+
+    def start(self, job_id: str) -> Job:
+        """Register a running job; raises ValueError if a job with this id is still running."""
+        with self._lock:
+            existing = self._jobs.get(job_id)
+            if existing is not None and existing.state == "running":
+                raise ValueError(f"Job {job_id} is already running")
+            job = Job(job_id)
+            self._jobs[job_id] = job
+            self._jobs.move_to_end(job_id)
+            return job
+
+    def get(self, job_id: str | None) -> Job | None:
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str, reason: str = "cancelled") -> bool:
+        """Cancel a running job; its encodes are killed. False if it isn't running."""
+        job = self.get(job_id)
+        if job is None or job.state != "running":
+            return False
+        logging.info(f"Cancelling job {job_id}: {reason}")
+        job.cancel(reason)
+        return True
+
+    def finish(self, job_id: str, state: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.state = state
+                job.finished = time.monotonic()
+            finished = [j for j, job in self._jobs.items() if job.state != "running"]
+            for stale in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[stale]
+
+    @contextmanager
+    def track(self, job_id: str):
+        """Register the job for the duration of the block and record how it ended."""
+        job = self.start(job_id)
+        failed = True
+        try:
+            yield job
+            failed = False
+        finally:
+            state = "cancelled" if job.cancelled.is_set() else "failed" if failed else "done"
+            self.finish(job_id, state)
+
+
+def _to_int(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+job_registry = JobRegistry()
@@ -0,0 +1,234 @@
+import time
+import threading
+import itertools
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from config import settings
+
+PRIORITIES = ("interactive", "batch")
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, capacity: float, rate: float, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._stamp = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def try_take(self, amount: float) -> float:
+        """Take `amount` tokens if available; otherwise return the seconds until they will be."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            self._tokens -= amount
+            return 0.0
+        return (amount - self._tokens) / self.rate
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` tokens will be available, without taking them."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self._tokens) / self.rate)
+
+    def adjust(self, delta: float) -> None:
+        """Give back (positive) or charge (negative) tokens after the fact; may go into debt."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + delta)
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after the provider reported a rate limit anyway."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+
+@dataclass
+class Reservation:
+    job_id: str
+    priority: str
+    cost: int
+    enqueued_at: float
+    seq: int
+    granted_at: float | None = None
+    actual_tokens: int | None = None
+
+    def settle(self, actual_tokens: int) -> None:
+        """Record the tokens the call really used so the bucket can be corrected."""
+        self.actual_tokens = actual_tokens
+
+
+@dataclass
+class _LaneStats:
+    granted: int = 0
+    tokens: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    recent_waits: deque = field(default_factory=lambda: deque(maxlen=100))
+
+
+class LLMScheduler:
+    """
+    Process-wide scheduler for LLM calls.
+
+    Every call reserves its estimated token cost from a token bucket sized to
+    the provider's tokens-per-minute quota before it is sent. Waiting calls are
+    queued per priority lane (interactive ahead of batch, with batch calls
+    promoted once they have waited too long) and served round-robin across
+    jobs within a lane, so one large job can't starve the others.
+    """
+
+    def __init__(self, tokens_per_minute: int, batch_max_wait: float = 120.0, clock=time.monotonic):
+        self._clock = clock
+        self._bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0, clock)
+        self._batch_max_wait = batch_max_wait
+        self._cond = threading.Condition()
+        self._lanes: dict[str, OrderedDict[str, deque[Reservation]]] = {p: OrderedDict() for p in PRIORITIES}
+        self._seq = itertools.count()
+        self._stats = {p: _LaneStats() for p in PRIORITIES}
+        self._rate_limited = 0
+        # Rate-limited calls waiting to be resent; they are served before any queued call
+        self._retrying = 0
+
+    def _enqueue(self, reservation: Reservation) -> None:
+        lane = self._lanes[reservation.priority]
+        lane.setdefault(reservation.job_id, deque()).append(reservation)
+
+    def _next(self) -> Reservation | None:
+        """Head of the queue: oldest job turn in the highest-priority lane."""
+        batch = self._lanes["batch"]
+        if batch:
+            head = next(iter(batch.values()))[0]
+            if self._clock() - head.enqueued_at >= self._batch_max_wait:
+                return head
+        for priority in PRIORITIES:
+            lane = self._lanes[priority]
+            if lane:
+                return next(iter(lane.values()))[0]
+        return None
+
+    def _until_promotion(self) -> float | None:
+        """Seconds until the head of the batch lane is promoted, or None if there is nothing to promote."""
+        batch = self._lanes["batch"]
+        if not batch:
+            return None
+        left = next(iter(batch.values()))[0].enqueued_at + self._batch_max_wait - self._clock()
+        return left if left > 0 else None
+
+    def _dequeue(self, reservation: Reservation) -> None:
+        lane = self._lanes[reservation.priority]
+        queue = lane.pop(reservation.job_id)
+        queue.popleft()
+        if queue:
+            # Job goes to the back of its lane: round-robin across jobs
+            lane[reservation.job_id] = queue
+
+    def acquire(self, cost: int, job_id: str, priority: str = "interactive") -> Reservation:
+        """Block until `cost` tokens are granted to this call."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        with self._cond:
+            reservation = Reservation(job_id, priority, cost, self._clock(), next(self._seq))
+            self._enqueue(reservation)
+            self._cond.notify_all()
+            while True:
+                if self._next() is reservation and not self._retrying:
+                    wait = self._bucket.try_take(cost)
+                    if wait == 0.0:
+                        break
+                    self._cond.wait(timeout=wait)
+                else:
+                    # A batch call becoming head by waiting long enough notifies nobody,
+                    # so wake up when that happens and look again (retries notify when done)
+                    self._cond.wait(timeout=self._until_promotion())
+            self._dequeue(reservation)
+            reservation.granted_at = self._clock()
+            self._record(reservation)
+            self._cond.notify_all()
+        return reservation
+
+    def retry(self, reservation: Reservation) -> None:
+        """
+        Hold a call the provider rate limited until the bucket refills, then charge
+        its cost again: the drain wiped the first charge. Retries go ahead of the
+        queued calls, so the refilled tokens aren't spent twice.
+        """
+        with self._cond:
+            self._retrying += 1
+            try:
+                while (wait := self._bucket.try_take(reservation.cost)) > 0:
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._retrying -= 1
+                self._cond.notify_all()
+
+    def release(self, reservation: Reservation) -> None:
+        """Correct the bucket with the call's actual usage, if it was reported."""
+        if reservation.actual_tokens is None:
+            return
+        with self._cond:
+            self._bucket.adjust(reservation.cost - reservation.actual_tokens)
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, cost: int, job_id: str, priority: str = "interactive"):
+        reservation = self.acquire(cost, job_id, priority)
+        try:
+            yield reservation
+        finally:
+            self.release(reservation)
+
+    def report_rate_limited(self) -> None:
+        """The provider rejected a call: stop granting until the bucket refills."""
+        with self._cond:
+            self._rate_limited += 1
+            self._bucket.drain()
+        logging.warning("LLM provider rate limit hit; draining token bucket")
+
+    def _record(self, reservation: Reservation) -> None:
+        waited = reservation.granted_at - reservation.enqueued_at
+        stats = self._stats[reservation.priority]
+        stats.granted += 1
+        stats.tokens += reservation.cost
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+        stats.recent_waits.append(waited)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            lanes = {}
+            for priority in PRIORITIES:
+                stats = self._stats[priority]
+                recent = stats.recent_waits
+                lanes[priority] = {
+                    "queue_depth": sum(len(q) for q in self._lanes[priority].values()),
+                    "queued_jobs": len(self._lanes[priority]),
+                    "granted": stats.granted,
+                    "tokens_granted": stats.tokens,
+                    "wait_avg_seconds": stats.wait_total / stats.granted if stats.granted else 0.0,
+                    "wait_recent_avg_seconds": sum(recent) / len(recent) if recent else 0.0,
+                    "wait_max_seconds": stats.wait_max,
+                }
+            return {
+                "tokens_per_minute": int(self._bucket.capacity),
+                "tokens_available": int(self._bucket.tokens),
+                "rate_limited": self._rate_limited,
+                "lanes": lanes,
+            }
+
+
+llm_scheduler = LLMScheduler(settings.llm_tokens_per_minute, settings.llm_batch_max_wait_seconds)
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from config import settings
+from services import clip_cache
+
+# Bump when the manifest or artifact layout changes; older records are then ignored
+MANIFEST_VERSION = 2
+
+
+def jobs_dir() -> Path:
+    return settings.storage_dir / 'jobs'
+
+
+def artifacts_dir() -> Path:
+    return settings.storage_dir / 'artifacts'
+
+
+def content_hash(path: str | Path) -> str:
+    """Identity of a file's content (see clip_cache.source_id); whole-file for small files."""
+    return clip_cache.source_id(path)
+
+
+def node_key(stage: str, inputs: dict) -> str:
+    """Key of a stage's output: a hash of the stage and everything it was computed from."""
+    params = {"version": MANIFEST_VERSION, "stage": stage, "inputs": inputs}
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def _write_json(path: Path, data) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename so a crash mid-write leaves the previous version intact
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(json.dumps(data))
+    os.replace(tmp_path, path)
+
+
+class JobManifest:
+    """
+    A job's work as a small dependency graph of artifacts. Each stage's output
+    is a node stored under artifacts/<stage>/<key>, keyed by the stage's inputs
+    (source content, model, prompt hash, render settings, upstream node content),
+    so any job - a resumed one, or a re-run of the same video after tuning the
+    prompt - recomputes only the nodes whose inputs changed or whose files are
+    gone. The job's own manifest records which node each of its stages used;
+    it is only written for a `resumable` job (one whose id the caller chose).
+    """
+
+    def __init__(self, job_id: str, url: str, stages: dict | None = None, resumable: bool = True):
+        self.job_id = job_id
+        self.url = url
+        self.stages: dict[str, dict] = stages or {}
+        self.resumable = resumable
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return jobs_dir() / self.job_id / 'manifest.json'
+
+    @classmethod
+    def open(cls, job_id: str, url: str, resumable: bool = True) -> "JobManifest":
+        """The job's manifest, or a fresh one if there is none (or it was for another URL)."""
+        manifest = cls(job_id, url, resumable=resumable)
+        if not resumable:
+            return manifest
+        try:
+            data = json.loads(manifest.path.read_text())
+        except FileNotFoundError:
+            return manifest
+        except (OSError, ValueError) as e:
+            logging.warning(f"Discarding unreadable manifest of job {job_id}: {e}")
+            return manifest
+        if data.get("version") != MANIFEST_VERSION or data.get("url") != url:
+            logging.info(f"Manifest of job {job_id} is for another request, starting over")
+            return manifest
+        return cls(job_id, url, data.get("stages") or {})
+
+    def discard(self) -> None:
+        """Remove the job's manifest, e.g. once the job has completed; its nodes stay for other jobs."""
+        shutil.rmtree(self.path.parent, ignore_errors=True)
+
+    def completed(self, stage: str, inputs: dict) -> dict | None:
+        """
+        Outputs of `stage` if some job already computed it from these same inputs
+        and every file it produced still has its recorded content; None when it
+        has to run (again).
+        """
+        key = node_key(stage, inputs)
+        try:
+            node = json.loads((artifacts_dir() / stage / f"{key}.json").read_text())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Discarding unreadable {stage} artifact {key}: {e}")
+            return None
+        for path, digest in node["hashes"].items():
+            try:
+                if content_hash(path) == digest:
+                    continue
+            except OSError:
+                pass
+            logging.info(f"Job {self.job_id}: {stage} output {path} is missing or changed, redoing {stage}")
+            return None
+        self._note(stage, key, reused=True)
+        return node["outputs"]
+
+    def record(self, stage: str, inputs: dict, outputs: dict, files: list[str | Path] = ()) -> None:
+        """Store a computed node; `files` are the produced files whose content is verified on reuse."""
+        key = node_key(stage, inputs)
+        node = {
+            "stage": stage,
+            "inputs": inputs,
+            "outputs": outputs,
+            "hashes": {str(path): content_hash(path) for path in files},
+            "finished_at": time.time(),
+        }
+        _write_json(artifacts_dir() / stage / f"{key}.json", node)
+        self._note(stage, key, reused=False)
+
+    def artifact_path(self, stage: str, inputs: dict, suffix: str) -> Path:
+        """Where a node keeps a file of its own (e.g. a transcript), so it outlives the temp-file cleanup."""
+        path = artifacts_dir() / stage / f"{node_key(stage, inputs)}.out{suffix}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def keep(self, stage: str, inputs: dict, path: str | Path) -> Path:
+        """Copy a small artifact into the node's storage and return the copy."""
+        target = self.artifact_path(stage, inputs, Path(path).suffix)
+        if Path(path).resolve() != target.resolve():
+            with clip_cache.write_atomically(target) as tmp:
+                shutil.copyfile(path, tmp)
+        return target
+
+    def write_json(self, stage: str, inputs: dict, data) -> Path:
+        """Write a JSON artifact into the node's storage."""
+        target = self.artifact_path(stage, inputs, ".json")
+        with clip_cache.write_atomically(target) as tmp:
+            tmp.write_text(json.dumps(data))
+        return target
+
+    def _note(self, stage: str, key: str, reused: bool) -> None:
+        with self._lock:
+            self.stages[stage] = {"key": key, "reused": reused, "at": time.time()}
+            if not self.resumable:
+                return
+            _write_json(self.path, {"version": MANIFEST_VERSION, "job_id": self.job_id, "url": self.url,
+                                    "stages": self.stages})
+
+
+def prune_jobs(max_age: float) -> None:
+    """Remove the manifests of jobs (failed or abandoned, never resumed) last updated over max_age seconds ago."""
+    cutoff = time.time() - max_age
+    if not jobs_dir().is_dir():
+        return
+    for job_dir in jobs_dir().iterdir():
+        try:
+            if (job_dir / 'manifest.json').stat().st_mtime >= cutoff:
+                continue
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not check manifest of job {job_dir.name}: {e}")
+            continue
+        logging.info(f"Removing stale manifest of job {job_dir.name}")
+        shutil.rmtree(job_dir, ignore_errors=True)
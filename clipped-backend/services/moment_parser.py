@@ -0,0 +1,117 @@
+import re
+import json
+
+
+class MomentStreamParser:
+    """
+    Incremental parser for a streamed LLM reply of the form
+    `{"viral_moments": [{...}, {...}]}`.
+
+    feed() takes each text delta as it arrives and returns the moment objects
+    that became complete with it, so callers can act on a moment before the
+    rest of the reply has been generated. Any `<think>...</think>` reasoning
+    block ahead of the JSON is skipped.
+    """
+
+    _KEY_RE = re.compile(r'"viral_moments"\s*:\s*\[')
+    # Longest prefix of a key match that can straddle two deltas
+    _KEY_OVERLAP = 64
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._obj_start: int | None = None
+        self._reasoning: bool | None = None
+        self.emitted = 0
+
+    @property
+    def done(self) -> bool:
+        """True once the closing `]` of the moments array has been seen."""
+        return self._done
+
+    def _find_array(self) -> bool:
+        if self._reasoning is None:
+            head = self._buf.lstrip()
+            if len(head) < len("<think>") and "<think>".startswith(head):
+                return False
+            self._reasoning = head.startswith("<think>")
+        if self._reasoning:
+            think_end = self._buf.find("</think>", self._pos)
+            if think_end == -1:
+                self._pos = max(self._pos, len(self._buf) - len("</think>"))
+                return False
+            self._pos = think_end + len("</think>")
+            self._reasoning = False
+        match = self._KEY_RE.search(self._buf, self._pos)
+        if not match:
+            self._pos = max(self._pos, len(self._buf) - self._KEY_OVERLAP)
+            return False
+        self._in_array = True
+        self._pos = match.end()
+        return True
+
+    def feed(self, text: str) -> list[dict]:
+        self._buf += text
+        moments: list[dict] = []
+        if self._done or (not self._in_array and not self._find_array()):
+            return moments
+
+        buf = self._buf
+        while self._pos < len(buf):
+            c = buf[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == '{':
+                if self._depth == 0:
+                    self._obj_start = self._pos
+                self._depth += 1
+            elif c == '}':
+                self._depth -= 1
+                if self._depth == 0 and self._obj_start is not None:
+                    try:
+                        moment = json.loads(buf[self._obj_start:self._pos + 1])
+                        if isinstance(moment, dict):
+                            moments.append(moment)
+                    except ValueError:
+                        # Skip malformed entries, keep parsing the rest
+                        pass
+                    self._obj_start = None
+            elif c == ']' and self._depth == 0:
+                self._done = True
+                self._pos += 1
+                break
+            self._pos += 1
+
+        self.emitted += len(moments)
+        return moments
+
+
+def parse_moments_json(content: str) -> list[dict]:
+    """Parse the viral moments out of a complete (non-streamed) LLM reply."""
+    json_str = content.strip()
+    if "</think>" in json_str:
+        json_str = json_str.split("</think>", 1)[1].strip()
+    if json_str.startswith("```json"):
+        parts = json_str.split('```')
+        if len(parts) >= 2:
+            json_str = parts[1]
+    start_idx = json_str.find('{')
+    end_idx = json_str.rfind('}')
+    if start_idx != -1 and end_idx != -1:
+        json_str = json_str[start_idx:end_idx+1]
+    try:
+        return json.loads(json_str).get('viral_moments', [])
+    except Exception:
+        return []
@@ -0,0 +1,245 @@
+import re
+import logging
+
+import numpy as np
+
+from config import settings
+from services.segment_index import SegmentIndex
+from services.timeutil import format_time, parse_time
+
+# Typical speaking rate, to estimate where a transcript line's speech ends
+CHARS_PER_SECOND = 15.0
+# Slack around a transcript line's estimated speech, for coarse caption timing
+_SPEECH_SLACK = 0.5
+# Audible stretches shorter than this are clicks; quieter gaps shorter than this are pauses
+_MIN_ACTIVE_SECONDS = 0.2
+_MAX_PAUSE_SECONDS = 0.3
+# Caption lines made only of tags like [Music] or [Applause] aren't speech
+_NON_SPEECH = re.compile(r"^(\s*[\[(][^\])]*[\])])+\s*$")
+
+
+def moment_bounds(moment: dict) -> tuple[float, float]:
+    """(start, end) of a moment in seconds; raises ValueError when unparseable."""
+    return parse_time(moment.get('time_start', '0:00')), parse_time(moment.get('time_end', '0:00'))
+
+
+def moment_score(moment: dict) -> float:
+    try:
+        return float(moment.get('score', 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def iou(a: tuple[float, float], b: tuple[float, float]) -> float:
+    """Intersection over union of two time windows."""
+    inter = min(a[1], b[1]) - max(a[0], b[0])
+    if inter <= 0:
+        return 0.0
+    return inter / (max(a[1], b[1]) - min(a[0], b[0]))
+
+
+def clamp_to_duration(moment: dict, duration: float | None) -> dict | None:
+    """
+    Return the moment with its end clamped to the media duration, or None if it
+    is unparseable, empty, or starts past the end of the media.
+    """
+    try:
+        start, end = moment_bounds(moment)
+    except ValueError:
+        return None
+    if start < 0 or end <= start:
+        return None
+    if duration is not None:
+        if start >= duration:
+            return None
+        if end > duration:
+            moment = {**moment, 'time_end': format_time(duration)}
+    return moment
+
+
+def resolve_moments(moments: list[dict], duration: float | None = None,
+                    merge_iou: float | None = None, merge_gap: float | None = None,
+                    max_clips: int | None = None) -> list[dict]:
+    """
+    Post-process the moments of one video before clipping:
+      - drop moments outside the media and clamp overhanging ends,
+      - merge windows overlapping past `merge_iou` (or nested), or whose
+        edges touch within `merge_gap` seconds, as long as the union stays
+        within the clip length limit (otherwise the lower-scored
+        overlapping one is dropped),
+      - keep at most `max_clips` moments, best score first,
+    and return them in chronological order.
+    """
+    merge_iou = settings.moment_merge_iou if merge_iou is None else merge_iou
+    merge_gap = settings.moment_merge_gap_seconds if merge_gap is None else merge_gap
+    max_clips = settings.max_clips_per_video if max_clips is None else max_clips
+
+    valid = [m for m in (clamp_to_duration(m, duration) for m in moments) if m is not None]
+    valid.sort(key=lambda m: moment_bounds(m)[0])
+
+    resolved: list[dict] = []
+    for moment in valid:
+        if resolved:
+            prev = resolved[-1]
+            a, b = moment_bounds(prev), moment_bounds(moment)
+            contained = b[1] <= a[1]
+            overlapping = contained or iou(a, b) >= merge_iou
+            # Edges within merge_gap of each other, whether slightly apart or slightly overlapping
+            touching = abs(b[0] - a[1]) <= merge_gap
+            if overlapping or touching:
+                union = (min(a[0], b[0]), max(a[1], b[1]))
+                if union[1] - union[0] <= settings.moment_max_seconds:
+                    resolved[-1] = _merge(prev, moment, union)
+                    continue
+                if overlapping:
+                    if moment_score(moment) > moment_score(prev):
+                        resolved[-1] = moment
+                    continue
+        resolved.append(moment)
+
+    if max_clips and len(resolved) > max_clips:
+        ranked = sorted(range(len(resolved)), key=lambda i: -moment_score(resolved[i]))
+        keep = sorted(ranked[:max_clips])
+        resolved = [resolved[i] for i in keep]
+
+    if len(resolved) != len(moments):
+        logging.info(f"Resolved {len(moments)} moments into {len(resolved)} clips")
+    return resolved
+
+
+def _merge(a: dict, b: dict, union: tuple[float, float]) -> dict:
+    best, other = (a, b) if moment_score(a) >= moment_score(b) else (b, a)
+    merged = {**best, 'time_start': format_time(union[0]), 'time_end': format_time(union[1])}
+    if other.get('description') and other.get('description') != best.get('description'):
+        merged['description'] = f"{best.get('description', '')} {other['description']}".strip()
+    return merged
+
+
+class MomentGate:
+    """
+    Streaming counterpart of resolve_moments for moments that go to the clipper
+    as soon as they are parsed. Admitted moments may already be encoding, so
+    instead of merging, a newcomer overlapping one of them past the IoU
+    threshold is dropped, and the clip cap applies first-come.
+    """
+
+    def __init__(self, duration: float | None = None, merge_iou: float | None = None,
+                 max_clips: int | None = None):
+        self.duration = duration
+        self.merge_iou = settings.moment_merge_iou if merge_iou is None else merge_iou
+        self.max_clips = settings.max_clips_per_video if max_clips is None else max_clips
+        self._admitted: list[tuple[float, float]] = []
+
+    def admit(self, moment: dict) -> dict | None:
+        if self.max_clips and len(self._admitted) >= self.max_clips:
+            return None
+        moment = clamp_to_duration(moment, self.duration)
+        if moment is None:
+            return None
+        window = moment_bounds(moment)
+        if any(iou(window, seen) >= self.merge_iou for seen in self._admitted):
+            logging.info(f"Dropping duplicate moment {moment.get('time_start')}-{moment.get('time_end')}")
+            return None
+        self._admitted.append(window)
+        return moment
+
+
+def _runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """[start, end) frame indices of the runs of True in a boolean mask."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _cover(n_frames: int, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Mask of the frames inside any [start, end) range, via a difference array."""
+    delta = np.zeros(n_frames + 1, dtype=np.int32)
+    np.add.at(delta, np.clip(starts, 0, n_frames), 1)
+    np.add.at(delta, np.clip(ends, 0, n_frames), -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
+def activity_mask(energy: np.ndarray, hop: float = 0.1) -> np.ndarray:
+    """
+    Frames of an RMS envelope that are audibly active. The threshold adapts to
+    the source: a quarter of the way from its noise floor (10th percentile, in dB)
+    to its loud level (95th percentile). Short pauses are bridged and clicks dropped.
+    """
+    if energy.size == 0:
+        return np.zeros(0, dtype=bool)
+    db = 20 * np.log10(np.maximum(energy.astype(np.float64), 1e-6))
+    floor, loud = np.percentile(db, [10, 95])
+    active = db > max(floor + 0.25 * (loud - floor), floor + 6.0)
+
+    starts, ends = _runs(~active)
+    # Only gaps between two active stretches are pauses
+    pauses = ((ends - starts) * hop < _MAX_PAUSE_SECONDS) & (starts > 0) & (ends < active.size)
+    active |= _cover(active.size, starts[pauses], ends[pauses])
+    starts, ends = _runs(active)
+    clicks = (ends - starts) * hop < _MIN_ACTIVE_SECONDS
+    return active & ~_cover(active.size, starts[clicks], ends[clicks])
+
+
+def transcript_speech_mask(index: SegmentIndex, n_frames: int, hop: float = 0.1) -> np.ndarray:
+    """
+    Frames covered by transcript speech. Segments only carry start times, so each
+    line is assumed to be spoken at CHARS_PER_SECOND, up to the next line's start.
+    """
+    is_speech = np.array([not _NON_SPEECH.match(text) and bool(text.strip()) for text in index.texts], dtype=bool)
+    lengths = np.array([len(text) for text in index.texts], dtype=np.float64)
+    starts = index.starts[is_speech] - _SPEECH_SLACK
+    spoken = np.maximum(1.0, lengths[is_speech] / CHARS_PER_SECOND)
+    # The last line's end is unknown when the media duration is
+    line_ends = np.where(index.ends > index.starts, index.ends, np.inf)[is_speech]
+    ends = np.minimum(index.starts[is_speech] + spoken, line_ends) + _SPEECH_SLACK
+    return _cover(n_frames, np.floor(starts / hop).astype(int), np.ceil(ends / hop).astype(int))
+
+
+class DeadAirTrimmer:
+    """
+    Tightens moments to the speech inside them: silence, and noise (music,
+    crowd) that the transcript has no words for, is cut from both edges.
+    Speech is where the source's energy envelope is active and, when a
+    transcript is given, a transcript line is being spoken. Both masks are
+    built once per source; each moment then costs a scan of its own frames.
+    """
+
+    def __init__(self, energy: np.ndarray, index: SegmentIndex | None = None, hop: float = 0.1,
+                 max_trim: float | None = None, min_trim: float | None = None, pad: float | None = None):
+        self.hop = hop
+        self.max_trim = settings.trim_max_seconds if max_trim is None else max_trim
+        self.min_trim = settings.trim_min_seconds if min_trim is None else min_trim
+        self.pad = settings.trim_pad_seconds if pad is None else pad
+        self.speech = activity_mask(energy, hop)
+        if index is not None and len(index):
+            self.speech &= transcript_speech_mask(index, self.speech.size, hop)
+
+    def speech_bounds(self, start: float, end: float) -> tuple[float, float] | None:
+        """(onset, offset) of the speech within [start, end], or None if there is none."""
+        lo, hi = int(start / self.hop), min(self.speech.size, int(np.ceil(end / self.hop)))
+        frames = np.flatnonzero(self.speech[lo:hi]) if hi > lo else np.zeros(0, dtype=int)
+        if frames.size == 0:
+            return None
+        return max(start, (lo + frames[0]) * self.hop), min(end, (lo + frames[-1] + 1) * self.hop)
+
+    def trim(self, moment: dict) -> dict:
+        """Return the moment with dead air removed from its edges (unchanged when there is little)."""
+        try:
+            start, end = moment_bounds(moment)
+        except ValueError:
+            return moment
+        bounds = self.speech_bounds(start, end)
+        if bounds is None:
+            # No detectable speech at all: trust the LLM rather than guess
+            return moment
+        onset, offset = bounds
+        new_start, new_end = start, end
+        # Keep `pad` seconds of lead-in / tail, and cut at most `max_trim` from each edge
+        if onset - self.pad - start >= self.min_trim:
+            new_start = min(onset - self.pad, start + self.max_trim)
+        if end - offset - self.pad >= self.min_trim:
+            new_end = max(offset + self.pad, end - self.max_trim)
+        if (new_start, new_end) == (start, end) or new_end - new_start < 0.5 * (end - start):
+            return moment
+        logging.info(f"Trimmed {new_start - start:.1f}s / {end - new_end:.1f}s of dead air from moment "
+                     f"{moment.get('time_start')}-{moment.get('time_end')}")
+        return {**moment, 'time_start': format_time(round(new_start, 2)), 'time_end': format_time(round(new_end, 2))}
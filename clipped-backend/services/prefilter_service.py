@@ -0,0 +1,142 @@
+import re
+import math
+import logging
+
+import numpy as np
+
+from config import settings
+from services.segment_index import SegmentIndex
+
+# Markers that usually accompany a payoff: laughter, shouting, crowd reactions
+_REACTION_RE = re.compile(
+    r"\[(?:laugh\w*|crowd\w*|applause|cheer\w*|scream\w*)[^\]]*\]|\((?:laugh\w*|applause)[^)]*\)|\b(?:ha){2,}\b|\blol\b|!",
+    re.IGNORECASE,
+)
+# Markers of dead air: music beds, silence
+_DEAD_AIR_RE = re.compile(r"\[(?:music|silence|no audio)[^\]]*\]|♪", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token)."""
+    return math.ceil(len(text) / 4)
+
+
+def _zscore(values: np.ndarray) -> np.ndarray:
+    """Robust z-score (median / MAD) so a few huge windows don't flatten the rest."""
+    if values.size == 0:
+        return values
+    median = np.median(values)
+    mad = np.median(np.abs(values - median)) * 1.4826
+    scale = mad if mad > 1e-9 else (values.std() or 1.0)
+    return (values - median) / scale
+
+
+def score_windows(index: SegmentIndex, window: float, energy: np.ndarray | None = None,
+                  hop: float = 0.1) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Score fixed-size windows of the transcript for how likely they hold a moment.
+
+    Features (all vectorized per window):
+      - speech density in words per second,
+      - words-per-second spikes against the neighbouring windows,
+      - reaction markers (laughter, exclamations) minus dead-air markers,
+      - mean audio energy from the envelope, when one is available.
+    Returns (window_starts, scores).
+    """
+    n_windows = max(1, math.ceil(index.duration / window)) if index.duration > 0 else 1
+    window_starts = np.arange(n_windows, dtype=np.float64) * window
+    if len(index) == 0:
+        return window_starts, np.zeros(n_windows)
+
+    window_ids = np.minimum((index.starts // window).astype(np.int64), n_windows - 1)
+    words = np.array([len(t.split()) for t in index.texts], dtype=np.float64)
+    reactions = np.array([len(_REACTION_RE.findall(t)) for t in index.texts], dtype=np.float64)
+    dead_air = np.array([len(_DEAD_AIR_RE.findall(t)) for t in index.texts], dtype=np.float64)
+
+    density = np.bincount(window_ids, weights=words, minlength=n_windows) / window
+    markers = np.bincount(window_ids, weights=reactions - dead_air, minlength=n_windows)
+
+    # Spike = density above the mean of the two neighbouring windows
+    padded = np.pad(density, 1, mode='edge')
+    spikes = np.maximum(density - (padded[:-2] + padded[2:]) / 2, 0.0)
+
+    scores = _zscore(density) + 0.5 * _zscore(spikes) + markers
+    if energy is not None and energy.size:
+        frames_per_window = max(1, int(round(window / hop)))
+        padded_energy = np.zeros(n_windows * frames_per_window, dtype=np.float64)
+        usable = min(energy.size, padded_energy.size)
+        padded_energy[:usable] = energy[:usable]
+        scores += 0.5 * _zscore(padded_energy.reshape(n_windows, frames_per_window).mean(axis=1))
+    # Windows without any speech can't hold a moment the LLM could cite
+    scores[density == 0] = -np.inf
+    return window_starts, scores
+
+
+def select_regions(index: SegmentIndex, keep_ratio: float, window: float, context: float,
+                   energy: np.ndarray | None = None, hop: float = 0.1) -> list[tuple[float, float]]:
+    """
+    Rank windows and return the merged (start, end) regions of the top
+    keep_ratio share of them, each padded by `context` seconds on both sides.
+    """
+    window_starts, scores = score_windows(index, window, energy, hop)
+    n_keep = max(1, math.ceil(keep_ratio * len(scores)))
+    top = np.argsort(-scores, kind='stable')[:n_keep]
+    top = top[np.isfinite(scores[top])]
+    if top.size == 0:
+        return []
+
+    starts = np.sort(window_starts[top])
+    region_starts = np.maximum(starts - context, 0.0)
+    region_ends = np.minimum(starts + window + context, max(index.duration, window))
+
+    regions = []
+    for start, end in zip(region_starts.tolist(), region_ends.tolist()):
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(regions[-1][1], end))
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def build_candidate_text(header: str, index: SegmentIndex, regions: list[tuple[float, float]]) -> str:
+    """Render only the lines inside the regions, in the transcript's own line format."""
+    lines = [header.rstrip('\n'), "{"]
+    for region_idx, (start, end) in enumerate(regions):
+        if region_idx:
+            lines.append('  "...": "[transcript skipped]",')
+        lo, hi = index.span(start, end)
+        for t, text in zip(index.starts[lo:hi].tolist(), index.texts[lo:hi]):
+            lines.append(f'  "{t:.2f}": "{text}",')
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def _transcript_header(text: str) -> str:
+    """Everything before the first timed line (video name, URL, notes)."""
+    head = text.split("{", 1)[0] if "{" in text else ""
+    return head if len(head) < 2000 else ""
+
+
+def prefilter_transcript(text: str, index: SegmentIndex, energy: np.ndarray | None = None,
+                         keep_ratio: float | None = None, hop: float = 0.1) -> str:
+    """
+    Return the transcript text reduced to its most promising regions.
+    Short transcripts and keep_ratio >= 1 pass through untouched.
+    """
+    keep_ratio = settings.prefilter_keep_ratio if keep_ratio is None else keep_ratio
+    if keep_ratio >= 1.0 or len(text) < settings.prefilter_min_chars or len(index) == 0:
+        return text
+
+    regions = select_regions(
+        index, keep_ratio, settings.prefilter_window_seconds, settings.prefilter_context_seconds, energy, hop
+    )
+    if not regions:
+        return text
+    reduced = build_candidate_text(_transcript_header(text), index, regions)
+    if len(reduced) >= len(text):
+        return text
+    logging.info(
+        f"Pre-filter kept {len(regions)} regions: ~{estimate_tokens(reduced)} of "
+        f"~{estimate_tokens(text)} tokens sent to the LLM"
+    )
+    return reduced
@@ -0,0 +1,321 @@
+import json
+import subprocess
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+import numpy as np
+
+from services import clip_cache
+
+# Bump when the probed fields change so stale sidecars are re-probed
+PROBE_VERSION = 3
+# Probes and keyframe lists kept in memory (most recently used); the rest are reread from their sidecars
+PROBE_CACHE_ENTRIES = 256
+
+
+@dataclass(frozen=True)
+class StreamInfo:
+    index: int
+    codec_type: str
+    codec_name: str
+    profile: str | None = None
+    pix_fmt: str | None = None
+    width: int | None = None
+    height: int | None = None
+    time_base: str | None = None
+    sample_rate: int | None = None
+    channels: int | None = None
+    # Video coding parameters a re-encode has to reproduce to splice into the stream
+    level: int | None = None
+    refs: int | None = None
+    has_b_frames: int | None = None
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    """Everything the pipeline needs to know about a media file, probed once."""
+    duration: float | None
+    streams: tuple[StreamInfo, ...]
+    fps: float | None
+    rotation: int
+
+    @property
+    def video(self) -> StreamInfo | None:
+        return next((s for s in self.streams if s.codec_type == "video"), None)
+
+    @property
+    def audio(self) -> StreamInfo | None:
+        return next((s for s in self.streams if s.codec_type == "audio"), None)
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio is not None
+
+    @property
+    def resolution(self) -> tuple[int, int] | None:
+        """(width, height) as displayed, i.e. after applying the rotation."""
+        video = self.video
+        if video is None or not video.width or not video.height:
+            return None
+        if self.rotation in (90, 270):
+            return video.height, video.width
+        return video.width, video.height
+
+
+# Probes keyed by (resolved path, size, mtime) so a replaced file is re-probed
+_probe_cache: OrderedDict[tuple[str, int, int], MediaInfo] = OrderedDict()
+_keyframe_cache: OrderedDict[tuple[str, int, int], np.ndarray] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(cache: OrderedDict, key: tuple[str, int, int]):
+    with _cache_lock:
+        if key not in cache:
+            return None
+        cache.move_to_end(key)
+        return cache[key]
+
+
+def _remember(cache: OrderedDict, key: tuple[str, int, int], value) -> None:
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > PROBE_CACHE_ENTRIES:
+            cache.popitem(last=False)
+
+
+def _cache_key(path: Path) -> tuple[str, int, int] | None:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+
+
+def _sidecar_path(media_path: Path) -> Path:
+    return media_path.with_name(f"{media_path.name}.probe.npz")
+
+
+def _keyframes_path(media_path: Path) -> Path:
+    return media_path.with_name(f"{media_path.name}.keyframes.npy")
+
+
+def _to_float(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(rate: str | None) -> float | None:
+    """ffprobe rates are fractions like "30000/1001"; "0/0" means unknown."""
+    num, _, den = (rate or "").partition("/")
+    num, den = _to_float(num), _to_float(den or 1)
+    if not num or not den:
+        return None
+    return num / den
+
+
+def _rotation(stream: dict) -> int:
+    """Clockwise display rotation in degrees (0, 90, 180 or 270)."""
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            # The display matrix stores the counter-clockwise angle
+            return int(-_to_float(side_data["rotation"])) % 360
+    rotate = _to_float(stream.get("tags", {}).get("rotate"))
+    return int(rotate) % 360 if rotate is not None else 0
+
+
+def parse_probe(data: dict) -> MediaInfo:
+    """Build a MediaInfo from ffprobe's JSON (format duration and streams sections)."""
+    streams = tuple(
+        StreamInfo(
+            index=s.get("index", i),
+            codec_type=s.get("codec_type", ""),
+            codec_name=s.get("codec_name", ""),
+            profile=s.get("profile"),
+            pix_fmt=s.get("pix_fmt"),
+            width=_to_int(s.get("width")),
+            height=_to_int(s.get("height")),
+            time_base=s.get("time_base"),
+            sample_rate=_to_int(s.get("sample_rate")),
+            channels=_to_int(s.get("channels")),
+            level=_to_int(s.get("level")),
+            refs=_to_int(s.get("refs")),
+            has_b_frames=_to_int(s.get("has_b_frames")),
+        )
+        for i, s in enumerate(data.get("streams", []))
+    )
+    raw_video = next((s for s in data.get("streams", []) if s.get("codec_type") == "video"), None)
+
+    duration = _to_float(data.get("format", {}).get("duration"))
+    if duration is None:
+        stream_durations = [_to_float(s.get("duration")) for s in data.get("streams", [])]
+        duration = max((d for d in stream_durations if d is not None), default=None)
+
+    fps, rotation = None, 0
+    if raw_video is not None:
+        fps = _frame_rate(raw_video.get("avg_frame_rate")) or _frame_rate(raw_video.get("r_frame_rate"))
+        rotation = _rotation(raw_video)
+
+    return MediaInfo(
+        duration=duration,
+        streams=streams,
+        fps=fps,
+        rotation=rotation,
+    )
+
+
+def parse_keyframes(data: dict) -> np.ndarray:
+    """Sorted keyframe timestamps (seconds) from ffprobe's JSON frames section."""
+    times = [
+        _to_float(f.get("pts_time", f.get("best_effort_timestamp_time")))
+        for f in data.get("frames", [])
+    ]
+    return np.unique(np.array([t for t in times if t is not None], dtype=np.float64))
+
+
+def _run_ffprobe(path: Path) -> dict:
+    # Headers only: nothing is demuxed past the stream parameters
+    cmd = [
+        "ffprobe", "-v", "quiet", "-of", "json",
+        "-show_entries", "format=duration",
+        "-show_streams",
+        str(path)
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def _run_keyframe_probe(path: Path) -> dict:
+    # Only the first video stream, and the decoder skips everything but keyframes
+    cmd = [
+        "ffprobe", "-v", "quiet", "-of", "json",
+        "-select_streams", "v:0", "-skip_frame", "nokey",
+        "-show_frames", "-show_entries", "frame=pts_time,best_effort_timestamp_time",
+        str(path)
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def _load_sidecar(sidecar: Path) -> MediaInfo | None:
+    with np.load(sidecar, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta.get("version") != PROBE_VERSION:
+            return None
+        return MediaInfo(
+            duration=meta["duration"],
+            streams=tuple(StreamInfo(**s) for s in meta["streams"]),
+            fps=meta["fps"],
+            rotation=meta["rotation"],
+        )
+
+
+def _save_sidecar(sidecar: Path, info: MediaInfo) -> None:
+    meta = {
+        "version": PROBE_VERSION,
+        "duration": info.duration,
+        "streams": [asdict(s) for s in info.streams],
+        "fps": info.fps,
+        "rotation": info.rotation,
+    }
+    with clip_cache.write_atomically(sidecar) as tmp, open(tmp, 'wb') as f:
+        np.savez(f, meta=np.array(json.dumps(meta)))
+
+
+def probe(media_path: str | Path) -> MediaInfo | None:
+    """
+    Return the MediaInfo of a media file, or None if it can't be probed.
+    ffprobe runs once per file: the result is kept in memory and in a .probe.npz
+    sidecar next to the media, reused while the sidecar is newer than the media.
+    """
+    path = Path(media_path)
+    key = _cache_key(path)
+    if key is None:
+        return None
+
+    cached = _cached(_probe_cache, key)
+    if cached is not None:
+        return cached
+
+    info = None
+    sidecar = _sidecar_path(path)
+    if sidecar.exists() and sidecar.stat().st_mtime >= path.stat().st_mtime:
+        try:
+            info = _load_sidecar(sidecar)
+        except Exception:
+            logging.warning(f"Discarding unreadable probe sidecar {sidecar}")
+
+    if info is None:
+        try:
+            info = parse_probe(_run_ffprobe(path))
+        except (OSError, subprocess.CalledProcessError, ValueError) as e:
+            logging.warning(f"Could not probe {path}: {e}")
+            return None
+        try:
+            _save_sidecar(sidecar, info)
+        except OSError as e:
+            logging.warning(f"Could not cache probe of {path}: {e}")
+
+    _remember(_probe_cache, key, info)
+    return info
+
+
+def get_duration(media_path: str | Path) -> float | None:
+    """Return the media duration in seconds, probing each file only once."""
+    info = probe(media_path)
+    return info.duration if info else None
+
+
+def _load_keyframes(sidecar: Path, media_path: Path) -> np.ndarray | None:
+    if not sidecar.exists() or sidecar.stat().st_mtime < media_path.stat().st_mtime:
+        return None
+    try:
+        return np.load(sidecar, allow_pickle=False)
+    except Exception:
+        logging.warning(f"Discarding unreadable keyframe sidecar {sidecar}")
+        return None
+
+
+def get_keyframes(media_path: str | Path) -> np.ndarray | None:
+    """
+    Keyframe timestamps (seconds, sorted) of the first video stream, or None if
+    they can't be probed. Found with a separate ffprobe pass, run only for the
+    callers that need keyframes and cached like probe() in a .keyframes.npy sidecar.
+    """
+    path = Path(media_path)
+    key = _cache_key(path)
+    if key is None:
+        return None
+
+    cached = _cached(_keyframe_cache, key)
+    if cached is not None:
+        return cached
+
+    sidecar = _keyframes_path(path)
+    keyframes = _load_keyframes(sidecar, path)
+    if keyframes is None:
+        try:
+            keyframes = parse_keyframes(_run_keyframe_probe(path))
+        except (OSError, subprocess.CalledProcessError, ValueError) as e:
+            logging.warning(f"Could not probe keyframes of {path}: {e}")
+            return None
+        try:
+            with clip_cache.write_atomically(sidecar) as tmp, open(tmp, 'wb') as f:
+                np.save(f, keyframes)
+        except OSError as e:
+            logging.warning(f"Could not cache keyframes of {path}: {e}")
+
+    _remember(_keyframe_cache, key, keyframes)
+    return keyframes
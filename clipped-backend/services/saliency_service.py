@@ -0,0 +1,195 @@
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from config import settings
+from services import clip_cache
+from services.encode_scheduler import encode_scheduler
+from services.job_registry import JobCancelled
+
+# Analysis frames are decoded straight to this size: the path is a fraction of the
+# width, so squashing the source's aspect ratio doesn't move it
+ANALYSIS_WIDTH = 160
+ANALYSIS_HEIGHT = 90
+# Bump when the analysis or the path it produces changes (and CACHE_VERSION with it)
+CROP_PATH_VERSION = 1
+# Knot spacing of the piecewise-linear path handed to ffmpeg
+KNOT_SECONDS = 0.5
+# Weight of edges (faces, text) against motion, and of the centre prior against both
+_EDGE_WEIGHT = 0.5
+_CENTER_WEIGHT = 0.2
+# Paths that wander less than this (fraction of the width) are held still
+_MIN_TRAVEL = 0.04
+
+
+@dataclass(frozen=True)
+class CropPath:
+    """Horizontal centre of the subject over a clip, sampled at `times` (seconds from the clip start)."""
+    times: np.ndarray
+    centers: np.ndarray  # fraction of the frame width, 0 = left edge
+
+    def expression(self, offset: float = 0.0) -> str:
+        """
+        ffmpeg expression of the centre at filter time `t`, where the clip starts
+        at t = offset. A sum of clipped ramps rather than nested if()s, so it stays
+        flat (and cheap to evaluate) however many knots there are.
+        """
+        terms = [f"{self.centers[0]:.4f}"]
+        for t0, t1, c0, c1 in zip(self.times, self.times[1:], self.centers, self.centers[1:]):
+            if c1 == c0:
+                continue
+            slope = (c1 - c0) / (t1 - t0)
+            terms.append(f"{slope:+.5f}*clip(t-{t0 + offset:.3f},0,{t1 - t0:.3f})")
+        return "".join(terms)
+
+
+def _path_file(media_path: Path, start: float, end: float) -> Path:
+    return media_path.with_name(f"{media_path.name}.crop-{int(round(start * 1000))}-{int(round(end * 1000))}.npz")
+
+
+def _decode_command(media_path: Path, start: float, end: float, output: Path, threads: int, fps: float) -> list[str]:
+    return [
+        "ffmpeg", "-y", "-v", "error",
+        "-threads", str(threads),
+        # Deblocking is most of the decode cost and invisible at 160 px
+        "-skip_loop_filter", "all",
+        "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+        "-i", str(media_path),
+        "-an", "-sn",
+        "-vf", f"fps={fps:g},scale={ANALYSIS_WIDTH}:{ANALYSIS_HEIGHT}:flags=area,format=gray",
+        "-f", "rawvideo", str(output),
+    ]
+
+
+def _decode_frames(media_path: Path, start: float, end: float, fps: float, priority: str,
+                   job_id: str | None) -> np.ndarray:
+    """Grey (n, ANALYSIS_HEIGHT, ANALYSIS_WIDTH) frames of [start, end] at `fps`."""
+    output = clip_cache.temp_path(media_path.with_name(f"{media_path.name}.crop.gray"))
+    try:
+        encode_scheduler.run(
+            lambda threads: _decode_command(media_path, start, end, output, threads, fps),
+            priority=priority,
+            label=f"crop analysis of {media_path.name}",
+            job_id=job_id,
+            duration=end - start,
+        )
+        frames = np.fromfile(output, dtype=np.uint8)
+    finally:
+        output.unlink(missing_ok=True)
+    n = frames.size // (ANALYSIS_WIDTH * ANALYSIS_HEIGHT)
+    return frames[:n * ANALYSIS_WIDTH * ANALYSIS_HEIGHT].reshape(n, ANALYSIS_HEIGHT, ANALYSIS_WIDTH)
+
+
+def _normalized(maps: np.ndarray) -> np.ndarray:
+    """Scale each frame's map to sum to 1 (all-zero frames stay zero)."""
+    totals = maps.sum(axis=(1, 2), keepdims=True)
+    return np.divide(maps, totals, out=np.zeros_like(maps), where=totals > 0)
+
+
+def subject_centers(frames: np.ndarray) -> np.ndarray:
+    """
+    Per-frame horizontal centroid of a cheap saliency map: motion (difference
+    with the previous frame) plus edge energy, over a weak centre prior so
+    empty or static frames drift back to the middle.
+    """
+    frames = frames.astype(np.float32)
+    n, height, width = frames.shape
+    motion = np.abs(np.diff(frames, axis=0))
+    motion = np.concatenate([motion[:1], motion]) if n > 1 else np.zeros_like(frames)
+    edges = np.zeros_like(frames)
+    edges[:, :, 1:] += np.abs(np.diff(frames, axis=2))
+    edges[:, 1:, :] += np.abs(np.diff(frames, axis=1))
+    # Square so a few strong regions outweigh widespread low-level noise
+    saliency = _normalized(motion ** 2) + _EDGE_WEIGHT * _normalized(edges ** 2)
+
+    x = (np.arange(width, dtype=np.float32) + 0.5) / width
+    columns = saliency.sum(axis=1) + _CENTER_WEIGHT * np.exp(-((x - 0.5) ** 2) / 0.08) / width
+    return (columns * x).sum(axis=1) / columns.sum(axis=1)
+
+
+def smooth_path(centers: np.ndarray, fps: float, sigma_seconds: float) -> np.ndarray:
+    """Median filter out single-frame jumps, then Gaussian-smooth into a steady pan."""
+    if centers.size == 0:
+        return centers
+    padded = np.pad(centers, 2, mode="edge")
+    centers = np.median(np.lib.stride_tricks.sliding_window_view(padded, 5), axis=1)
+    sigma = max(sigma_seconds * fps, 1e-3)
+    radius = int(np.ceil(3 * sigma))
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+    kernel /= kernel.sum()
+    centers = np.convolve(np.pad(centers, radius, mode="edge"), kernel, mode="valid")
+    if centers.max() - centers.min() < _MIN_TRAVEL:
+        centers = np.full_like(centers, centers.mean())
+    return centers
+
+
+def _knots(centers: np.ndarray, fps: float, duration: float) -> CropPath:
+    """Resample the per-frame path onto KNOT_SECONDS knots spanning the clip."""
+    frame_times = (np.arange(centers.size) + 0.5) / fps
+    times = np.append(np.arange(0.0, duration, KNOT_SECONDS), duration)
+    knots = np.interp(times, frame_times, centers)
+    return CropPath(times=times.astype(np.float32), centers=np.round(knots, 4).astype(np.float32))
+
+
+def analyze_crop_path(media_path: str | Path, start: float, end: float, priority: str = "interactive",
+                      job_id: str | None = None) -> CropPath:
+    """Decode [start, end] at ANALYSIS_WIDTH px and crop_analysis_fps and track its subject."""
+    media_path = Path(media_path)
+    fps = settings.crop_analysis_fps
+    frames = _decode_frames(media_path, start, end, fps, priority, job_id)
+    if frames.shape[0] == 0:
+        raise RuntimeError(f"No frames decoded from {media_path} [{start:.3f}, {end:.3f}]")
+    centers = smooth_path(subject_centers(frames), fps, settings.crop_smoothing_seconds)
+    return _knots(centers, fps, end - start)
+
+
+def get_crop_path(media_path: str | Path, start: float, end: float, priority: str = "interactive",
+                  job_id: str | None = None) -> CropPath | None:
+    """
+    Subject-following crop path of [start, end] of a video, or None when it
+    can't be analysed (callers then crop the centre). Paths are cached per
+    moment in a .crop-<start>-<end>.npz sidecar next to the media.
+    """
+    media_path = Path(media_path)
+    try:
+        media_mtime = media_path.stat().st_mtime
+    except OSError:
+        return None
+    sidecar = _path_file(media_path, start, end)
+    path = _load_path(sidecar, media_mtime)
+    if path is not None:
+        return path
+    try:
+        path = analyze_crop_path(media_path, start, end, priority, job_id)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logging.warning(f"Crop analysis of {media_path.name} [{start:.1f}, {end:.1f}] failed: {e}")
+        return None
+    _save_path(sidecar, path)
+    return path
+
+
+def _load_path(sidecar: Path, media_mtime: float) -> CropPath | None:
+    if not sidecar.exists() or sidecar.stat().st_mtime < media_mtime:
+        return None
+    try:
+        with np.load(sidecar, allow_pickle=False) as data:
+            if json.loads(str(data["meta"])).get("version") != CROP_PATH_VERSION:
+                return None
+            return CropPath(times=data["times"], centers=data["centers"])
+    except Exception:
+        logging.warning(f"Discarding unreadable crop path {sidecar}")
+        return None
+
+
+def _save_path(sidecar: Path, path: CropPath) -> None:
+    try:
+        with clip_cache.write_atomically(sidecar) as tmp, open(tmp, 'wb') as f:
+            np.savez(f, times=path.times, centers=path.centers,
+                     meta=np.array(json.dumps({"version": CROP_PATH_VERSION})))
+    except OSError as e:
+        logging.warning(f"Could not cache crop path {sidecar}: {e}")
@@ -0,0 +1,53 @@
+import numpy as np
+
+
+class SegmentIndex:
+    """
+    Sorted, array-backed index over transcript segments.
+
+    Segment starts and ends are stored as NumPy arrays so range lookups are
+    binary searches, and subtitle lists are plain slices of a prebuilt list.
+    A segment runs until the next one starts; the last one runs until the end
+    of the media (or its own start when the duration is unknown).
+    """
+
+    def __init__(self, entries: list[tuple[float, str]], duration: float | None = None):
+        entries = sorted(entries, key=lambda e: e[0])
+        self.starts = np.array([t for t, _ in entries], dtype=np.float64)
+        self.texts = [text for _, text in entries]
+
+        self.ends = np.empty_like(self.starts)
+        if len(entries):
+            self.ends[:-1] = self.starts[1:]
+            self.ends[-1] = max(duration or 0.0, self.starts[-1])
+        self.duration = float(duration) if duration is not None else (float(self.ends[-1]) if len(entries) else 0.0)
+
+        self._subtitles = [{'time': t, 'text': text} for t, text in zip(self.starts.tolist(), self.texts)]
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def span(self, start: float, end: float) -> tuple[int, int]:
+        """Return the [lo, hi) slice of segments starting within [start, end]."""
+        lo = int(np.searchsorted(self.starts, start, side='left'))
+        hi = int(np.searchsorted(self.starts, end, side='right'))
+        return lo, max(lo, hi)
+
+    def spans(self, starts, ends) -> tuple[np.ndarray, np.ndarray]:
+        """Vectorized span() over arrays of range starts and ends."""
+        lo = np.searchsorted(self.starts, np.asarray(starts, dtype=np.float64), side='left')
+        hi = np.searchsorted(self.starts, np.asarray(ends, dtype=np.float64), side='right')
+        return lo, np.maximum(lo, hi)
+
+    def subtitles(self, start: float, end: float) -> list[dict]:
+        """Subtitles (time, text) of segments starting within [start, end]."""
+        lo, hi = self.span(start, end)
+        return self._subtitles[lo:hi]
+
+    def subtitles_for(self, ranges: list[tuple[float, float]]) -> list[list[dict]]:
+        """Subtitle lists for many (start, end) ranges in one vectorized lookup."""
+        if not ranges:
+            return []
+        bounds = np.asarray(ranges, dtype=np.float64)
+        lo, hi = self.spans(bounds[:, 0], bounds[:, 1])
+        return [self._subtitles[a:b] for a, b in zip(lo.tolist(), hi.tolist())]
@@ -0,0 +1,191 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from config import settings
+from services.job_registry import Job
+
+# How often work held back by a full stage checks for a free place
+_BACKPRESSURE_POLL_SECONDS = 0.2
+
+
+class StageBusy(Exception):
+    """Raised when work is refused because a stage's queue is full."""
+
+    def __init__(self, stage: str, queued: int):
+        super().__init__(f"Stage {stage} is busy ({queued} waiting)")
+        self.stage = stage
+        self.queued = queued
+
+
+class StageExecutor:
+    """
+    Long-lived worker threads for one pipeline stage. At most `workers` calls
+    run at once and at most `max_queued` wait behind them; past that, submit
+    raises StageBusy at once instead of queueing unbounded work, so callers can
+    turn it into a fast 429. Work already under way (a later stage of an admitted
+    job) uses enqueue (or submit_waiting, from a worker thread) instead, which
+    waits for a place: backpressure rather than throwing away what the earlier
+    stages did. Work queued for a job is dropped if the job is cancelled before
+    it starts.
+    """
+
+    def __init__(self, name: str, workers: int, max_queued: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queued = max(0, max_queued)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"stage-{name}")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        # Callers held back by enqueue until the queue has room
+        self._waiting = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        # (queued seconds, run seconds) of recent calls
+        self._recent: deque[tuple[float, float]] = deque(maxlen=100)
+
+    def _reserve(self) -> bool:
+        """Take a queue place if there is one."""
+        with self._lock:
+            if self._running + self._queued >= self.workers + self.max_queued:
+                return False
+            self._queued += 1
+            return True
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) on the stage; raises StageBusy when its queue is full."""
+        if not self._reserve():
+            with self._lock:
+                self._rejected += 1
+                raise StageBusy(self.name, self._queued)
+        return self._submit_reserved(fn, args, kwargs)
+
+    def _submit_reserved(self, fn: Callable, args: tuple, kwargs: dict, job: Job | None = None) -> Future:
+        enqueued = time.monotonic()
+
+        def call():
+            if job is not None and job.cancelled.is_set():
+                # Cancelled while waiting for a worker: give the place back without running
+                with self._lock:
+                    self._queued -= 1
+                job.check()
+            started = time.monotonic()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    if failed:
+                        self._failed += 1
+                    else:
+                        self._completed += 1
+                    self._recent.append((started - enqueued, time.monotonic() - started))
+
+        future = self._pool.submit(call)
+        # A call cancelled while queued never runs, so release its place here
+        future.add_done_callback(self._release_cancelled)
+        return future
+
+    def _release_cancelled(self, future: Future) -> None:
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Await fn(*args, **kwargs) on the stage without blocking the event loop; StageBusy when full."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def enqueue(self, fn: Callable, *args, job: Job | None = None, **kwargs):
+        """
+        Like run, but wait (without blocking the loop) for a queue place instead
+        of refusing. With `job`, raises JobCancelled instead of running fn once
+        the job is cancelled, whether it is still waiting or already admitted.
+        """
+        if not self._reserve():
+            with self._lock:
+                self._waiting += 1
+            try:
+                while not self._reserve():
+                    if job is not None:
+                        job.check()
+                    await asyncio.sleep(_BACKPRESSURE_POLL_SECONDS)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+        return await asyncio.wrap_future(self._submit_reserved(fn, args, kwargs, job))
+
+    def submit_waiting(self, fn: Callable, *args, job: Job | None = None, **kwargs) -> Future:
+        """enqueue for worker threads: block the caller until there is a queue place, then submit."""
+        if not self._reserve():
+            with self._lock:
+                self._waiting += 1
+            try:
+                while not self._reserve():
+                    if job is not None:
+                        job.check()
+                        job.cancelled.wait(_BACKPRESSURE_POLL_SECONDS)
+                    else:
+                        time.sleep(_BACKPRESSURE_POLL_SECONDS)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+        return self._submit_reserved(fn, args, kwargs, job)
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queue place frees up: one average call spread over the workers."""
+        with self._lock:
+            runs = [r for _, r in self._recent]
+        average = sum(runs) / len(runs) if runs else 0.0
+        return max(1, min(300, round(average / self.workers)))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            recent = list(self._recent)
+            return {
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "running": self._running,
+                "queued": self._queued,
+                "waiting": self._waiting,
+                "utilization": self._running / self.workers,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "recent_queue_avg_seconds": sum(q for q, _ in recent) / len(recent) if recent else 0.0,
+                "recent_run_avg_seconds": sum(r for _, r in recent) / len(recent) if recent else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        logging.info(f"Shutting down stage {self.name}")
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+stages = {
+    # Network-bound: yt-dlp downloads mostly wait on the network
+    "download": StageExecutor("download", settings.stage_download_workers, settings.stage_max_queued),
+    # CPU-bound: each Whisper run already uses every core
+    "transcribe": StageExecutor("transcribe", settings.stage_transcribe_workers, settings.stage_max_queued),
+    # Network-bound: waits on the LLM, whose rate is governed by llm_scheduler
+    "analyze": StageExecutor("analyze", settings.stage_analyze_workers, settings.stage_max_queued),
+    # Drives ffmpeg; the encode scheduler decides how many encodes actually run
+    "clip": StageExecutor("clip", settings.stage_clip_workers, settings.stage_max_queued),
+    # The single clip renders that clip-stage calls fan out to, shared by every job;
+    # each mostly waits for its encode slot
+    "render": StageExecutor("render", settings.stage_render_workers, settings.stage_max_queued),
+    # CPU-bound: whole-source audio analyses (loudness, energy) warmed up ahead of clipping
+    "media": StageExecutor("media", settings.stage_media_workers, settings.stage_max_queued),
+    # One cleanup at a time, and one more queued is enough: it would clean the same directories
+    "cleanup": StageExecutor("cleanup", 1, 1),
+}
@@ -0,0 +1,24 @@
+def parse_time(ts: str) -> float:
+    """Parse a transcript or LLM timestamp (seconds, m:ss or h:mm:ss) into seconds."""
+    ts_str = ts.strip()
+    # If format is plain seconds (e.g., '333.00'), parse directly
+    if ':' not in ts_str:
+        try:
+            return float(ts_str)
+        except ValueError:
+            raise ValueError(f"Invalid time format: {ts}")
+    parts = ts_str.split(':')
+    if len(parts) == 2:
+        return int(parts[0]) * 60 + float(parts[1])
+    elif len(parts) == 3:
+        return int(parts[0]) * 3600 + int(parts[1]) * 60 + float(parts[2])
+    else:
+        raise ValueError(f"Invalid time format: {ts}")
+
+
+def format_time(seconds: float) -> str:
+    """Format seconds as m:ss (m:ss.ss when fractional), the format the LLM uses."""
+    minutes, secs = divmod(max(0.0, seconds), 60)
+    if abs(secs - round(secs)) < 1e-6:
+        return f"{int(minutes)}:{int(round(secs)):02d}"
+    return f"{int(minutes)}:{secs:05.2f}"
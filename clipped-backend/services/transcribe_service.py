@@ -9,6 +9,10 @@ import subprocess
 from queue import Queue
 from faster_whisper import WhisperModel
 from config import settings
+from services.probe_service import get_duration
+
+# Whisper model the transcripts are made with
+WHISPER_MODEL = "small.en"
 
 _model = None
 _model_loaded_event = threading.Event()
@@ -23,7 +27,7 @@ def _load_model():
     global _model
     try:
         _model = WhisperModel(
-            "small.en",
+            WHISPER_MODEL,
             device="cpu",    
             compute_type="int8",        
             cpu_threads=4,
@@ -35,16 +39,8 @@ def _load_model():
 threading.Thread(target=_load_model, daemon=True).start()
 threading.Thread(target=_init_cache, daemon=True).start()
 
-def _get_audio_duration(audio_path: Path) -> float:
-    cmd = [
-        "ffprobe", "-v", "quiet", "-show_entries", "format=duration",
-        "-of", "csv=p=0", str(audio_path)
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    return float(result.stdout.strip())
-
 def _chunk_hash(video_path: str, start: float, duration: float) -> str:
-    content = f"{video_path}-{start}-{duration}-small.en"
+    content = f"{video_path}-{start}-{duration}-{WHISPER_MODEL}"
     return hashlib.sha256(content.encode()).hexdigest()
 
 def _get_cached_transcript(hash_key: str) -> list:
@@ -143,7 +139,9 @@ def _transcribe_consumer(chunk_queue: Queue, result_queue: Queue, model: Whisper
                 result_queue.put([])
 
 def _pipeline_transcribe(audio_path: Path, model: WhisperModel, chunk_duration: float = 120.0, max_workers: int = 4) -> list:
-    total_duration = _get_audio_duration(audio_path)
+    total_duration = get_duration(audio_path)
+    if total_duration is None:
+        raise RuntimeError(f"Could not determine the duration of {audio_path}")
     
     chunks = []
     start = 0.0
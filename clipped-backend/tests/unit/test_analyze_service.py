@@ -36,23 +36,23 @@ def test_analyze_transcript(monkeypatch, tmp_path):
     f = tmp_path / "transcript.txt"
     f.write_text("[0:00] start\n[0:15] mid\n[0:30] end")
 
-    # Dummy choice and response
+    # Dummy streamed response, delivered in small deltas
     class DummyChoice:
         def __init__(self, content):
-            self.message = type("M", (), {"content": content})
+            self.delta = type("D", (), {"content": content})
 
     class DummyChat:
         def __init__(self):
             self.completions = self
-        def create(self, messages, model):
+        def create(self, messages, model, stream=False):
             payload = {"viral_moments": [
                 {"time_start": "0:00", "time_end": "0:15", "description": "desc"}
             ]}
             content = json.dumps(payload)
-            return type("R", (), {"choices": [DummyChoice(content)]})
+            return [type("R", (), {"choices": [DummyChoice(content[i:i+7])]}) for i in range(0, len(content), 7)]
 
     class DummyClient:
-        def __init__(self, api_key):
+        def __init__(self, api_key, max_retries=2):
             self.chat = DummyChat()
 
     # Monkeypatch environment and client
@@ -68,3 +68,31 @@ def test_analyze_transcript(monkeypatch, tmp_path):
     assert "subtitles" in vm[0]
     subs = vm[0]["subtitles"]
     assert any(sub["text"] == "start" for sub in subs)
+
+
+def test_parse_transcript_lines_service_format(tmp_path):
+    f = tmp_path / "transcript.txt"
+    f.write_text('Video: v.mp4\nURL: u\n\n{\n  "0.00": "hello",\n  "12.50": "it\'s, fine",\n}\n')
+    entries = asvc.parse_transcript_lines(f)
+    assert entries == [(0.0, "hello"), (12.5, "it's, fine")]
+
+
+def test_enrich_with_subtitles():
+    index = asvc.SegmentIndex([(0.0, "a"), (5.0, "b"), (20.0, "c")])
+    moments = [
+        {"time_start": "0:00", "time_end": "0:05"},
+        {"time_start": "bad", "time_end": "0:30"},
+    ]
+    asvc.enrich_with_subtitles(moments, index)
+    assert [s["text"] for s in moments[0]["subtitles"]] == ["a", "b"]
+    assert moments[1]["subtitles"] == []
+
+
+def test_analysis_fingerprint_tracks_prompt_and_settings(monkeypatch):
+    base = asvc.analysis_fingerprint()
+    assert asvc.analysis_fingerprint() == base
+    monkeypatch.setattr(asvc, 'SYSTEM_PROMPT', asvc.SYSTEM_PROMPT + "\nPrefer punchlines.")
+    tuned = asvc.analysis_fingerprint()
+    assert tuned != base
+    monkeypatch.setattr(asvc.settings, 'max_clips_per_video', asvc.settings.max_clips_per_video + 1)
+    assert asvc.analysis_fingerprint() not in (base, tuned)
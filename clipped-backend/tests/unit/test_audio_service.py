@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import services.audio_service as aus
+
+
+def make_profile(levels, peak=-20.0):
+    """Profile of a source whose momentary loudness is levels[k] over hop k."""
+    momentary = np.array(levels, dtype=np.float32)
+    return aus.LoudnessProfile(
+        momentary=momentary,
+        short_term=momentary.copy(),
+        peak=np.full(len(levels), peak, dtype=np.float32),
+    )
+
+
+def test_integrated_loudness_is_gated():
+    # 2s at -20 LUFS, then 2s of near silence that the relative gate drops
+    profile = make_profile([-20.0] * 20 + [-60.0] * 20)
+    assert profile.integrated(0.0, 4.0) == pytest.approx(-20.0, abs=0.01)
+    assert profile.integrated(2.0, 4.0) == pytest.approx(-60.0, abs=0.01)
+    # Only blocks whose 400 ms lie inside the window count
+    assert profile.integrated(1.9, 2.5) == pytest.approx(-60.0, abs=0.01)
+    assert profile.integrated(0.0, 0.3) is None
+    assert make_profile([-120.0] * 10).integrated(0.0, 1.0) is None
+
+
+def test_clip_gain_is_capped(monkeypatch):
+    monkeypatch.setattr(aus.settings, "loudness_normalize", True)
+    monkeypatch.setattr(aus.settings, "loudness_target_lufs", -14.0)
+    monkeypatch.setattr(aus.settings, "loudness_max_gain_db", 12.0)
+    monkeypatch.setattr(aus.settings, "loudness_peak_ceiling_db", -1.0)
+    profiles = {
+        "quiet": make_profile([-24.0] * 50, peak=-20.0),
+        "very_quiet": make_profile([-40.0] * 50, peak=-30.0),
+        "peaky": make_profile([-24.0] * 50, peak=-5.0),
+        "loud": make_profile([-8.0] * 50, peak=-0.5),
+        "on_target": make_profile([-14.2] * 50),
+    }
+    monkeypatch.setattr(aus, "get_loudness", lambda path: profiles[path])
+    assert aus.clip_gain_db("quiet", 0, 5) == 10.0
+    assert aus.clip_gain_db("very_quiet", 0, 5) == 12.0
+    assert aus.clip_gain_db("peaky", 0, 5) == 4.0
+    assert aus.clip_gain_db("loud", 0, 5) == -6.0
+    assert aus.clip_gain_db("on_target", 0, 5) is None
+
+    monkeypatch.setattr(aus.settings, "loudness_normalize", False)
+    assert aus.clip_gain_db("quiet", 0, 5) is None
+
+
+def test_loudness_is_measured_once(monkeypatch, tmp_path):
+    media = tmp_path / "video.mp4"
+    media.write_bytes(b"data")
+    calls = []
+
+    def fake_compute(path):
+        calls.append(path)
+        return make_profile([-20.0] * 10)
+
+    monkeypatch.setattr(aus, "probe", lambda path: None)
+    monkeypatch.setattr(aus, "_compute_loudness", fake_compute)
+    first = aus.get_loudness(media)
+    assert aus.get_loudness(media) is first
+    assert (tmp_path / "video.mp4.loudness.npz").exists()
+    # A new process reads the sidecar instead of measuring again
+    aus._loudness_cache.clear()
+    reloaded = aus.get_loudness(media)
+    assert len(calls) == 1
+    assert np.array_equal(reloaded.momentary, first.momentary)
+    assert aus.get_loudness(tmp_path / "missing.mp4") is None
+
+
+def test_loudness_cache_and_locks_stay_bounded(monkeypatch, tmp_path):
+    monkeypatch.setattr(aus, "probe", lambda path: None)
+    monkeypatch.setattr(aus, "_compute_loudness", lambda path: make_profile([-20.0] * 10))
+    aus._loudness_cache.clear()
+    for i in range(aus._LOUDNESS_CACHE_ENTRIES + 2):
+        media = tmp_path / f"video{i}.mp4"
+        media.write_bytes(b'data')
+        aus.get_loudness(media)
+    assert len(aus._loudness_cache) == aus._LOUDNESS_CACHE_ENTRIES
+    assert next(iter(aus._loudness_cache))[0].endswith("video2.mp4")
+    # Locks are dropped once nobody holds or waits for them
+    assert not aus._path_locks
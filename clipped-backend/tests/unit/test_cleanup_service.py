@@ -1,10 +1,12 @@
+import time
 import pytest
+from types import SimpleNamespace
 from pathlib import Path
 import services.cleanup_service as cs
 
 
 def create_dirs_and_files(base: Path):
-    for name in ["audio", "downloads", "transcripts", "clips"]:
+    for name in ["audio", "downloads", "transcripts", "clips", "jobs", "artifacts"]:
         d = base / name
         d.mkdir(parents=True, exist_ok=True)
         # create a dummy file in each subdir
@@ -28,9 +30,10 @@ def test_cleanup_default(tmp_path, monkeypatch):
         assert d.exists() and d.is_dir()
         assert list(d.iterdir()) == []
 
-    # clips should remain untouched (still contain the dummy file)
+    # clips and stored job outputs should remain untouched (still contain the dummy file)
     clips = tmp_storage / "clips"
     assert clips.exists() and any(clips.iterdir())
+    assert any((tmp_storage / "jobs").iterdir()) and any((tmp_storage / "artifacts").iterdir())
 
 
 def test_cleanup_include_clips(tmp_path, monkeypatch):
@@ -45,7 +48,57 @@ def test_cleanup_include_clips(tmp_path, monkeypatch):
     cs.cleanup(include_clips=True)
 
     # all subfolders should be cleaned (empty)
-    for name in ["audio", "downloads", "transcripts", "clips"]:
+    for name in ["audio", "downloads", "transcripts", "clips", "jobs", "artifacts"]:
         d = tmp_storage / name
         assert d.exists() and d.is_dir()
         assert list(d.iterdir()) == []
+
+
+def test_cleanup_keep_downloads(tmp_path, monkeypatch):
+    tmp_storage = tmp_path / "storage"
+    tmp_storage.mkdir()
+    create_dirs_and_files(tmp_storage)
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_storage)
+
+    cs.cleanup(include_downloads=False)
+
+    assert list((tmp_storage / "audio").iterdir()) == []
+    assert any((tmp_storage / "downloads").iterdir())
+
+
+def test_cleanup_prunes_downloads_by_age(tmp_path, monkeypatch):
+    tmp_storage = tmp_path / "storage"
+    tmp_storage.mkdir()
+    create_dirs_and_files(tmp_storage)
+    (tmp_storage / "downloads" / "cache").mkdir()
+    (tmp_storage / "downloads" / "cache" / "abc.mp4").write_text("dummy")
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_storage)
+    now = time.time()
+    monkeypatch.setattr(cs.time, 'time', lambda: now + 100)
+
+    cs.cleanup(downloads_max_age=1000)
+    assert len(list((tmp_storage / "downloads").rglob("*.*"))) == 2
+
+    cs.cleanup(downloads_max_age=50)
+    assert list((tmp_storage / "downloads").rglob("*.*")) == []
+    assert (tmp_storage / "downloads" / "cache").is_dir()
+
+
+def test_full_flow_cleanup_removes_old_downloads_for_drafts(tmp_path, monkeypatch):
+    # The default (draft) request path: sources outlive the TTL only, not forever
+    import routers.full_flow as ff
+    tmp_storage = tmp_path / "storage"
+    tmp_storage.mkdir()
+    create_dirs_and_files(tmp_storage)
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_storage)
+    monkeypatch.setitem(ff.stages, "cleanup", SimpleNamespace(submit=lambda fn, **kwargs: fn(**kwargs)))
+    assert ff.FullFlowRequest(url="https://example.com/v").profile == "draft"
+
+    ff._start_cleanup(True)
+    assert any((tmp_storage / "downloads").iterdir())
+    assert list((tmp_storage / "audio").iterdir()) == []
+
+    now = time.time()
+    monkeypatch.setattr(cs.time, 'time', lambda: now + cs.settings.download_ttl_seconds + 1)
+    ff._start_cleanup(True)
+    assert list((tmp_storage / "downloads").iterdir()) == []
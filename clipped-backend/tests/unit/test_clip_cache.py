@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+import pytest
+
+from services import clip_cache
+
+
+def test_source_id_follows_content_not_path(tmp_path):
+    a = tmp_path / "a.mp4"
+    b = tmp_path / "b.mp4"
+    a.write_bytes(b"same bytes")
+    b.write_bytes(b"same bytes")
+    assert clip_cache.source_id(a) == clip_cache.source_id(b)
+
+    a.write_bytes(b"other bytes")
+    os.utime(a, ns=(1, 1))
+    assert clip_cache.source_id(a) != clip_cache.source_id(b)
+
+
+def test_clip_key_differs_per_parameter(tmp_path):
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    base = clip_cache.clip_key(source, 10.0, 20.0, "final", "vertical")
+    assert base == clip_cache.clip_key(source, 10.0, 20.0, "final", "vertical")
+    variants = [
+        clip_cache.clip_key(source, 10.5, 20.0, "final", "vertical"),
+        clip_cache.clip_key(source, 10.0, 21.0, "final", "vertical"),
+        clip_cache.clip_key(source, 10.0, 20.0, "draft", "vertical"),
+        clip_cache.clip_key(source, 10.0, 20.0, "final", "blur"),
+    ]
+    assert len({base, *variants}) == 5
+
+
+def test_write_atomically_publishes_only_on_success(tmp_path):
+    target = tmp_path / "clip.mp4"
+    with pytest.raises(RuntimeError):
+        with clip_cache.write_atomically(target) as tmp:
+            tmp.write_bytes(b"partial")
+            raise RuntimeError("encode failed")
+    assert list(tmp_path.iterdir()) == []
+
+    with clip_cache.write_atomically(target) as tmp:
+        tmp.write_bytes(b"done")
+    assert target.read_bytes() == b"done"
+    assert list(tmp_path.iterdir()) == [target]
+
+
+def test_lookup_refreshes_hits(tmp_path):
+    clip = tmp_path / "clip.mp4"
+    assert not clip_cache.lookup(clip)
+    clip.write_bytes(b"x")
+    os.utime(clip, (0, 0))
+    assert clip_cache.lookup(clip)
+    assert clip.stat().st_mtime > 0
+
+
+def test_evict_drops_least_recently_used(tmp_path):
+    for i, name in enumerate(["old", "mid", "new"]):
+        clip = tmp_path / f"{name}.mp4"
+        clip.write_bytes(b"x" * 100)
+        (tmp_path / f"{name}.mp4.json").write_text("{}")
+        (tmp_path / f"{name}.thumb.jpg").write_bytes(b"x")
+        os.utime(clip, (1000 + i, 1000 + i))
+    stale_temp = tmp_path / ".partial.1234abcd.mp4"
+    stale_temp.write_bytes(b"x")
+    os.utime(stale_temp, (0, 0))
+
+    # Each clip takes 103 bytes with its record and thumbnail
+    freed = clip_cache.evict(max_bytes=210, root=tmp_path)
+    assert freed == 103
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "mid.mp4", "mid.mp4.json", "mid.thumb.jpg", "new.mp4", "new.mp4.json", "new.thumb.jpg",
+    ]
+
+
+def test_evict_counts_and_removes_each_clips_sidecars(tmp_path):
+    for i, name in enumerate(["old", "new"]):
+        clip = tmp_path / f"{name}.mp4"
+        clip.write_bytes(b"x" * 100)
+        (tmp_path / f"{name}.mp4.json").write_bytes(b"x" * 10)
+        (tmp_path / f"{name}.mp4.probe.npz").write_bytes(b"x" * 10)
+        (tmp_path / f"{name}.sprite.jpg").write_bytes(b"x" * 30)
+        os.utime(clip, (1000 + i, 1000 + i))
+    # A sidecar whose clip is already gone is evicted by its own age
+    orphan = tmp_path / "gone.mp4.probe.npz"
+    orphan.write_bytes(b"x" * 10)
+    os.utime(orphan, (0, 0))
+
+    # The clips alone fit, but not with their sidecars
+    assert clip_cache.evict(max_bytes=200, root=tmp_path) == 160
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "new.mp4", "new.mp4.json", "new.mp4.probe.npz", "new.sprite.jpg",
+    ]
+
+
+def test_locked_is_reentrant_across_keys(tmp_path):
+    paths = [tmp_path / "b.mp4", tmp_path / "a.mp4", tmp_path / "a.mp4"]
+    with clip_cache.locked(paths):
+        assert sorted(p.name for p in (tmp_path / ".locks").iterdir()) == ["a.mp4.lock", "b.mp4.lock"]
+    # Lock files don't pile up
+    assert list((tmp_path / ".locks").iterdir()) == []
+
+
+def test_locked_excludes_concurrent_holders(tmp_path):
+    path = tmp_path / "clip.mp4"
+    inside = []
+
+    def render():
+        for _ in range(20):
+            with clip_cache.locked([path]):
+                inside.append(1)
+                assert len(inside) == 1
+                time.sleep(0.001)
+                inside.pop()
+
+    threads = [threading.Thread(target=render) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    assert not any(t.is_alive() for t in threads)
+    assert list((tmp_path / ".locks").iterdir()) == []
+
+
+def test_evict_skips_clips_pinned_by_running_jobs(tmp_path):
+    for i, name in enumerate(["old", "new"]):
+        clip = tmp_path / f"{name}.mp4"
+        clip.write_bytes(b"x" * 100)
+        os.utime(clip, (1000 + i, 1000 + i))
+    clip_cache.pin([tmp_path / "old.mp4"], "job")
+    try:
+        assert clip_cache.evict(max_bytes=100, root=tmp_path) == 100
+        assert [p.name for p in tmp_path.iterdir()] == ["old.mp4"]
+    finally:
+        clip_cache.unpin("job")
+    assert clip_cache.evict(max_bytes=0, root=tmp_path) == 100
@@ -1,7 +1,10 @@
+import json
+import numpy as np
 import pytest
 from pathlib import Path
 import services.clip_service as cs
-from tests.utils import DummySubclip, DummyVideo
+from services.probe_service import MediaInfo, StreamInfo
+from services.saliency_service import CropPath
 
 
 def test_clip_moments_empty():
@@ -13,15 +16,534 @@ def test_clip_moments(monkeypatch, tmp_path):
     tmp_storage = tmp_path / "storage"
     tmp_storage.mkdir()
     monkeypatch.setattr(cs.settings, 'storage_dir', tmp_storage)
-    # Create a dummy video file
+    # Create two different dummy videos at the same kind of path
     fake_video = tmp_path / "video.mp4"
-    fake_video.write_bytes(b'')
-    # Mock VideoFileClip
-    monkeypatch.setattr(cs, 'VideoFileClip', DummyVideo)
+    fake_video.write_bytes(b'first video')
+    other_video = tmp_path / "other" / "video.mp4"
+    other_video.parent.mkdir()
+    other_video.write_bytes(b'second video')
+    rendered = []
+
+    def fake_clip(video_path, start, end, output_path, keyframes=None, priority="interactive",
+                  layout="vertical", profile="final", job_id=None):
+        rendered.append(video_path)
+        output_path.write_bytes(Path(video_path).read_bytes())
+
+    monkeypatch.setattr(cs, 'clip_with_ffmpeg_optimized', fake_clip)
     moments = [{"time_start": "0:00", "time_end": "0:02", "description": "Test desc"}]
     paths = cs.clip_moments(str(fake_video), moments)
     assert len(paths) == 1
     clip_path = Path(paths[0])
     assert clip_path.parent == tmp_storage / 'clips'
-    assert clip_path.exists()
-    assert 'clip_1_0_2_Test_desc' in clip_path.name
+    assert clip_path.read_bytes() == b'first video'
+    # No temp files are left behind
+    assert sorted(p.name for p in clip_path.parent.glob('*.mp4')) == [clip_path.name]
+
+    # Same cut with another description is served from the cache
+    renamed = [{**moments[0], "description": "Another desc"}]
+    assert cs.clip_moments(str(fake_video), renamed) == paths
+    assert len(rendered) == 1
+
+    # Same index, times and description of another video don't collide
+    [other_path] = cs.clip_moments(str(other_video), moments)
+    assert other_path != paths[0]
+    assert Path(other_path).read_bytes() == b'second video'
+
+
+def test_clip_moment_stream_queues_each_moment(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+    seen = []
+
+    def fake_process(video_path, moment, idx, clips_dir, *options):
+        seen.append(idx)
+        return str(clips_dir / f"clip_{idx}.mp4")
+
+    monkeypatch.setattr(cs, '_process_single_clip', fake_process)
+
+    def moments():
+        for i in range(3):
+            yield {"time_start": f"0:{i}0", "time_end": f"0:{i}5", "description": str(i)}
+
+    reported = []
+    paths = cs.clip_moment_stream("video.mp4", moments(),
+                                  on_clip=lambda idx, path: reported.append((idx, Path(path).name)))
+    assert sorted(seen) == [1, 2, 3]
+    assert sorted(reported) == [(1, "clip_1.mp4"), (2, "clip_2.mp4"), (3, "clip_3.mp4")]
+    assert [Path(p).name for p in paths] == ["clip_1.mp4", "clip_2.mp4", "clip_3.mp4"]
+
+
+def test_clip_moment_stream_returns_moment_order(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+    # Content-addressed names sort in no particular order; the result follows the moments
+    names = {1: "f3.mp4", 2: "a1.mp4", 3: "c2.mp4"}
+    monkeypatch.setattr(cs, '_process_single_clip',
+                        lambda video_path, moment, idx, clips_dir, *options: str(clips_dir / names[idx]))
+    moments = [{"time_start": f"0:{i}0", "time_end": f"0:{i}5"} for i in range(3)]
+    paths = cs.clip_moment_stream("video.mp4", moments)
+    assert [Path(p).name for p in paths] == ["f3.mp4", "a1.mp4", "c2.mp4"]
+
+
+def test_clip_moment_stream_propagates_full_encode_queue(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+
+    def refused(*args, **kwargs):
+        raise cs.EncodeQueueFull("Encode queue full (8 waiting)")
+
+    monkeypatch.setattr(cs, 'clip_with_ffmpeg_optimized', refused)
+    moments = [{"time_start": "0:00", "time_end": "0:05"}]
+    # Not a skipped clip: the request is refused so the API can answer 503
+    with pytest.raises(cs.EncodeQueueFull):
+        cs.clip_moment_stream("video.mp4", moments)
+
+
+def test_seek_points_use_keyframes_or_preroll():
+    assert cs._seek_points(95.0, [0.0, 40.0, 90.0, 100.0]) == (90.0, 5.0)
+    assert cs._seek_points(3.0, [5.0, 10.0]) == (0.0, 3.0)
+    assert cs._seek_points(95.0) == (95.0 - cs.SEEK_PREROLL, cs.SEEK_PREROLL)
+    assert cs._seek_points(4.0) == (0.0, 4.0)
+
+
+def test_build_clip_command_seeks_on_input(tmp_path):
+    cmd = cs.build_clip_command("in.mp4", 100.0, 145.5, tmp_path / "out.mp4", keyframes=[0.0, 96.0], threads=2)
+    i = cmd.index("-i")
+    # Fast seek before the input, exact trim and duration after it
+    assert cmd[i - 2:i] == ["-ss", "96.000"]
+    assert cmd[i + 2:i + 6] == ["-ss", "4.000", "-t", "45.500"]
+    assert "-to" not in cmd
+
+
+def test_single_pass_groups_split_on_gap():
+    cuts = [(1, 0.0, 10.0, "a"), (3, 200.0, 230.0, "c"), (2, 30.0, 60.0, "b")]
+    groups = cs._single_pass_groups(cuts, max_gap=60.0)
+    assert [[c[0] for c in g] for g in groups] == [[1, 2], [3]]
+    assert len(cs._single_pass_groups(cuts, max_gap=float('inf'))) == 1
+
+
+def test_build_multi_clip_command_decodes_once(tmp_path):
+    cuts = [(100.0, 110.0, tmp_path / "a.mp4"), (130.0, 145.0, tmp_path / "b.mp4")]
+    cmd = cs.build_multi_clip_command("in.mp4", cuts, keyframes=[0.0, 96.0], threads=2)
+    assert cmd.count("-i") == 1
+    i = cmd.index("-i")
+    assert cmd[i - 4:i] == ["-ss", "96.000", "-t", "49.000"]
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert graph.count("split=2") == 2
+    assert "trim=start=4.000:end=14.000" in graph
+    assert "atrim=start=34.000:end=49.000" in graph
+    assert cmd[-1] == str(tmp_path / "b.mp4")
+    assert cmd.count("-map") == 4
+
+    silent = cs.build_multi_clip_command("in.mp4", cuts, threads=2, has_audio=False)
+    assert "[0:a]" not in silent[silent.index("-filter_complex") + 1]
+    assert silent.count("-map") == 2
+
+
+def test_clip_moments_renders_nearby_moments_in_one_pass(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+    monkeypatch.setattr(cs, 'probe', lambda path: None)
+    commands = []
+
+    def fake_run(build_cmd, priority="interactive", label="", **kwargs):
+        cmd = build_cmd(2)
+        commands.append(cmd)
+        for arg in cmd:
+            if arg.endswith(".mp4") and arg != "in.mp4":
+                Path(arg).write_bytes(b'')
+
+    monkeypatch.setattr(cs.encode_scheduler, 'run', fake_run)
+    moments = [
+        {"time_start": "0:10", "time_end": "0:20", "description": "one"},
+        {"time_start": "0:40", "time_end": "0:50", "description": "two"},
+        {"time_start": "9:00", "time_end": "9:10", "description": "three"},
+    ]
+    paths = cs.clip_moments("in.mp4", moments)
+    assert len(paths) == 3
+    # The two nearby moments share one decode; the distant one is cut on its own
+    assert sorted(sum(a.startswith(str(tmp_path)) for a in c) for c in commands) == [1, 2]
+    # Existing clips are reused without re-rendering
+    commands.clear()
+    assert len(cs.clip_moments("in.mp4", moments)) == 3
+    assert commands == []
+
+
+def test_smart_render_span_picks_inner_keyframes(monkeypatch):
+    monkeypatch.setattr(cs.settings, 'smart_render_min_copy_seconds', 2.0)
+    keyframes = [0.0, 2.0, 4.0, 6.0, 8.0, 10.0]
+    assert cs.smart_render_span(3.1, 9.5, keyframes) == (4.0, 8.0)
+    # Keyframes within SMART_RENDER_SNAP of the cut count as on it
+    assert cs.smart_render_span(1.98, 8.0, keyframes) == (2.0, 8.0)
+    # Not enough interior to copy
+    assert cs.smart_render_span(3.1, 5.9, keyframes) is None
+    monkeypatch.setattr(cs.settings, 'smart_render_min_copy_seconds', 3.0)
+    assert cs.smart_render_span(3.1, 6.5, keyframes) is None
+
+
+def test_smart_render_copies_interior_and_encodes_edges(monkeypatch, tmp_path):
+    encoded, copied = [], []
+
+    def fake_run(build_cmd, priority="interactive", label="", **kwargs):
+        cmd = build_cmd(2)
+        encoded.append(cmd)
+        Path(cmd[-1]).write_bytes(b'')
+
+    def fake_ffmpeg(cmd, job_id=None):
+        copied.append(cmd)
+        if "concat" in cmd:
+            parts = Path(cmd[cmd.index("-i") + 1]).read_text()
+            assert parts.count("file ") == 3 and "duration 4.000000" in parts
+        Path(cmd[-1]).write_bytes(b'')
+
+    monkeypatch.setattr(cs.encode_scheduler, 'run', fake_run)
+    monkeypatch.setattr(cs, '_run_ffmpeg', fake_ffmpeg)
+    monkeypatch.setattr(cs, '_parameter_sets', lambda path: (b"sps", b"pps"))
+    source = tmp_path / "sources" / "in.mp4"
+    source.parent.mkdir()
+    source.write_bytes(b'')
+    stream = StreamInfo(0, "video", "h264", profile="Main", pix_fmt="yuv420p", time_base="1/15360",
+                        level=31, refs=2, has_b_frames=0)
+    out = tmp_path / "clip.mp4"
+    assert cs.smart_render(str(source), 3.1, 9.5, out, stream, [0.0, 2.0, 4.0, 6.0, 8.0, 10.0])
+    assert out.exists()
+    assert [c[c.index("-t") + 1] for c in encoded] == ["0.900", "1.500"]
+    assert all("-bf" in c and "libx264" in c for c in encoded)
+    # The edges carry the source's coding parameters
+    assert all(c[c.index("-profile:v") + 1] == "main" and c[c.index("-level:v") + 1] == "3.1"
+               and c[c.index("-refs") + 1] == "2" for c in encoded)
+    copy_cmd = copied[0]
+    assert copy_cmd[copy_cmd.index("-c:v") + 1] == "copy"
+    assert copy_cmd[copy_cmd.index("-ss") + 1] == "4.000000"
+    # Scratch parts are removed
+    assert sorted(tmp_path.iterdir()) == [out, source.parent]
+
+
+def test_smart_render_gives_up_when_edge_parameter_sets_differ(monkeypatch, tmp_path):
+    encoded, copied = [], []
+
+    def fake_run(build_cmd, priority="interactive", label="", **kwargs):
+        cmd = build_cmd(2)
+        encoded.append(cmd)
+        Path(cmd[-1]).write_bytes(b'')
+
+    monkeypatch.setattr(cs.encode_scheduler, 'run', fake_run)
+    monkeypatch.setattr(cs, '_run_ffmpeg', lambda cmd, job_id=None: copied.append(cmd))
+    monkeypatch.setattr(cs, '_parameter_sets', lambda path: (b"sps", b"pps" if path == source else b"pps2"))
+    source = str(tmp_path / "in.mp4")
+    Path(source).write_bytes(b'')
+    stream = StreamInfo(0, "video", "h264", profile="Main", pix_fmt="yuv420p", level=31, refs=2, has_b_frames=0)
+    out = tmp_path / "clips" / "clip.mp4"
+    out.parent.mkdir()
+    keyframes = [0.0, 2.0, 4.0, 6.0, 8.0, 10.0]
+    assert not cs.smart_render(source, 3.1, 9.5, out, stream, keyframes)
+    # Nothing is copied or written, and the source's later clips don't try again
+    assert len(encoded) == 1 and not copied
+    assert not list(out.parent.iterdir())
+    assert not cs.smart_render(source, 3.1, 9.5, out, stream, keyframes)
+    assert len(encoded) == 1
+
+
+def test_parse_parameter_sets_keeps_sps_and_pps():
+    stream = b"\x00\x00\x00\x01\x67\x4d\x40\x1f\x00\x00\x00\x01\x68\xea\xc3" + b"\x00\x00\x01\x65\x88\x84"
+    assert cs.parse_parameter_sets(stream) == (b"\x67\x4d\x40\x1f", b"\x68\xea\xc3")
+
+
+def test_smart_render_skips_unsupported_codecs(tmp_path):
+    stream = StreamInfo(0, "video", "vp9")
+    assert not cs.smart_render("in.mp4", 3.1, 9.5, tmp_path / "clip.mp4", stream, [0.0, 4.0, 8.0])
+
+
+def test_smart_render_skips_sources_the_edges_cant_match(tmp_path):
+    matched = StreamInfo(0, "video", "h264", profile="High", pix_fmt="yuv420p", level=40, refs=1, has_b_frames=0)
+    assert cs._edge_stream_args(matched) is not None
+    for mismatch in ({"has_b_frames": 2}, {"profile": "High 10"}, {"pix_fmt": "yuv422p"}, {"level": None}):
+        stream = StreamInfo(**{**matched.__dict__, **mismatch})
+        assert cs._edge_stream_args(stream) is None
+        assert not cs.smart_render("in.mp4", 3.1, 9.5, tmp_path / "clip.mp4", stream, [0.0, 2.0, 4.0, 6.0, 8.0, 10.0])
+    assert not list(tmp_path.iterdir())
+
+
+def test_build_clip_command_source_layout_has_no_filter(tmp_path):
+    cmd = cs.build_clip_command("in.mp4", 10.0, 20.0, tmp_path / "out.mp4", threads=2, layout="source")
+    assert "-vf" not in cmd
+
+
+def test_profiles_scale_frame_and_encode_settings(tmp_path):
+    assert cs.layout_filter("vertical", "draft").startswith("scale=540:960:")
+    assert cs.layout_filter("source", "final") is None
+    assert cs.layout_filter("source", "draft") == "scale=trunc(iw*0.5/2)*2:-2"
+    cmd = cs.build_clip_command("in.mp4", 0.0, 5.0, tmp_path / "out.mp4", threads=2, profile="draft")
+    assert cmd[cmd.index("-preset") + 1] == "ultrafast"
+    assert "-maxrate" in cmd
+    archive = cs.build_clip_command("in.mp4", 0.0, 5.0, tmp_path / "out.mp4", threads=2, profile="archive")
+    assert archive[archive.index("-preset") + 1] == "slow"
+    assert "-maxrate" not in archive
+
+
+def test_finalize_clips_rerenders_drafts_per_profile(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+    source = tmp_path / "video.mp4"
+    source.write_bytes(b'')
+    rendered = []
+
+    def fake_clip(video_path, start, end, output_path, keyframes=None, priority="interactive",
+                  layout="vertical", profile="final", job_id=None):
+        rendered.append((start, end, layout, profile))
+        output_path.write_bytes(b'')
+
+    monkeypatch.setattr(cs, 'clip_with_ffmpeg_optimized', fake_clip)
+    moments = [{"time_start": "0:10", "time_end": "0:20", "description": "Test desc"}]
+    [draft] = cs.clip_moments(str(source), moments, profile="draft")
+    [final] = cs.finalize_clips([draft])
+    assert final != draft and Path(final).exists()
+    assert rendered == [(10.0, 20.0, "vertical", "draft"), (10.0, 20.0, "vertical", "final")]
+    # Each profile is cached separately
+    assert cs.finalize_clips([draft]) == [final]
+    assert len(rendered) == 2
+
+    with pytest.raises(ValueError):
+        cs.finalize_clips([str(source)])
+    source.unlink()
+    with pytest.raises(FileNotFoundError):
+        cs.finalize_clips([draft], profile="archive")
+
+
+def test_build_rendition_command_splits_layouts_from_one_decode(tmp_path):
+    cuts = [
+        (100.0, 110.0, [tmp_path / "a_vertical.mp4", tmp_path / "a_square.mp4"]),
+        (130.0, 145.0, [tmp_path / "b_vertical.mp4", tmp_path / "b_square.mp4"]),
+    ]
+    cmd = cs.build_rendition_command("in.mp4", cuts, ["vertical", "square"], keyframes=[0.0, 96.0], threads=8)
+    assert cmd.count("-i") == 1
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "select=" in graph and graph.count("select=") == 1
+    assert "[l0]scale=1080:1920" in graph and "[l1]scale=1080:1080" in graph
+    assert graph.count("atrim=") == 2
+    outputs = [arg for arg in cmd if arg.startswith(str(tmp_path))]
+    assert outputs == [str(p) for j in range(2) for _, _, paths in cuts for p in [paths[j]]]
+    # Four encoders share the eight threads
+    assert cmd[cmd.index("-c:v") + cmd[cmd.index("-c:v"):].index("-threads") + 1] == "2"
+
+
+def test_loudness_gain_is_applied_per_clip(tmp_path):
+    cmd = cs.build_clip_command("in.mp4", 0.0, 5.0, tmp_path / "out.mp4", threads=2, gain_db=-3.5)
+    assert cmd[cmd.index("-af") + 1] == "volume=-3.5dB"
+    assert "-af" not in cs.build_clip_command("in.mp4", 0.0, 5.0, tmp_path / "out.mp4", threads=2)
+
+    cuts = [(100.0, 110.0, [tmp_path / "a.mp4"]), (130.0, 145.0, [tmp_path / "b.mp4"])]
+    cmd = cs.build_rendition_command("in.mp4", cuts, ["vertical"], threads=2, gains=[6.0, None])
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert graph.count("volume=") == 1
+    assert "asetpts=PTS-STARTPTS,volume=6dB[ao0_0]" in graph
+
+
+def test_blur_layout_filter_scales_with_profile():
+    graph = cs.layout_filter("blur", "draft")
+    assert graph.startswith("split[bg][fg];")
+    # The background is blurred at 1/8 size, then scaled back up to the frame
+    assert "crop=66:120,gblur=sigma=2.5,scale=540:960" in graph
+
+
+def test_clip_renditions_returns_paths_per_layout(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+    monkeypatch.setattr(cs, 'probe', lambda path: None)
+    commands = []
+
+    def fake_run(build_cmd, priority="interactive", label="", **kwargs):
+        cmd = build_cmd(4)
+        commands.append(cmd)
+        for arg in cmd:
+            if arg.startswith(str(tmp_path)):
+                Path(arg).write_bytes(b'')
+
+    monkeypatch.setattr(cs.encode_scheduler, 'run', fake_run)
+    moments = [{"time_start": "0:10", "time_end": "0:20", "description": "one"}]
+    renditions = cs.clip_renditions("in.mp4", moments, ["vertical", "landscape", "blur"])
+    assert len(commands) == 1
+    paths = [Path(p) for layout in ("vertical", "landscape", "blur") for p in renditions[layout]]
+    assert len(set(paths)) == 3
+    assert all(p.exists() and Path(f"{p}.json").exists() for p in paths)
+
+
+def test_clip_renditions_drop_a_cut_from_every_layout_when_one_fails(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+    monkeypatch.setattr(cs, 'probe', lambda path: None)
+    monkeypatch.setattr(cs.settings, 'single_pass_max_gap_seconds', 60)
+
+    def broken_pass(build_cmd, **kwargs):
+        raise RuntimeError("single pass failed")
+
+    def fake_clip(video_path, start, end, output_path, layout="vertical", **kwargs):
+        if layout == "square" and start == 10:
+            raise RuntimeError("square cut failed")
+        Path(output_path).write_bytes(b'')
+
+    monkeypatch.setattr(cs.encode_scheduler, 'run', broken_pass)
+    monkeypatch.setattr(cs, 'clip_with_ffmpeg_optimized', fake_clip)
+    moments = [
+        {"time_start": "0:10", "time_end": "0:20", "description": "one"},
+        {"time_start": "0:30", "time_end": "0:40", "description": "two"},
+    ]
+    renditions = cs.clip_renditions("in.mp4", moments, ["vertical", "square"])
+    assert {layout: len(paths) for layout, paths in renditions.items()} == {"vertical": 1, "square": 1}
+    records = [json.loads(Path(f"{paths[0]}.json").read_text()) for paths in renditions.values()]
+    assert {record["index"] for record in records} == {2}
+
+
+def test_crop_layout_follows_each_clips_path(tmp_path):
+    path = CropPath(times=np.array([0.0, 2.0]), centers=np.array([0.25, 0.75]))
+    cmd = cs.build_clip_command("in.mp4", 10.0, 12.0, tmp_path / "out.mp4", keyframes=[0.0, 8.0], threads=2,
+                                layout="crop", crop_path=path)
+    video_filter = cmd[cmd.index("-vf") + 1]
+    # The clip starts 2s after the input seek point
+    assert video_filter.startswith("crop=") and "clip(t-2.000,0,2.000)" in video_filter
+    assert video_filter.endswith("scale=1080:1920,setsar=1")
+
+    cuts = [(10.0, 12.0, [tmp_path / "a.mp4"]), (30.0, 32.0, [tmp_path / "b.mp4"])]
+    cmd = cs.build_rendition_command("in.mp4", cuts, ["crop"], keyframes=[0.0, 8.0], threads=2,
+                                     crop_paths=[path, None])
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    # Cropped after the trim, where every clip restarts at t=0
+    assert "[l0]null,split=2" in graph
+    assert "setpts=PTS-STARTPTS,crop=" in graph and "clip(t-0.000,0,2.000)" in graph
+    assert "x='clip(iw*(0.5)-ow/2,0,iw-ow)'" in graph
+
+
+def test_build_preview_command_samples_each_clip_once(tmp_path):
+    items = [
+        (10.0, 20.0, "blur", None, tmp_path / "a.thumb.jpg", tmp_path / "a.sprite.jpg"),
+        (30.0, 35.0, "blur", None, tmp_path / "b.thumb.jpg", tmp_path / "b.sprite.jpg"),
+        (900.0, 910.0, "source", None, tmp_path / "c.thumb.jpg", tmp_path / "c.sprite.jpg"),
+    ]
+    cmd = cs.build_preview_command("in.mp4", items, keyframes=[0.0, 8.0, 896.0], threads=2)
+    # The distant clip gets its own seeked input instead of decoding the gap
+    assert cmd.count("-i") == 2
+    assert cmd[cmd.index("-ss") + 1] == "8.000" and "896.000" in cmd
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "[0:v]select='between(t,2.000,12.000)+between(t,22.000,27.000)',split=2[p0][p1]" in graph
+    # 25 tiles over 10s and 5s, sampled before the layout is applied
+    assert "setpts=PTS-STARTPTS,fps=2.500000,split[bg0][fg0]" in graph
+    assert "fps=5.000000,split[bg1][fg1]" in graph
+    assert graph.count("tile=5x5") == 3 and graph.count("thumbnail=25") == 3
+    outputs = [arg for arg in cmd if arg.startswith(str(tmp_path))]
+    assert outputs == [str(p) for *_, thumb, sprite in items for p in (thumb, sprite)]
+
+
+def test_generate_previews_is_cached_next_to_clips(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+    monkeypatch.setattr(cs, 'probe', lambda path: None)
+    commands = []
+
+    def fake_run(build_cmd, priority="interactive", label="", **kwargs):
+        cmd = build_cmd(2)
+        commands.append(cmd)
+        for arg in cmd:
+            if arg.startswith(str(tmp_path)) and arg.endswith(".jpg"):
+                Path(arg).write_bytes(b'')
+
+    clips = []
+    for name, start in [("a", 10.0), ("b", 40.0)]:
+        clip = tmp_path / f"{name}.mp4"
+        clip.write_bytes(b'')
+        cs._write_render_record(clip, "in.mp4", 1, start, start + 20.0, "", "vertical", "draft")
+        clips.append(str(clip))
+    monkeypatch.setattr(cs.encode_scheduler, 'run', fake_run)
+
+    previews = cs.generate_previews(clips + [str(tmp_path / "unknown.mp4")])
+    assert len(commands) == 1
+    assert sorted(previews) == clips
+    assert previews[clips[0]]["thumbnail"] == str(tmp_path / "a.thumb.jpg")
+    assert previews[clips[0]]["interval"] == 0.8
+    assert all(Path(p[key]).exists() for p in previews.values() for key in ("thumbnail", "sprite"))
+    assert not list(tmp_path.glob(".*.jpg"))
+
+    assert cs.generate_previews(clips) == previews
+    assert len(commands) == 1
+
+
+def test_compile_reel_copies_clips_and_encodes_only_transitions(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+    monkeypatch.setattr(cs, 'probe', lambda path: None)
+    clips_dir = tmp_path / 'clips'
+    clips_dir.mkdir()
+    clips = []
+    for name, start in [("a", 10.0), ("b", 40.0), ("c", 70.0)]:
+        clip = clips_dir / f"{name}.mp4"
+        clip.write_bytes(b'')
+        cs._write_render_record(clip, "in.mp4", 1, start, start + 20.0, "", "vertical", "draft")
+        clips.append(str(clip))
+    encoded, copied = [], []
+
+    def fake_run(build_cmd, priority="interactive", label="", **kwargs):
+        cmd = build_cmd(2)
+        encoded.append(cmd)
+        Path(cmd[-1]).write_bytes(b'')
+
+    def fake_ffmpeg(cmd, job_id=None):
+        copied.append(Path(cmd[cmd.index("-i") + 1]).read_text())
+        Path(cmd[-1]).write_bytes(b'reel')
+
+    monkeypatch.setattr(cs.encode_scheduler, 'run', fake_run)
+    monkeypatch.setattr(cs, '_run_ffmpeg', fake_ffmpeg)
+
+    reel = cs.compile_reel(clips, transition=0.5)
+    assert Path(reel).read_bytes() == b'reel' and Path(reel).parent == clips_dir
+    # Two joins, two transitions; each is encoded with the clips' profile
+    assert len(encoded) == 2
+    assert all(cmd[cmd.index("-preset") + 1] == "ultrafast" for cmd in encoded)
+    parts = [line.split("'")[1] for line in copied[0].splitlines()]
+    assert [Path(p).name for p in parts] == ["a.mp4", "transition1.mp4", "b.mp4", "transition2.mp4", "c.mp4"]
+    assert not list(clips_dir.glob(".reel-*"))
+
+    assert cs.compile_reel(clips, transition=0.5) == reel
+    assert cs.compile_reel(clips) != reel
+    assert len(encoded) == 2 and len(copied) == 2
+
+
+def test_compile_reel_rejects_mismatched_clips(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+    monkeypatch.setattr(cs, 'probe', lambda path: None)
+    clips_dir = tmp_path / 'clips'
+    clips_dir.mkdir()
+    clips = []
+    for name, profile in [("a", "draft"), ("b", "final")]:
+        clip = clips_dir / f"{name}.mp4"
+        clip.write_bytes(b'')
+        cs._write_render_record(clip, "in.mp4", 1, 0.0, 10.0, "", "vertical", profile)
+        clips.append(str(clip))
+    with pytest.raises(ValueError, match="different profiles"):
+        cs.compile_reel(clips)
+    with pytest.raises(ValueError, match="Not a generated clip"):
+        cs.compile_reel([clips[0], str(tmp_path / "elsewhere.mp4")])
+
+
+def test_compile_reel_checks_transitions_against_the_clips(monkeypatch, tmp_path):
+    monkeypatch.setattr(cs.settings, 'storage_dir', tmp_path)
+    monkeypatch.setattr(cs.settings, 'smart_render', True)
+    clips_dir = tmp_path / 'clips'
+    clips_dir.mkdir()
+
+    def make_clips(layout):
+        clips = []
+        for name in ("a", "b"):
+            clip = clips_dir / f"{name}-{layout}.mp4"
+            clip.write_bytes(b'')
+            cs._write_render_record(clip, "in.mp4", 1, 0.0, 10.0, "", layout, "final")
+            clips.append(str(clip))
+        return clips
+
+    def fake_run(build_cmd, priority="interactive", label="", **kwargs):
+        Path(build_cmd(2)[-1]).write_bytes(b'')
+
+    monkeypatch.setattr(cs.encode_scheduler, 'run', fake_run)
+    monkeypatch.setattr(cs, '_run_ffmpeg', lambda cmd, job_id=None: Path(cmd[-1]).write_bytes(b'reel'))
+    clip_stream = StreamInfo(index=0, codec_type="video", codec_name="h264", profile="High", pix_fmt="yuv420p",
+                             width=1080, height=1920, time_base="1/15360")
+    joint_stream = StreamInfo(**{**clip_stream.__dict__, "profile": "High 4:4:4 Predictive"})
+    monkeypatch.setattr(cs, 'probe', lambda path: MediaInfo(
+        duration=0.5, streams=(joint_stream if "transition" in Path(path).name else clip_stream,), fps=30.0,
+        rotation=0))
+
+    # Smart-rendered clips carry the source's parameters, which a transition can't be encoded to
+    with pytest.raises(ValueError, match="smart-rendered"):
+        cs.compile_reel(make_clips("source"), transition=0.5)
+    with pytest.raises(ValueError, match="Transition 1 doesn't match"):
+        cs.compile_reel(make_clips("vertical"), transition=0.5)
+    assert not list(clips_dir.glob("reel-*"))
@@ -0,0 +1,169 @@
+import sys
+import time
+import threading
+import subprocess
+import pytest
+from services.encode_scheduler import EncodeScheduler, EncodeQueueFull, EncodeTimeout
+from services.job_registry import JobCancelled, job_registry
+
+
+def python_cmd(code):
+    return lambda threads: [sys.executable, "-c", code]
+
+
+def test_threads_split_by_running_encodes():
+    sched = EncodeScheduler(core_budget=8, max_concurrent=4, max_queued=10)
+    assert sched.threads_for(1) == 8
+    assert sched.threads_for(3) == 2
+    assert sched.threads_for(16) == 1
+
+
+def test_threads_never_exceed_what_is_left():
+    sched = EncodeScheduler(core_budget=8, max_concurrent=4, max_queued=10)
+    # The first encode took every core; the second gets what is left, at least one
+    assert sched.threads_for(2, in_use=8) == 1
+    assert sched.threads_for(3, in_use=6) == 2
+    assert sched.threads_for(2, in_use=2) == 4
+
+
+def test_run_measures_encode():
+    sched = EncodeScheduler(core_budget=4, max_concurrent=2, max_queued=10)
+    seen = []
+
+    def build(threads):
+        seen.append(threads)
+        return [sys.executable, "-c", "sum(range(100000))"]
+
+    stats = sched.run(build, priority="batch", label="clip.mp4")
+    assert seen == [4]
+    assert stats.threads == 4 and stats.wall_seconds > 0
+    metrics = sched.metrics()
+    assert metrics["completed"] == 1 and metrics["running"] == 0 and metrics["threads_in_use"] == 0
+
+
+def test_failed_encode_raises_and_is_counted():
+    sched = EncodeScheduler(core_budget=2, max_concurrent=1, max_queued=10)
+    with pytest.raises(subprocess.CalledProcessError):
+        sched.run(python_cmd("import sys; sys.exit(3)"))
+    assert sched.metrics()["failed"] == 1
+
+
+def test_concurrency_limit_and_admission_control():
+    sched = EncodeScheduler(core_budget=2, max_concurrent=1, max_queued=1)
+    release = threading.Event()
+    started = threading.Event()
+    peak = []
+
+    def blocking(threads):
+        started.set()
+        release.wait(5)
+        peak.append(sched.metrics()["running"])
+        return [sys.executable, "-c", "pass"]
+
+    first = threading.Thread(target=sched.run, args=(blocking,))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=sched.run, args=(python_cmd("pass"), "batch"))
+    second.start()
+    # Wait until the second encode is queued, then the queue is full
+    for _ in range(100):
+        if sched.metrics()["queued"]["batch"] == 1:
+            break
+        threading.Event().wait(0.01)
+    with pytest.raises(EncodeQueueFull):
+        sched.run(python_cmd("pass"))
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert peak == [1]
+    metrics = sched.metrics()
+    assert metrics["completed"] == 2 and metrics["rejected"] == 1
+
+
+def fake_ffmpeg(tmp_path, blocks, sleep=0.0):
+    """An executable named ffmpeg that prints -progress blocks (checking it was asked to)."""
+    script = tmp_path / "ffmpeg"
+    lines = "".join(f"print({block!r}, flush=True); time.sleep({sleep})\n" for block in blocks)
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import sys, time\n"
+        "assert sys.argv[1:4] == ['-progress', 'pipe:1', '-nostats'], sys.argv\n"
+        + lines
+    )
+    script.chmod(0o755)
+    return str(script)
+
+
+def test_run_reports_ffmpeg_progress_to_job(tmp_path):
+    ffmpeg = fake_ffmpeg(tmp_path, [
+        "frame=30\nfps=30.0\nout_time_us=1000000\nspeed=1.0x\nprogress=continue",
+        "frame=60\nfps=30.0\nout_time_us=2000000\nspeed=1.0x\nprogress=end",
+    ])
+    sched = EncodeScheduler(core_budget=2, max_concurrent=1, max_queued=10)
+    with job_registry.track("progress-job") as job:
+        sched.run(lambda threads: [ffmpeg, "-i", "in.mp4", "out.mp4"], label="out.mp4",
+                  job_id="progress-job", duration=4.0)
+        [encode] = job.snapshot()["encodes"]
+    assert encode["state"] == "done" and encode["frame"] == 60 and encode["out_seconds"] == 2.0
+
+
+def test_cancel_kills_running_encode():
+    sched = EncodeScheduler(core_budget=2, max_concurrent=1, max_queued=10)
+    errors = []
+
+    def encode():
+        try:
+            sched.run(python_cmd("import time; time.sleep(30)"), job_id="cancel-job")
+        except JobCancelled as e:
+            errors.append(e.reason)
+
+    with job_registry.track("cancel-job") as job:
+        worker = threading.Thread(target=encode)
+        started = time.monotonic()
+        worker.start()
+        while sched.metrics()["running"] == 0:
+            time.sleep(0.01)
+        job_registry.cancel("cancel-job", "client disconnected")
+        worker.join(5)
+    assert time.monotonic() - started < 5
+    assert errors == ["client disconnected"]
+    assert job.encodes[0].state == "cancelled"
+    metrics = sched.metrics()
+    assert metrics["cancelled"] == 1 and metrics["failed"] == 0 and metrics["running"] == 0
+
+
+def test_cancel_drops_queued_encodes():
+    sched = EncodeScheduler(core_budget=2, max_concurrent=1, max_queued=10)
+    release = threading.Event()
+
+    def blocking(threads):
+        release.wait(5)
+        return [sys.executable, "-c", "pass"]
+
+    blocker = threading.Thread(target=sched.run, args=(blocking,))
+    blocker.start()
+    while sched.metrics()["running"] == 0:
+        time.sleep(0.01)
+    with job_registry.track("queued-job"):
+        job_registry.cancel("queued-job")
+        with pytest.raises(JobCancelled):
+            sched.run(python_cmd("pass"), job_id="queued-job")
+    release.set()
+    blocker.join(5)
+    assert sched.metrics()["queued"] == {"interactive": 0, "batch": 0}
+
+
+def test_timeout_kills_encode():
+    sched = EncodeScheduler(core_budget=2, max_concurrent=1, max_queued=10, timeout=0.2)
+    with pytest.raises(EncodeTimeout):
+        sched.run(python_cmd("import time; time.sleep(30)"))
+    assert sched.metrics()["failed"] == 1
+
+
+def test_stalled_ffmpeg_is_killed(tmp_path):
+    ffmpeg = fake_ffmpeg(tmp_path, ["frame=1\nout_time_us=40000\nprogress=continue"], sleep=30)
+    sched = EncodeScheduler(core_budget=2, max_concurrent=1, max_queued=10, stall_timeout=0.3)
+    started = time.monotonic()
+    with pytest.raises(EncodeTimeout, match="stalled"):
+        sched.run(lambda threads: [ffmpeg])
+    assert time.monotonic() - started < 5
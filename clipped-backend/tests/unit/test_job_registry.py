@@ -0,0 +1,71 @@
+import pytest
+from services.job_registry import EncodeProgress, JobCancelled, JobRegistry
+
+
+def test_progress_reports_percent_and_eta():
+    progress = EncodeProgress("clip.mp4", duration=20.0)
+    assert progress.percent == 0.0 and progress.eta_seconds is None
+    progress.start()
+    progress.update({"frame": "150", "fps": "75.0", "out_time_us": "5000000", "speed": "2.5x", "progress": "continue"})
+    assert progress.frame == 150 and progress.fps == 75.0
+    assert progress.percent == 25.0
+    # 15s of media left at 2.5x
+    assert progress.eta_seconds == pytest.approx(6.0)
+    # ffmpeg reports N/A before the first frame; known values are kept
+    progress.update({"fps": "0.00", "speed": "N/A", "out_time_us": "N/A"})
+    assert progress.speed == 2.5 and progress.out_seconds == 5.0
+    progress.finish("done")
+    assert progress.percent == 100.0 and progress.eta_seconds is None
+
+
+def test_track_records_outcome_and_cancel():
+    registry = JobRegistry()
+    with registry.track("a") as job:
+        assert registry.cancel("a", "client disconnected")
+        with pytest.raises(JobCancelled) as exc:
+            job.check()
+        assert exc.value.reason == "client disconnected"
+    assert registry.get("a").state == "cancelled"
+    # Finished jobs can't be cancelled again, but their id can be reused
+    assert not registry.cancel("a")
+    with registry.track("a"):
+        with pytest.raises(ValueError):
+            registry.start("a")
+    assert registry.get("a").state == "done"
+
+    with pytest.raises(RuntimeError):
+        with registry.track("b"):
+            raise RuntimeError("boom")
+    assert registry.get("b").state == "failed"
+
+
+def test_finished_jobs_are_bounded():
+    registry = JobRegistry(max_finished=2)
+    for job_id in "abc":
+        with registry.track(job_id):
+            pass
+    with registry.track("running"):
+        assert [job.job_id for job in registry.list()] == ["b", "c", "running"]
+
+
+def test_stage_timings_milestones_and_events():
+    registry = JobRegistry()
+    events = []
+    with registry.track("a") as job:
+        job.listener = events.append
+        with job.stage("analyze"):
+            job.begin_stage("clip")
+            job.milestone("first_clip")
+            first = job.milestones["first_clip"]
+            job.milestone("first_clip")
+        job.end_stage("clip")
+        job.end_stage("clip")
+    snapshot = registry.get("a").snapshot()
+    assert [s["name"] for s in snapshot["stages"]] == ["analyze", "clip"]
+    analyze, clip = snapshot["stages"]
+    # Clipping started before analysis finished: the stages overlap
+    assert clip["started_seconds"] <= analyze["finished_seconds"] <= clip["finished_seconds"]
+    assert snapshot["milestones"] == {"first_clip": first}
+    assert [(e["stage"], e["state"]) for e in events] == [
+        ("analyze", "started"), ("clip", "started"), ("analyze", "finished"), ("clip", "finished")
+    ]
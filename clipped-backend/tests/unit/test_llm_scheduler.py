@@ -0,0 +1,135 @@
+import threading
+import time
+import pytest
+from services.llm_scheduler import LLMScheduler, Reservation, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refill_and_wait():
+    clock = FakeClock()
+    bucket = TokenBucket(capacity=600, rate=10, clock=clock)
+    assert bucket.try_take(500) == 0.0
+    assert bucket.try_take(200) == pytest.approx(10.0)
+    clock.now = 10.0
+    assert bucket.try_take(200) == 0.0
+    # Oversized requests are clamped to the capacity instead of waiting forever
+    clock.now = 1000.0
+    assert bucket.try_take(10_000) == 0.0
+
+
+def test_token_bucket_adjust_and_drain():
+    clock = FakeClock()
+    bucket = TokenBucket(capacity=100, rate=1, clock=clock)
+    bucket.try_take(100)
+    bucket.adjust(40)
+    assert bucket.tokens == pytest.approx(40)
+    bucket.drain()
+    assert bucket.tokens == pytest.approx(0)
+
+
+def test_priority_and_round_robin_order():
+    clock = FakeClock()
+    sched = LLMScheduler(tokens_per_minute=600, batch_max_wait=60, clock=clock)
+    for seq, (job, prio) in enumerate([("a", "batch"), ("x", "interactive"), ("x", "interactive"), ("y", "interactive")]):
+        sched._enqueue(Reservation(job, prio, 10, clock(), seq))
+
+    order = []
+    while (head := sched._next()) is not None:
+        order.append((head.job_id, head.seq))
+        sched._dequeue(head)
+    # Interactive first, alternating jobs x/y, then batch
+    assert order == [("x", 1), ("y", 3), ("x", 2), ("a", 0)]
+
+
+def test_batch_is_promoted_after_max_wait():
+    clock = FakeClock()
+    sched = LLMScheduler(tokens_per_minute=600, batch_max_wait=30, clock=clock)
+    sched._enqueue(Reservation("b", "batch", 10, 0.0, 0))
+    clock.now = 31.0
+    sched._enqueue(Reservation("i", "interactive", 10, 31.0, 1))
+    assert sched._next().job_id == "b"
+
+
+def test_acquire_waits_for_refill_and_reports_metrics():
+    # 6000 tokens/min = 100 tokens/s
+    sched = LLMScheduler(tokens_per_minute=6000)
+    with sched.reserve(6000, "job") as first:
+        first.settle(5950)
+    started = time.monotonic()
+    sched.acquire(100, "job", "batch")
+    assert time.monotonic() - started >= 0.4
+
+    metrics = sched.metrics()
+    assert metrics["lanes"]["interactive"]["granted"] == 1
+    assert metrics["lanes"]["batch"]["granted"] == 1
+    assert metrics["lanes"]["batch"]["queue_depth"] == 0
+    with pytest.raises(ValueError):
+        sched.acquire(1, "job", "urgent")
+
+
+def test_concurrent_jobs_all_granted():
+    sched = LLMScheduler(tokens_per_minute=60_000)
+    granted = []
+
+    def worker(job):
+        for _ in range(5):
+            with sched.reserve(10, job):
+                granted.append(job)
+
+    threads = [threading.Thread(target=worker, args=(f"job{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    assert len(granted) == 20
+
+
+def test_waiters_wake_when_batch_is_promoted():
+    # 10 tokens/s; the batch call becomes head by waiting, which notifies nobody
+    sched = LLMScheduler(tokens_per_minute=600, batch_max_wait=0.3)
+    sched.acquire(600, "drain")
+    granted = []
+    threads = [threading.Thread(target=lambda p=p: granted.append(sched.acquire(5, p, p).priority), daemon=True)
+               for p in ("batch", "interactive")]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    for t in threads:
+        t.join(timeout=5)
+    assert sorted(granted) == ["batch", "interactive"]
+
+
+def test_retry_is_charged_once_and_goes_before_queued_calls():
+    sched = LLMScheduler(tokens_per_minute=6000)
+    reservation = sched.acquire(50, "job")
+    sched.report_rate_limited()
+    order = []
+
+    def retry():
+        sched.retry(reservation)
+        order.append("retry")
+
+    def other():
+        sched.acquire(50, "other-job")
+        order.append("other")
+
+    retrying = threading.Thread(target=retry, daemon=True)
+    retrying.start()
+    while not sched._retrying:
+        time.sleep(0.001)
+    queued = threading.Thread(target=other, daemon=True)
+    started = time.monotonic()
+    queued.start()
+    retrying.join(5)
+    # The refill pays for the retry alone; the queued call waits for the next one
+    assert order == ["retry"]
+    assert time.monotonic() - started < 0.9
+    queued.join(5)
+    assert order == ["retry", "other"]
+    assert time.monotonic() - started >= 0.9
@@ -0,0 +1,73 @@
+import os
+
+from services import manifest_service as ms
+
+
+def test_completed_node_is_reused_until_inputs_or_outputs_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(ms.settings, 'storage_dir', tmp_path)
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"frames")
+
+    manifest = ms.JobManifest.open("job", "https://youtu.be/x")
+    assert manifest.completed("download", {"url": "https://youtu.be/x"}) is None
+    manifest.record("download", {"url": "https://youtu.be/x"}, {"video": str(video)}, [video])
+    assert manifest.stages["download"]["reused"] is False
+
+    # A restarted or re-run job, under any id, finds the node
+    rerun = ms.JobManifest.open("other-job", "https://youtu.be/x")
+    assert rerun.completed("download", {"url": "https://youtu.be/x"}) == {"video": str(video)}
+    assert rerun.stages["download"]["reused"] is True
+    assert ms.JobManifest.open("other-job", "https://youtu.be/x").stages["download"]["reused"] is True
+    assert rerun.completed("download", {"url": "https://youtu.be/y"}) is None
+
+    # Changed output content invalidates the node
+    video.write_bytes(b"other frames")
+    os.utime(video, ns=(1, 1))
+    assert rerun.completed("download", {"url": "https://youtu.be/x"}) is None
+    video.unlink()
+    assert rerun.completed("download", {"url": "https://youtu.be/x"}) is None
+
+    # A job manifest for another URL is not resumed
+    assert ms.JobManifest.open("job", "https://youtu.be/y").stages == {}
+
+
+def test_node_artifacts_outlive_their_inputs(tmp_path, monkeypatch):
+    monkeypatch.setattr(ms.settings, 'storage_dir', tmp_path)
+    transcript = tmp_path / "transcripts" / "t.txt"
+    transcript.parent.mkdir()
+    transcript.write_text("[0:01] hello")
+
+    manifest = ms.JobManifest("job", "https://youtu.be/x")
+    kept = manifest.keep("transcribe", {"video": "abc"}, transcript)
+    moments = manifest.write_json("analyze", {"transcript": "def", "analysis": "v1"}, [{"time_start": "0:01"}])
+    transcript.unlink()
+    assert kept.read_text() == "[0:01] hello"
+    assert kept.suffix == ".txt" and kept.parent == tmp_path / "artifacts" / "transcribe"
+    # Another prompt (analysis fingerprint) is another node
+    assert moments != manifest.artifact_path("analyze", {"transcript": "def", "analysis": "v2"}, ".json")
+
+
+def test_only_resumable_jobs_keep_a_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(ms.settings, 'storage_dir', tmp_path)
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"frames")
+
+    anonymous = ms.JobManifest.open("generated", "https://youtu.be/x", resumable=False)
+    anonymous.record("download", {"url": "https://youtu.be/x"}, {"video": str(video)}, [video])
+    assert anonymous.stages["download"]["reused"] is False
+    assert not (tmp_path / "jobs").exists()
+
+    named = ms.JobManifest.open("named", "https://youtu.be/x")
+    assert named.completed("download", {"url": "https://youtu.be/x"}) == {"video": str(video)}
+    assert named.path.exists()
+    named.discard()
+    assert not named.path.parent.exists()
+
+
+def test_prune_jobs_removes_stale_manifests(tmp_path, monkeypatch):
+    monkeypatch.setattr(ms.settings, 'storage_dir', tmp_path)
+    for job_id in ("stale", "recent"):
+        ms.JobManifest(job_id, "https://youtu.be/x").record("analyze", {"job": job_id}, {})
+    os.utime(tmp_path / "jobs" / "stale" / "manifest.json", (0, 0))
+    ms.prune_jobs(3600)
+    assert sorted(p.name for p in (tmp_path / "jobs").iterdir()) == ["recent"]
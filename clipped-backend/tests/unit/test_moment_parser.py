@@ -0,0 +1,47 @@
+import json
+from services.moment_parser import MomentStreamParser, parse_moments_json
+
+MOMENTS = [
+    {"time_start": "0:10", "time_end": "0:40", "description": "a {brace} and \"quote\""},
+    {"time_start": "1:00", "time_end": "1:30", "description": "b ] bracket"},
+]
+
+
+def feed_in_pieces(parser, text, size):
+    emitted = []
+    for i in range(0, len(text), size):
+        emitted.append(parser.feed(text[i:i + size]))
+    return emitted
+
+
+def test_moments_emitted_as_soon_as_complete():
+    text = json.dumps({"viral_moments": MOMENTS})
+    first_end = text.index("}, {") + 1
+    parser = MomentStreamParser()
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [MOMENTS[0]]
+    assert parser.feed(text[first_end:]) == [MOMENTS[1]]
+    assert parser.done
+    assert parser.emitted == 2
+
+
+def test_reasoning_and_fences_are_skipped():
+    reply = (
+        "<think>maybe {\"viral_moments\": [{\"time_start\": \"9:99\"}]} is wrong</think>\n"
+        "```json\n" + json.dumps({"viral_moments": MOMENTS}) + "\n```"
+    )
+    for size in (1, 3, 50):
+        parser = MomentStreamParser()
+        emitted = [m for batch in feed_in_pieces(parser, reply, size) for m in batch]
+        assert emitted == MOMENTS
+
+
+def test_malformed_entry_is_skipped():
+    parser = MomentStreamParser()
+    out = parser.feed('{"viral_moments": [{"time_start": 1,}, {"time_start": "0:01"}]}')
+    assert out == [{"time_start": "0:01"}]
+
+
+def test_parse_moments_json_fallback():
+    assert parse_moments_json("```json\n" + json.dumps({"viral_moments": MOMENTS}) + "\n```") == MOMENTS
+    assert parse_moments_json("no json here") == []
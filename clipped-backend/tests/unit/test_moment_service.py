@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import services.moment_service as ms
+from services.segment_index import SegmentIndex
+
+
+def m(start, end, score=None, desc="d"):
+    moment = {"time_start": start, "time_end": end, "description": desc}
+    if score is not None:
+        moment["score"] = score
+    return moment
+
+
+def test_format_time_round_trips():
+    assert ms.format_time(65) == "1:05"
+    assert ms.format_time(65.5) == "1:05.50"
+    assert ms.moment_bounds(m(ms.format_time(3725.25), "0:00"))[0] == pytest.approx(3725.25)
+
+
+def test_iou():
+    assert ms.iou((0, 10), (5, 15)) == pytest.approx(5 / 15)
+    assert ms.iou((0, 10), (10, 20)) == 0.0
+
+
+def test_bounds_are_validated_and_clamped():
+    moments = [m("0:10", "0:40"), m("bad", "0:10"), m("0:50", "0:40"), m("1:50", "2:30"), m("2:10", "2:40")]
+    resolved = ms.resolve_moments(moments, duration=120.0, merge_iou=0.5, merge_gap=0.0, max_clips=0)
+    assert [(r["time_start"], r["time_end"]) for r in resolved] == [("0:10", "0:40"), ("1:50", "2:00")]
+
+
+def test_overlapping_and_adjacent_moments_merge():
+    moments = [m("0:30", "1:00", 5, "b"), m("0:00", "0:31", 7, "a"), m("0:32", "0:58", 3, "c"), m("3:00", "3:20")]
+    resolved = ms.resolve_moments(moments, merge_iou=0.5, merge_gap=1.0, max_clips=0)
+    assert [(r["time_start"], r["time_end"]) for r in resolved] == [("0:00", "1:00"), ("3:00", "3:20")]
+    assert resolved[0]["score"] == 7
+    assert resolved[0]["description"].startswith("a")
+
+
+def test_overlap_too_long_to_merge_keeps_best():
+    moments = [m("0:00", "2:00", 4), m("0:20", "2:40", 9)]
+    resolved = ms.resolve_moments(moments, merge_iou=0.5, merge_gap=0.0, max_clips=0)
+    assert len(resolved) == 1 and resolved[0]["score"] == 9
+
+
+def test_cap_keeps_top_scores_in_time_order():
+    moments = [m(f"{i}:00", f"{i}:30", score) for i, score in enumerate([1, 9, 3, 8])]
+    resolved = ms.resolve_moments(moments, max_clips=2)
+    assert [r["time_start"] for r in resolved] == ["1:00", "3:00"]
+
+
+def test_moment_gate_drops_duplicates_and_caps():
+    gate = ms.MomentGate(duration=100.0, merge_iou=0.5, max_clips=2)
+    assert gate.admit(m("0:00", "0:30")) is not None
+    assert gate.admit(m("0:02", "0:30")) is None
+    assert gate.admit(m("2:00", "2:30")) is None
+    assert gate.admit(m("0:40", "1:00"))["time_end"] == "1:00"
+    assert gate.admit(m("1:20", "1:30")) is None
+
+
+def speech_source():
+    """20s at 100 ms: silence, speech 2-8s, silence, applause 10-13s, speech 13-20s."""
+    rng = np.random.default_rng(0)
+    energy = np.full(200, 0.001) * rng.uniform(0.5, 1.5, 200)
+    energy[20:80] = 0.3 * rng.uniform(0.5, 1.5, 60)
+    energy[100:130] = 0.3
+    energy[130:200] = 0.3 * rng.uniform(0.5, 1.5, 70)
+    # A short breath inside the speech is not dead air
+    energy[50:52] = 0.001
+    index = SegmentIndex([
+        (2.0, "so this is the part of the talk where everything we built finally pays off, right here"),
+        (10.0, "[Applause]"),
+        (13.0, "thank you, thank you all so much, and now for the part you have really been waiting for"),
+    ], duration=20.0)
+    return energy, index
+
+
+def test_dead_air_is_trimmed_to_speech():
+    energy, index = speech_source()
+    trimmer = ms.DeadAirTrimmer(energy, index, max_trim=5.0, min_trim=0.5, pad=0.25)
+    trimmed = trimmer.trim(m("0:00", "0:10"))
+    start, end = ms.moment_bounds(trimmed)
+    assert start == pytest.approx(1.75, abs=0.05)
+    assert end == pytest.approx(8.25, abs=0.05)
+    # Applause is loud but has no words: the clip starts where speech resumes
+    start, end = ms.moment_bounds(trimmer.trim(m("0:09", "0:20")))
+    assert 12.0 <= start <= 13.0 and end == 20.0
+
+
+def test_dead_air_trim_is_bounded():
+    energy, index = speech_source()
+    trimmer = ms.DeadAirTrimmer(energy, index, max_trim=1.0, min_trim=0.5, pad=0.25)
+    assert ms.moment_bounds(trimmer.trim(m("0:00", "0:10")))[0] == pytest.approx(1.0)
+    # Edges already at the speech, and windows without speech, are left alone
+    unchanged = [m("0:02", "0:08"), m("0:08.30", "0:09.80")]
+    assert [trimmer.trim(moment) for moment in unchanged] == unchanged
+    # Without a transcript the energy alone decides
+    energy_only = ms.DeadAirTrimmer(energy, None, max_trim=5.0, min_trim=0.5, pad=0.25)
+    assert ms.moment_bounds(energy_only.trim(m("0:09", "0:20")))[0] == pytest.approx(9.75, abs=0.05)
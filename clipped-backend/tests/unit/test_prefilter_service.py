@@ -0,0 +1,58 @@
+import numpy as np
+import services.prefilter_service as pf
+import services.audio_service as aus
+from services.segment_index import SegmentIndex
+
+
+def make_index():
+    # Quiet filler everywhere except a dense, reactive stretch at 120-150s
+    entries = [(float(t), "so anyway") for t in range(0, 300, 5)]
+    entries += [(float(t) + 0.5, "no way he did that [laughter] hahaha!") for t in range(120, 150, 2)]
+    return SegmentIndex(entries, duration=300.0)
+
+
+def test_score_windows_ranks_reactive_window_first():
+    starts, scores = pf.score_windows(make_index(), window=30.0)
+    assert len(starts) == 10
+    assert starts[int(np.argmax(scores))] == 120.0
+
+
+def test_select_regions_pads_and_merges():
+    regions = pf.select_regions(make_index(), keep_ratio=0.1, window=30.0, context=15.0)
+    assert regions == [(105.0, 165.0)]
+
+
+def test_prefilter_passthrough_when_disabled(monkeypatch):
+    monkeypatch.setattr(pf.settings, "prefilter_min_chars", 0)
+    text = "Video: v\n{\n}\n"
+    assert pf.prefilter_transcript(text, make_index(), keep_ratio=1.0) is text
+
+
+def test_prefilter_reduces_text(monkeypatch):
+    monkeypatch.setattr(pf.settings, "prefilter_min_chars", 0)
+    monkeypatch.setattr(pf.settings, "prefilter_window_seconds", 30.0)
+    monkeypatch.setattr(pf.settings, "prefilter_context_seconds", 0.0)
+    index = make_index()
+    full = pf.build_candidate_text("Video: v\n", index, [(0.0, 300.0)])
+    reduced = pf.prefilter_transcript(full, index, keep_ratio=0.1)
+    assert pf.estimate_tokens(reduced) < pf.estimate_tokens(full)
+    assert '"120.50"' in reduced
+    assert '"5.00"' not in reduced
+    assert reduced.startswith("Video: v")
+
+
+def test_energy_envelope_is_cached(monkeypatch, tmp_path):
+    media = tmp_path / "video.mp4"
+    media.write_bytes(b"data")
+    calls = []
+
+    def fake_compute(path, hop):
+        calls.append(path)
+        return np.ones(5, dtype=np.float32)
+
+    monkeypatch.setattr(aus, "_compute_envelope", fake_compute)
+    first = aus.get_energy_envelope(media)
+    second = aus.get_energy_envelope(media)
+    assert len(calls) == 1
+    assert np.array_equal(first, second)
+    assert aus.get_energy_envelope(tmp_path / "missing.mp4") is None
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import services.probe_service as ps
+
+FFPROBE_OUTPUT = {
+    "format": {"duration": "12.500000"},
+    "streams": [
+        {
+            "index": 0, "codec_type": "video", "codec_name": "h264", "profile": "High",
+            "pix_fmt": "yuv420p", "width": 1920, "height": 1080, "time_base": "1/15360",
+            "avg_frame_rate": "30000/1001", "side_data_list": [{"side_data_type": "Display Matrix", "rotation": -90}],
+        },
+        {"index": 1, "codec_type": "audio", "codec_name": "aac", "sample_rate": "44100", "channels": 2},
+    ],
+}
+
+# -select_streams v:0 -skip_frame nokey: only the video stream's keyframes are listed
+KEYFRAME_OUTPUT = {
+    "frames": [
+        {"pts_time": "2.002000"},
+        {"pts_time": "0.000000"},
+        {"best_effort_timestamp_time": "4.004000"},
+    ],
+}
+
+
+def test_parse_probe():
+    info = ps.parse_probe(FFPROBE_OUTPUT)
+    assert info.duration == 12.5
+    assert info.video.codec_name == "h264"
+    assert info.audio.sample_rate == 44100
+    assert info.has_audio
+    assert abs(info.fps - 29.97) < 0.01
+    assert info.rotation == 90
+    assert info.resolution == (1080, 1920)
+
+
+def test_parse_keyframes():
+    assert ps.parse_keyframes(KEYFRAME_OUTPUT).tolist() == [0.0, 2.002, 4.004]
+    assert ps.parse_keyframes({}).size == 0
+
+
+def test_parse_probe_without_audio_or_format_duration():
+    data = {"streams": [{"index": 0, "codec_type": "video", "codec_name": "h264", "duration": "3.0"}]}
+    info = ps.parse_probe(data)
+    assert info.duration == 3.0
+    assert not info.has_audio
+    assert info.rotation == 0
+
+
+def test_probe_runs_ffprobe_once_and_persists_sidecar(monkeypatch, tmp_path):
+    media = tmp_path / "video.mp4"
+    media.write_bytes(b'data')
+    calls = []
+
+    def fake_ffprobe(path):
+        calls.append(path)
+        return FFPROBE_OUTPUT
+
+    monkeypatch.setattr(ps, '_run_ffprobe', fake_ffprobe)
+    monkeypatch.setattr(ps, '_probe_cache', OrderedDict())
+    info = ps.probe(media)
+    assert ps.probe(media) is info
+    assert (tmp_path / "video.mp4.probe.npz").exists()
+
+    # A new process (empty memory cache) reads the sidecar instead of probing
+    monkeypatch.setattr(ps, '_probe_cache', OrderedDict())
+    reloaded = ps.probe(media)
+    assert len(calls) == 1
+    assert reloaded.streams == info.streams
+    assert reloaded.rotation == 90
+    assert ps.get_duration(media) == 12.5
+
+
+def test_keyframes_are_probed_only_when_asked(monkeypatch, tmp_path):
+    media = tmp_path / "video.mp4"
+    media.write_bytes(b'data')
+    calls = []
+
+    def fake_keyframe_probe(path):
+        calls.append(path)
+        return KEYFRAME_OUTPUT
+
+    monkeypatch.setattr(ps, '_run_ffprobe', lambda path: FFPROBE_OUTPUT)
+    monkeypatch.setattr(ps, '_run_keyframe_probe', fake_keyframe_probe)
+    monkeypatch.setattr(ps, '_probe_cache', OrderedDict())
+    monkeypatch.setattr(ps, '_keyframe_cache', OrderedDict())
+    ps.probe(media)
+    assert calls == []
+
+    keyframes = ps.get_keyframes(media)
+    assert keyframes.tolist() == [0.0, 2.002, 4.004]
+    assert ps.get_keyframes(media) is keyframes
+    # A new process reads the sidecar instead of probing again
+    monkeypatch.setattr(ps, '_keyframe_cache', OrderedDict())
+    assert np.array_equal(ps.get_keyframes(media), keyframes)
+    assert len(calls) == 1
+
+
+def test_probe_cache_keeps_the_most_recently_used(monkeypatch, tmp_path):
+    monkeypatch.setattr(ps, '_run_ffprobe', lambda path: FFPROBE_OUTPUT)
+    monkeypatch.setattr(ps, '_probe_cache', OrderedDict())
+    monkeypatch.setattr(ps, 'PROBE_CACHE_ENTRIES', 2)
+    media = []
+    for name in ("a", "b", "c"):
+        media.append(tmp_path / f"{name}.mp4")
+        media[-1].write_bytes(b'data')
+    ps.probe(media[0])
+    ps.probe(media[1])
+    ps.probe(media[0])
+    ps.probe(media[2])
+    assert [Path(key[0]).name for key in ps._probe_cache] == ["a.mp4", "c.mp4"]
+    # Sidecars are written whole, leaving no temp files behind
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name.endswith(".npz")) == [
+        "a.mp4.probe.npz", "b.mp4.probe.npz", "c.mp4.probe.npz"]
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith(".")]
+
+
+def test_probe_missing_file(tmp_path):
+    assert ps.probe(tmp_path / "missing.mp4") is None
+    assert ps.get_duration(tmp_path / "missing.mp4") is None
+    assert ps.get_keyframes(tmp_path / "missing.mp4") is None
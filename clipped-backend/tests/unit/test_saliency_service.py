@@ -0,0 +1,73 @@
+import re
+
+import numpy as np
+import pytest
+
+import services.saliency_service as ss
+
+
+def moving_box(n=40, start=20, step=2):
+    """Dark frames with a bright box moving `step` px to the right per frame."""
+    frames = np.zeros((n, ss.ANALYSIS_HEIGHT, ss.ANALYSIS_WIDTH), dtype=np.uint8)
+    for i in range(n):
+        x = start + step * i
+        frames[i, 40:60, x:x + 10] = 255
+    return frames
+
+
+def evaluate(expression, t):
+    """Evaluate a CropPath expression the way ffmpeg would."""
+    python = re.sub(r"\bt\b", repr(t), expression).replace("clip(", "_clip(")
+    return eval(python, {"_clip": lambda x, lo, hi: min(max(x, lo), hi)})
+
+
+def test_subject_centers_track_motion():
+    frames = moving_box()
+    centers = ss.subject_centers(frames)
+    expected = (20 + 2 * np.arange(40) + 5) / ss.ANALYSIS_WIDTH
+    # The centre prior pulls slightly towards the middle, never past the box
+    assert np.all(np.abs(centers - expected) < 0.05)
+    assert np.all(np.diff(centers) > 0)
+
+    static = np.full((5, ss.ANALYSIS_HEIGHT, ss.ANALYSIS_WIDTH), 80, dtype=np.uint8)
+    assert ss.subject_centers(static) == pytest.approx(0.5, abs=1e-3)
+
+
+def test_smooth_path_drops_jumps_and_holds_small_drift():
+    centers = np.full(20, 0.3)
+    centers[7] = 0.9
+    smoothed = ss.smooth_path(centers, fps=4, sigma_seconds=1.0)
+    assert np.allclose(smoothed, 0.3)
+
+    jitter = 0.5 + 0.01 * np.sin(np.arange(40))
+    assert np.ptp(ss.smooth_path(jitter, fps=4, sigma_seconds=1.0)) == 0
+
+
+def test_expression_interpolates_knots():
+    path = ss.CropPath(times=np.array([0.0, 1.0, 2.0, 2.5]), centers=np.array([0.2, 0.6, 0.6, 0.4]))
+    expression = path.expression(offset=3.0)
+    assert "if(" not in expression
+    for t, center in [(0.0, 0.2), (3.0, 0.2), (3.5, 0.4), (4.5, 0.6), (5.25, 0.5), (9.0, 0.4)]:
+        assert evaluate(expression, t) == pytest.approx(center, abs=1e-3)
+
+
+def test_crop_paths_are_cached_per_moment(monkeypatch, tmp_path):
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    calls = []
+
+    def fake_decode(media_path, start, end, fps, priority, job_id):
+        calls.append((start, end))
+        return moving_box(n=int((end - start) * fps))
+
+    monkeypatch.setattr(ss, "_decode_frames", fake_decode)
+    first = ss.get_crop_path(source, 10.0, 20.0)
+    assert first.times[0] == 0.0 and first.times[-1] == pytest.approx(10.0)
+    assert first.centers[-1] > first.centers[0]
+    again = ss.get_crop_path(source, 10.0, 20.0)
+    np.testing.assert_array_equal(again.centers, first.centers)
+    ss.get_crop_path(source, 10.0, 15.0)
+    assert calls == [(10.0, 20.0), (10.0, 15.0)]
+
+    monkeypatch.setattr(ss, "_decode_frames", lambda *args: np.zeros((0, 90, 160), dtype=np.uint8))
+    assert ss.get_crop_path(source, 30.0, 40.0) is None
@@ -0,0 +1,37 @@
+from services.segment_index import SegmentIndex
+
+
+def make_index(duration=None):
+    entries = [(30.0, "c"), (0.0, "a"), (15.0, "b"), (45.0, "d")]
+    return SegmentIndex(entries, duration)
+
+
+def test_segments_are_sorted_with_ends():
+    idx = make_index(duration=60.0)
+    assert idx.starts.tolist() == [0.0, 15.0, 30.0, 45.0]
+    assert idx.ends.tolist() == [15.0, 30.0, 45.0, 60.0]
+    assert idx.texts == ["a", "b", "c", "d"]
+    assert idx.duration == 60.0
+
+
+def test_duration_falls_back_to_last_segment():
+    idx = make_index()
+    assert idx.duration == 45.0
+    assert len(SegmentIndex([])) == 0
+    assert SegmentIndex([]).duration == 0.0
+
+
+def test_subtitles_inclusive_bounds():
+    idx = make_index()
+    subs = idx.subtitles(15.0, 30.0)
+    assert [s["text"] for s in subs] == ["b", "c"]
+    assert idx.subtitles(16.0, 29.0) == []
+    assert idx.subtitles(50.0, 10.0) == []
+
+
+def test_subtitles_for_matches_scalar_lookup():
+    idx = make_index()
+    ranges = [(0.0, 15.0), (10.0, 50.0), (46.0, 90.0)]
+    batched = idx.subtitles_for(ranges)
+    assert batched == [idx.subtitles(s, e) for s, e in ranges]
+    assert idx.subtitles_for([]) == []
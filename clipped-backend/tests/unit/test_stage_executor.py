@@ -0,0 +1,129 @@
+import asyncio
+import threading
+
+import pytest
+
+from services.job_registry import JobCancelled, job_registry
+from services.stage_executor import StageBusy, StageExecutor
+
+
+def test_full_stage_rejects_at_once():
+    stage = StageExecutor("test", workers=1, max_queued=1)
+    release = threading.Event()
+    try:
+        running = stage.submit(release.wait)
+        queued = stage.submit(lambda: "queued")
+        with pytest.raises(StageBusy) as exc:
+            stage.submit(lambda: "rejected")
+        assert exc.value.stage == "test"
+        metrics = stage.metrics()
+        assert (metrics["running"], metrics["queued"], metrics["rejected"]) == (1, 1, 1)
+        assert metrics["utilization"] == 1.0
+
+        release.set()
+        running.result(timeout=5)
+        assert queued.result(timeout=5) == "queued"
+        assert stage.submit(lambda: "admitted").result(timeout=5) == "admitted"
+        metrics = stage.metrics()
+        assert (metrics["running"], metrics["queued"], metrics["completed"]) == (0, 0, 3)
+    finally:
+        release.set()
+        stage.shutdown()
+
+
+def test_cancelled_queued_call_frees_its_place():
+    stage = StageExecutor("test", workers=1, max_queued=1)
+    release = threading.Event()
+    try:
+        stage.submit(release.wait)
+        queued = stage.submit(lambda: "never")
+        assert queued.cancel()
+        assert stage.metrics()["queued"] == 0
+        stage.submit(lambda: "admitted")
+    finally:
+        release.set()
+        stage.shutdown()
+
+
+def test_run_keeps_the_event_loop_free():
+    stage = StageExecutor("test", workers=1, max_queued=0)
+    release = threading.Event()
+
+    async def main():
+        work = asyncio.create_task(stage.run(release.wait, 5))
+        # The loop keeps serving while the stage works
+        await asyncio.sleep(0.05)
+        assert not work.done()
+        release.set()
+        return await work
+
+    try:
+        assert asyncio.run(main()) is True
+        assert stage.metrics()["failed"] == 0
+    finally:
+        stage.shutdown()
+
+
+def test_enqueue_waits_for_a_place_instead_of_refusing():
+    stage = StageExecutor("test", workers=1, max_queued=0)
+    release = threading.Event()
+
+    async def main():
+        stage.submit(release.wait)
+        held = asyncio.create_task(stage.enqueue(lambda: "admitted"))
+        await asyncio.sleep(0.05)
+        metrics = stage.metrics()
+        assert not held.done()
+        assert (metrics["waiting"], metrics["rejected"]) == (1, 0)
+        release.set()
+        return await held
+
+    try:
+        assert asyncio.run(main()) == "admitted"
+        assert stage.metrics()["waiting"] == 0
+    finally:
+        release.set()
+        stage.shutdown()
+
+
+def test_enqueued_work_of_a_cancelled_job_never_runs():
+    stage = StageExecutor("test", workers=1, max_queued=1)
+    release = threading.Event()
+    ran = []
+
+    async def main():
+        stage.submit(release.wait)
+        # Admitted to the queue, then the job is cancelled before a worker is free
+        admitted = asyncio.create_task(stage.enqueue(ran.append, "admitted", job=job))
+        await asyncio.sleep(0.05)
+        # Still waiting for a queue place when the job is cancelled
+        waiting = asyncio.create_task(stage.enqueue(ran.append, "waiting", job=job))
+        await asyncio.sleep(0.05)
+        job.cancel("client disconnected")
+        release.set()
+        for task in (admitted, waiting):
+            with pytest.raises(JobCancelled):
+                await task
+
+    try:
+        with job_registry.track("stage-cancel") as job:
+            asyncio.run(main())
+        assert ran == []
+        metrics = stage.metrics()
+        assert (metrics["queued"], metrics["waiting"], metrics["running"]) == (0, 0, 0)
+    finally:
+        release.set()
+        stage.shutdown()
+
+
+def test_submit_waiting_blocks_for_a_place():
+    stage = StageExecutor("test", workers=1, max_queued=0)
+    release = threading.Event()
+    try:
+        stage.submit(release.wait)
+        threading.Timer(0.1, release.set).start()
+        assert stage.submit_waiting(lambda: "admitted").result(timeout=5) == "admitted"
+        assert stage.metrics()["rejected"] == 0
+    finally:
+        release.set()
+        stage.shutdown()